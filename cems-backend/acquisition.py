@@ -0,0 +1,250 @@
+"""
+Acquisition process
+
+รัน Modbus polling, decode, การเขียน InfluxDB, alarm และ compliance averaging
+ใน process แยกจาก API server แล้วส่ง sample ที่ decode แล้วผ่าน SampleRing
+(shared memory) ให้ API process อ่านไปแสดงผล งาน REST หนัก ๆ (export,
+history query) จึงไม่ทำให้เวลาการอ่านค่าคลาดเคลื่อน
+
+เปิดใช้ด้วย config.json:
+    "acquisition": {"mode": "process", "ring_capacity": 1024, "ring_slot_size": 16384}
+
+แล้วรัน `python acquisition.py` (หรือ `python main.py` ซึ่งจะเริ่ม process นี้ให้เอง)
+"""
+import asyncio
+import signal
+import time
+
+from database_influx import (
+    load_config, init_influx_database, close_influx_database,
+    save_sensor_data_to_influx, save_compliance_blocks_to_influx, save_system_alerts_to_influx
+)
+from modbus_planner import load_mapping
+from poll_scheduler import poll_scheduler
+from modbus_pool import modbus_pool
+from config_store import config_store, mapping_store
+from compliance_engine import compliance_engine
+from alarm_engine import alarm_engine
+from shared_ring import DEFAULT_NAME, RingOverflow, SampleRing
+import log_level
+
+
+def acquisition_settings(config):
+    """ค่า acquisition จาก config (mode: inline = poll ใน API process เหมือนเดิม)"""
+    settings = dict((config or {}).get("acquisition", {}))
+    settings.setdefault("mode", "inline")
+    settings.setdefault("ring_name", DEFAULT_NAME)
+    settings.setdefault("ring_capacity", 1024)
+    settings.setdefault("ring_slot_size", 16384)
+    return settings
+
+
+async def ingest(values, ts=None, device=None):
+    """บันทึก sample ลง InfluxDB แล้วประเมิน alarm และค่าเฉลี่ย compliance คืน list ของ alert"""
+    await save_sensor_data_to_influx(values, device, ts)
+    alarm_engine.configure(load_config())
+    alerts = alarm_engine.evaluate(values, ts)
+    if alerts:
+        await save_system_alerts_to_influx(alerts)
+    blocks = compliance_engine.process(values, ts)
+    if blocks:
+        await save_compliance_blocks_to_influx(blocks)
+    return alerts
+
+
+async def compliance_loop():
+    """ปิด block ค่าเฉลี่ยตามเวลาแม้ไม่มี sample เข้ามา"""
+    while True:
+        await asyncio.sleep(10)
+        blocks = compliance_engine.tick()
+        if blocks:
+            await save_compliance_blocks_to_influx(blocks)
+
+
+class RingPublisher:
+    """sink ของ poll_scheduler ใน acquisition process: ingest แล้วเขียนลง ring
+
+    sample ส่งพร้อมค่าที่คำนวณแล้ว (Corr/Rate และ alarm ที่ active) และ compliance
+    snapshot ทุก state_interval วินาที API process จึงไม่ต้องคำนวณซ้ำ
+    """
+
+    def __init__(self, ring, state_interval=1.0):
+        self.ring = ring
+        self.state_interval = state_interval
+        self.errors = 0
+        self._last_state = 0.0
+
+    def _write(self, message):
+        try:
+            self.ring.write(message)
+        except RingOverflow as e:
+            self.errors += 1
+            log_level.warning(f"⚠️ Sample not shared: {e}")
+
+    async def __call__(self, device_name, values):
+        ts = time.time()
+        alerts = await ingest(values, ts, device_name)
+        self._write({"kind": "sample", "device": device_name, "time": ts, "values": values,
+                     "derived": compliance_engine.latest, "active": alarm_engine.active()})
+        for alert in alerts:
+            self._write({"kind": "alert", "alert": alert})
+        now = time.monotonic()
+        if now - self._last_state >= self.state_interval:
+            self._last_state = now
+            self._write({"kind": "state", "compliance": compliance_engine.snapshot(),
+                         "compliance_stats": compliance_engine.stats(), "alarm_stats": alarm_engine.stats()})
+
+
+class AcquisitionMirror:
+    """ฝั่ง API process: ค่าที่ acquisition process คำนวณแล้ว ได้มาจาก ring (ไม่คำนวณซ้ำ)"""
+
+    def __init__(self):
+        self.derived = {}
+        self.active = []
+        self.compliance = None
+        self.compliance_stats = {}
+        self.alarm_stats = {}
+
+    def apply(self, message):
+        kind = message.get("kind")
+        if kind == "sample":
+            self.derived = message.get("derived", {})
+            self.active = message.get("active", [])
+        elif kind == "state":
+            self.compliance = message["compliance"]
+            self.compliance_stats = message.get("compliance_stats", {})
+            self.alarm_stats = message.get("alarm_stats", {})
+
+    def compliance_snapshot(self):
+        return self.compliance or {"time": time.time(), "reference_o2": None, "channels": {}}
+
+
+class RingConsumer:
+    """ฝั่ง API process: อ่าน ring แล้วส่งข้อความให้ handler
+
+    ถ้า ring ยังไม่มี (acquisition ยังไม่เริ่ม) หรือไม่มีข้อความใหม่นาน
+    stale_after วินาที (acquisition ถูกเริ่มใหม่และสร้าง ring ใหม่) จะ attach ใหม่
+    """
+
+    def __init__(self, name=DEFAULT_NAME, poll_interval=0.05, stale_after=30.0):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.ring = None
+        self.cursor = 0
+        self.attaches = 0
+        self.last_message = None
+        self._task = None
+
+    def _attach(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        try:
+            self.ring = SampleRing.attach(self.name)
+        except (FileNotFoundError, ValueError):
+            return False
+        # เริ่มอ่านจากข้อความล่าสุด ไม่ย้อนเล่นข้อมูลเก่าทั้ง ring
+        self.cursor = max(0, self.ring.head - 1)
+        self.attaches += 1
+        self.last_message = time.monotonic()
+        log_level.info(f"🔗 Attached to acquisition ring {self.name}")
+        return True
+
+    async def _run(self, handler):
+        while True:
+            if self.ring is None and not self._attach():
+                await asyncio.sleep(1.0)
+                continue
+            messages, self.cursor = self.ring.read_from(self.cursor, limit=256)
+            now = time.monotonic()
+            if messages:
+                self.last_message = now
+                for message in messages:
+                    try:
+                        handler(message)
+                    except Exception as e:
+                        log_level.error(f"❌ Ring message error: {e}")
+                continue
+            if now - self.last_message > self.stale_after:
+                self._attach()
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, handler):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(handler), name="ring-consumer")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def stats(self):
+        return {
+            "attached": self.ring is not None,
+            "attaches": self.attaches,
+            "cursor": self.cursor,
+            "ring": self.ring.stats() if self.ring else None,
+        }
+
+
+async def on_config_change(store):
+    await poll_scheduler.apply(load_config() or {}, load_mapping())
+    compliance_engine.configure(load_config())
+
+
+async def run():
+    config = load_config() or {}
+    settings = acquisition_settings(config)
+    ring = SampleRing.create(settings["ring_name"], settings["ring_capacity"], settings["ring_slot_size"])
+    log_level.info(f"🚀 Acquisition process started (ring {ring.shm.name}, {ring.capacity} x {ring.slot_size} bytes)")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: ใช้ KeyboardInterrupt / terminate แทน
+            pass
+
+    await init_influx_database()
+    compliance_engine.configure(config)
+    modbus_pool.configure(**config.get("connection", {}).get("pool", {}))
+    modbus_pool.start()
+    compliance_task = asyncio.create_task(compliance_loop())
+    poll_scheduler.add_sink(RingPublisher(ring))
+    await poll_scheduler.apply(config, load_mapping())
+    for store in (config_store, mapping_store):
+        store.on_change(on_config_change)
+        store.watch(config.get("config_watch_interval", 2.0))
+
+    try:
+        await stop.wait()
+    finally:
+        compliance_task.cancel()
+        await config_store.stop()
+        await mapping_store.stop()
+        await poll_scheduler.stop()
+        await modbus_pool.close_all()
+        await close_influx_database()
+        ring.close()
+        log_level.info("🛑 Acquisition process stopped")
+
+
+def main():
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import time
+
+from database_influx import get_alarm_thresholds
+
+
+class ThresholdRule:
+    """กฎ alarm ของพารามิเตอร์หนึ่งตัว พร้อมสถานะปัจจุบัน"""
+
+    __slots__ = ("parameter", "limit", "clear_below", "min_duration", "level", "kind",
+                 "active", "since", "value")
+
+    def __init__(self, parameter, limit, deadband=0.0, min_duration=0.0, level="warning", kind="threshold"):
+        self.parameter = parameter
+        self.limit = float(limit)
+        self.clear_below = self.limit - abs(float(deadband))
+        self.min_duration = float(min_duration)
+        self.level = level
+        self.kind = kind
+        self.active = False
+        # เวลาที่เริ่มเข้าเงื่อนไขเปลี่ยนสถานะ (None = ยังไม่เข้าเงื่อนไข)
+        self.since = None
+        self.value = None
+
+
+def compile_rules(config):
+    """สร้างตาราง ThresholdRule จาก config
+
+    limit มาจาก get_alarm_thresholds() ส่วน deadband/min_duration อ่านจาก
+    config.alarm (ค่า default และ override ต่อพารามิเตอร์ใน alarm.parameters)
+    deadband_pct คิดเป็น % ของ limit พารามิเตอร์ใน alarm.bits เป็น alarm bit
+    (ค่า != 0 คือ alarm)
+    """
+    config = config or {}
+    settings = config.get("alarm", {})
+    overrides = settings.get("parameters", {})
+    rules = []
+
+    def option(name, key, default):
+        return overrides.get(name, {}).get(key, settings.get(key, default))
+
+    for name, limit in get_alarm_thresholds(config).items():
+        try:
+            limit = float(limit)
+        except (TypeError, ValueError):
+            continue
+        deadband = option(name, "deadband", None)
+        if deadband is None:
+            deadband = abs(limit) * float(option(name, "deadband_pct", 2.0)) / 100
+        rules.append(ThresholdRule(
+            name, limit, deadband,
+            option(name, "min_duration", 30.0),
+            option(name, "level", "warning"),
+        ))
+    for name in settings.get("bits", []):
+        rules.append(ThresholdRule(
+            name, 0.5, 0.0,
+            option(name, "min_duration", 0.0),
+            option(name, "level", "critical"),
+            kind="alarm_bit",
+        ))
+    return rules
+
+
+class AlarmEngine:
+    """ประเมิน alarm ของทุกพารามิเตอร์ในรอบเดียว ด้วยตารางที่ compile ตาม config
+
+    alarm จะ raise เมื่อค่าเกิน limit ต่อเนื่องอย่างน้อย min_duration วินาที
+    และ clear เมื่อค่าต่ำกว่า limit - deadband ต่อเนื่องเท่ากัน ค่าที่แกว่งรอบ
+    limit จึงไม่ทำให้เกิด alert ซ้ำ ๆ
+    """
+
+    def __init__(self):
+        # {(kind, parameter): rule} พารามิเตอร์เดียวมีได้ทั้ง threshold และ alarm bit
+        self.rules = {}
+        self._by_parameter = {}
+        self._config = None
+        self.evaluations = 0
+        self.events = 0
+
+    def configure(self, config):
+        """compile ตารางใหม่เมื่อ config snapshot เปลี่ยน (คงสถานะ alarm ที่ยังมีกฎเดิม)"""
+        if config is self._config:
+            return
+        previous = self.rules
+        rules, by_parameter = {}, {}
+        for rule in compile_rules(config):
+            key = (rule.kind, rule.parameter)
+            old = previous.get(key)
+            if old is not None:
+                rule.active, rule.since, rule.value = old.active, old.since, old.value
+            rules[key] = rule
+            by_parameter.setdefault(rule.parameter, []).append(rule)
+        self.rules, self._by_parameter = rules, by_parameter
+        self._config = config
+
+    def evaluate(self, values, ts=None):
+        """ประเมินค่าชุดใหม่ คืน list ของ alert (raise/clear)"""
+        ts = time.time() if ts is None else ts
+        self.evaluations += 1
+        events = []
+        for name, value in values.items():
+            rules = self._by_parameter.get(name)
+            if rules is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            for rule in rules:
+                rule.value = value
+                if rule.active:
+                    crossing = value < rule.clear_below
+                else:
+                    crossing = value > rule.limit
+                if not crossing:
+                    rule.since = None
+                    continue
+                if rule.since is None:
+                    rule.since = ts
+                if ts - rule.since >= rule.min_duration:
+                    rule.active = not rule.active
+                    rule.since = None
+                    events.append(self._event(rule, ts))
+        self.events += len(events)
+        return events
+
+    def _event(self, rule, ts):
+        if rule.kind == "alarm_bit":
+            message = f"{rule.parameter} {'ON' if rule.active else 'OFF'}"
+        elif rule.active:
+            message = f"{rule.parameter} = {rule.value:g} exceeds {rule.limit:g}"
+        else:
+            message = f"{rule.parameter} = {rule.value:g} back below {rule.clear_below:g}"
+        return {
+            "time": ts,
+            "type": rule.kind,
+            "parameter": rule.parameter,
+            "state": "raised" if rule.active else "cleared",
+            "level": rule.level if rule.active else "info",
+            "message": message,
+            "value": rule.value,
+            "limit": rule.limit,
+        }
+
+    def active(self):
+        return [
+            {"parameter": r.parameter, "type": r.kind, "level": r.level, "value": r.value, "limit": r.limit}
+            for r in self.rules.values() if r.active
+        ]
+
+    def stats(self):
+        return {
+            "rules": len(self.rules),
+            "active": sum(1 for r in self.rules.values() if r.active),
+            "evaluations": self.evaluations,
+            "events": self.events,
+        }
+
+
+# Global instance
+alarm_engine = AlarmEngine()
@@ -0,0 +1,115 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def _key(alert):
+    return (alert["time"], alert.get("type", "general"), alert.get("message", ""))
+
+
+class AlertIndex:
+    """ดัชนี alert ในหน่วยความจำ เรียงตามเวลาและแยกตาม type
+
+    ใช้แทนการ query InfluxDB แบบ sort/limit ทุกครั้ง แบ่งหน้าด้วย cursor
+    before (epoch วินาที) และเก็บย้อนหลังไม่เกิน retention_days
+    """
+
+    def __init__(self, retention_days=30, max_entries=100000):
+        self.retention = retention_days * 86400
+        self.max_entries = max_entries
+        self.times = []
+        self.entries = []
+        self.by_type = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def add(self, alert):
+        ts = alert["time"]
+        with self._lock:
+            index = self.by_type.setdefault(alert.get("type", "general"), ([], []))
+            if self.times and ts < self.times[-1]:
+                # ข้อมูลย้อนหลังแทรกตามลำดับ (รายการของ type เป็นลำดับย่อยของรายการรวม)
+                i = bisect.bisect_right(self.times, ts)
+                self.times.insert(i, ts)
+                self.entries.insert(i, alert)
+                j = bisect.bisect_right(index[0], ts)
+                index[0].insert(j, ts)
+                index[1].insert(j, alert)
+            else:
+                self.times.append(ts)
+                self.entries.append(alert)
+                index[0].append(ts)
+                index[1].append(alert)
+            self._trim(time.time())
+
+    def load(self, alerts):
+        """รวม alert ย้อนหลังจำนวนมาก (เช่นจาก InfluxDB) เข้า index ในครั้งเดียว
+
+        เรียงครั้งเดียวแล้วสร้าง index ใหม่ ข้าม alert ที่มีอยู่แล้ว (เวลา/type/ข้อความเดียวกัน)
+        """
+        with self._lock:
+            known = {_key(alert) for alert in self.entries}
+            merged = self.entries + [alert for alert in alerts if _key(alert) not in known]
+            merged.sort(key=lambda alert: alert["time"])
+            self.entries = merged
+            self.times = [alert["time"] for alert in merged]
+            self._rebuild_types()
+            self._trim(time.time())
+            self.loaded = True
+
+    def _rebuild_types(self):
+        self.by_type = {}
+        for ts, alert in zip(self.times, self.entries):
+            index = self.by_type.setdefault(alert.get("type", "general"), ([], []))
+            index[0].append(ts)
+            index[1].append(alert)
+
+    def _trim(self, now):
+        cutoff = now - self.retention
+        drop = bisect.bisect_left(self.times, cutoff)
+        drop = max(drop, len(self.times) - self.max_entries)
+        if drop > 0:
+            # รายการที่ถูกตัดเป็นส่วนต้นของรายการแต่ละ type เสมอ
+            dropped = Counter(alert.get("type", "general") for alert in self.entries[:drop])
+            del self.times[:drop]
+            del self.entries[:drop]
+            for name, count in dropped.items():
+                index = self.by_type[name]
+                del index[0][:count]
+                del index[1][:count]
+                if not index[0]:
+                    del self.by_type[name]
+
+    def query(self, hours=24, limit=100, before=None, alert_type=None):
+        """alert ใหม่สุดก่อน ตั้งแต่ hours ชั่วโมงที่แล้ว (ใช้ before เพื่อดูหน้าถัดไป)"""
+        now = time.time()
+        start = now - float(hours) * 3600
+        with self._lock:
+            if alert_type is None:
+                times, entries = self.times, self.entries
+            else:
+                times, entries = self.by_type.get(alert_type, ([], []))
+            hi = len(times) if before is None else bisect.bisect_left(times, float(before))
+            lo = max(bisect.bisect_left(times, start), hi - int(limit))
+            page = entries[lo:hi]
+        page = list(reversed(page))
+        return {
+            "alerts": [
+                {**alert, "time": datetime.fromtimestamp(alert["time"], tz=timezone.utc).isoformat()}
+                for alert in page
+            ],
+            "next_before": page[-1]["time"] if len(page) == int(limit) else None,
+        }
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "types": {name: len(index[0]) for name, index in self.by_type.items()},
+            "loaded": self.loaded,
+        }
+
+
+# Global instance
+alert_index = AlertIndex()
@@ -0,0 +1,436 @@
+"""
+End-to-end ingest benchmark (offline)
+
+เริ่ม Modbus TCP slave จำลอง (pymodbus) N ตัวตามรูปแบบ mapping.json พร้อม
+อุปกรณ์ status/alarm, InfluxDB ปลอม (HTTP /health, /api/v2/write, /api/v2/query)
+แล้วรัน FastAPI app จริงใน main.py ด้วย uvicorn ภายใน process เดียวกัน
+
+วัดผล: poll-cycle latency (p50/p95/p99), ต้นทุน decode ต่อ block,
+throughput ของการเขียน batch, latency การกระจาย WebSocket และ RSS
+ผลลัพธ์เป็น JSON (--output) เพื่อเทียบระหว่าง release
+
+ตัวอย่าง:
+    python benchmark_ingest.py --devices 8 --params 40 --interval 1 --duration 30 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GAS_NAMES = ["SO2", "NOx", "O2", "CO", "Dust", "Temperature", "Velocity", "Flowrate", "Pressure"]
+STATUS_REGISTERS = 15
+ALARM_REGISTERS = 4
+
+
+def rss_mb():
+    """RSS ของ process ปัจจุบัน (MB) จาก /proc"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": round(ordered[-1], 3), "count": len(ordered)}
+
+
+# ---------------------------------------------------------------------------
+# Fake InfluxDB
+# ---------------------------------------------------------------------------
+
+class FakeInflux:
+    """InfluxDB HTTP API ปลอม: นับ batch/line/bytes ที่ถูกเขียน"""
+
+    def __init__(self, port=0):
+        self.batches = 0
+        self.lines = 0
+        self.bytes = 0
+        self.queries = 0
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=b"", content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/health"):
+                    body = json.dumps({"name": "influxdb", "message": "ready for queries and writes",
+                                       "status": "pass", "checks": [], "version": "2.7.0"}).encode()
+                    self._reply(200, body)
+                elif self.path.startswith("/ping"):
+                    self._reply(204)
+                else:
+                    self._reply(200, b"{}")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if self.path.startswith("/api/v2/write"):
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        import gzip
+                        body = gzip.decompress(body)
+                    lines = body.count(b"\n") + (1 if body and not body.endswith(b"\n") else 0)
+                    with fake.lock:
+                        fake.batches += 1
+                        fake.lines += lines
+                        fake.bytes += len(body)
+                        fake.batch_sizes.append(lines)
+                    self._reply(204)
+                elif self.path.startswith("/api/v2/query"):
+                    with fake.lock:
+                        fake.queries += 1
+                    self._reply(200, b"", "text/csv; charset=utf-8")
+                else:
+                    self._reply(200, b"{}")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def snapshot(self):
+        with self.lock:
+            return self.batches, self.lines, self.bytes
+
+
+# ---------------------------------------------------------------------------
+# Simulated Modbus slaves
+# ---------------------------------------------------------------------------
+
+def build_layout(devices, params, base_port):
+    """สร้าง devices/mapping แบบเดียวกับ config.json/mapping.json"""
+    device_list, mapping = [], []
+    for d in range(devices):
+        name = f"bench{d}"
+        device_list.append({"name": name, "mode": "tcp", "ip": "127.0.0.1", "port": base_port + d,
+                            "slaveId": 1, "registerType": "holding", "deviceType": "gas"})
+        for p in range(params):
+            param = GAS_NAMES[p] if d == 0 and p < len(GAS_NAMES) else f"{name}_P{p}"
+            mapping.append({"device": name, "name": param, "address": p * 2, "dataType": "float32",
+                            "dataFormat": "Float AB CD", "registerCount": 2, "addressBase": 0,
+                            "unit": "ppm", "formula": "x"})
+    for kind, count, offset in (("status", STATUS_REGISTERS, devices), ("alarm", ALARM_REGISTERS, devices + 1)):
+        name = f"bench_{kind}"
+        device_list.append({"name": name, "mode": "tcp", "ip": "127.0.0.1", "port": base_port + offset,
+                            "slaveId": 1, "registerType": "holding", "deviceType": kind})
+        for r in range(count):
+            mapping.append({"device": name, "name": f"{kind}_{r}", "address": r, "dataType": "int16",
+                            "registerCount": 1, "addressBase": 0, "formula": "x"})
+    return device_list, mapping
+
+
+class SimulatedSlaves:
+    """Modbus TCP slave (pymodbus) หนึ่งตัวต่ออุปกรณ์ ค่า float32 เดินแบบ random walk"""
+
+    def __init__(self, devices, mapping):
+        from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+        from pymodbus.server import ModbusTcpServer
+
+        self.servers = []
+        self.blocks = []
+        for device in devices:
+            entries = [m for m in mapping if m["device"] == device["name"]]
+            size = max(m["address"] + m["registerCount"] for m in entries) + 1
+            block = ModbusSequentialDataBlock(0, [0] * (size + 1))
+            context = ModbusServerContext(slaves=ModbusSlaveContext(hr=block, ir=block), single=True)
+            server = ModbusTcpServer(context, address=("127.0.0.1", device["port"]))
+            self.servers.append(server)
+            self.blocks.append((block, entries, [random.uniform(10, 100) for _ in entries]))
+        self._tasks = []
+
+    def _update(self):
+        for block, entries, state in self.blocks:
+            for i, entry in enumerate(entries):
+                if entry["dataType"] == "float32":
+                    state[i] = max(0.0, state[i] + random.uniform(-1, 1))
+                    hi, lo = struct.unpack(">HH", struct.pack(">f", state[i]))
+                    block.setValues(entry["address"] + 1, [hi, lo])
+                else:
+                    block.setValues(entry["address"] + 1, [int(random.random() < 0.05)])
+
+    async def _tick(self, interval):
+        while True:
+            self._update()
+            await asyncio.sleep(interval)
+
+    async def start(self, interval):
+        for server in self.servers:
+            self._tasks.append(asyncio.create_task(server.serve_forever()))
+        self._tasks.append(asyncio.create_task(self._tick(interval)))
+        await asyncio.sleep(0.5)
+
+    async def stop(self):
+        for server in self.servers:
+            await server.shutdown()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def measure_decode(plan, rounds=2000):
+    """ต้นทุน decode ต่อ block (µs) ด้วย layout ที่ compile แล้ว"""
+    from modbus_decoder import decode_block
+
+    blocks = [block for blocks in plan.values() for block in blocks]
+    if not blocks:
+        return {"blocks": 0, "us_per_block": 0.0, "us_per_value": 0.0}
+    payloads = [[random.randint(0, 65535) for _ in range(block.count)] for block in blocks]
+    for block, registers in zip(blocks, payloads):
+        decode_block(block, registers)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for block, registers in zip(blocks, payloads):
+            decode_block(block, registers)
+    elapsed = time.perf_counter() - started
+    values = sum(len(block.entries) for block in blocks)
+    return {
+        "blocks": len(blocks),
+        "us_per_block": round(elapsed / (rounds * len(blocks)) * 1e6, 3),
+        "us_per_value": round(elapsed / (rounds * values) * 1e6, 3),
+    }
+
+
+def measure_serializer(parameters=40, rounds=2000):
+    """เทียบการสร้าง Point ทีละพารามิเตอร์ (แบบเดิม) กับ LineProtocolEncoder (narrow/wide)"""
+    from line_protocol import LineProtocolEncoder
+
+    values = {f"P{i}": random.uniform(0, 500) for i in range(parameters)}
+    ts_ns = time.time_ns()
+    result = {"parameters": parameters}
+
+    def timed(fn):
+        payload = fn()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return {"us_per_sample": round((time.perf_counter() - started) / rounds * 1e6, 2),
+                "bytes_per_sample": len(payload)}
+
+    try:
+        from influxdb_client import Point
+
+        def points():
+            lines = [
+                Point("sensor_data").tag("parameter", k).field("value", round(float(v), 1)).time(ts_ns)
+                .to_line_protocol()
+                for k, v in values.items()
+            ]
+            return "\n".join(lines).encode()
+
+        result["point"] = timed(points)
+    except ImportError:
+        result["point"] = None
+    for schema in ("narrow", "wide"):
+        encoder = LineProtocolEncoder(schema)
+        result[schema] = timed(lambda: encoder.encode(values, "bench0", ts_ns)[0])
+    return result
+
+
+async def websocket_clients(url, clients, duration):
+    """เปิด WebSocket หลาย client แล้ววัดความต่างของเวลาที่แต่ละ client ได้รับ frame เดียวกัน"""
+    import websockets
+
+    arrivals = {}
+
+    async def client(index):
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                deadline = time.monotonic() + duration
+                while time.monotonic() < deadline:
+                    try:
+                        message = await asyncio.wait_for(ws.recv(), deadline - time.monotonic())
+                    except asyncio.TimeoutError:
+                        break
+                    arrivals.setdefault(message, []).append(time.perf_counter())
+        except Exception as e:
+            print(f"⚠️ WebSocket client {index}: {e}")
+
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    spreads = [(max(times) - min(times)) * 1000 for times in arrivals.values() if len(times) == clients]
+    return {"clients": clients, "frames": len(arrivals), "spread_ms": percentiles(spreads)}
+
+
+async def http_get_json(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    body = raw.split(b"\r\n\r\n", 1)[1]
+    return json.loads(body) if body else None
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="cems-bench-")
+    fake_influx = FakeInflux()
+    fake_influx.start()
+
+    devices, mapping = build_layout(args.devices, args.params, args.base_port)
+    config = json.load(open(os.path.join(BACKEND_DIR, "config.json"), encoding="utf-8"))
+    config["connection"]["devices"] = devices
+    config["connection"]["poll_interval"] = args.interval
+    config["connection"]["timeout"] = args.timeout
+    config["influxdb"]["url"] = f"http://127.0.0.1:{fake_influx.port}"
+    config["influxdb"]["rollup"] = {"enabled": False}
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(workdir, "mapping.json"), "w", encoding="utf-8") as f:
+        json.dump(mapping, f, ensure_ascii=False, indent=2)
+
+    # main.py และโมดูลอื่นใช้ path แบบ relative จึงต้องรันใน workdir
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    slaves = SimulatedSlaves(devices, mapping)
+    await slaves.start(args.interval)
+
+    import uvicorn
+    import main
+    from modbus_planner import read_planner, load_mapping
+    from database_influx import load_config
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    rss_samples = [rss_mb()]
+    influx_start = fake_influx.snapshot()
+    started = time.monotonic()
+
+    async def sample_rss():
+        while True:
+            rss_samples.append(rss_mb())
+            await asyncio.sleep(1)
+
+    rss_task = asyncio.create_task(sample_rss())
+    ws_result = await websocket_clients(f"ws://127.0.0.1:{args.port}/ws/gas", args.ws_clients, args.duration)
+    elapsed = time.monotonic() - started
+    rss_task.cancel()
+
+    batches, lines, written = (b - a for a, b in zip(influx_start, fake_influx.snapshot()))
+    poll_stats = await http_get_json(args.port, "/modbus/poll-stats")
+    ws_stats = await http_get_json(args.port, "/ws/stats")
+    influx_stats = await http_get_json(args.port, "/influx/stats")
+
+    cycle_p = {q: [s[f"{q}_latency_ms"] for s in poll_stats.values()] for q in ("p50", "p95", "p99")}
+    plan = read_planner.get_plan(load_mapping(), (load_config() or {}).get("connection", {}).get("devices", []))
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "setup": {
+            "devices": args.devices,
+            "params_per_device": args.params,
+            "parameters": len(mapping),
+            "interval": args.interval,
+            "duration": round(elapsed, 2),
+            "ws_clients": args.ws_clients,
+        },
+        "poll": {
+            "cycles": sum(s["cycles"] for s in poll_stats.values()),
+            "errors": sum(s["errors"] for s in poll_stats.values()),
+            "overruns": sum(s["overruns"] for s in poll_stats.values()),
+            "cycle_latency_ms": {
+                "p50": statistics.median(cycle_p["p50"]) if cycle_p["p50"] else 0.0,
+                "p95": max(cycle_p["p95"], default=0.0),
+                "p99": max(cycle_p["p99"], default=0.0),
+                "max": max((s["max_latency_ms"] for s in poll_stats.values()), default=0.0),
+            },
+            "values_per_second": round(
+                sum(s["cycles"] for s in poll_stats.values()) / max(elapsed, 1e-9) * len(mapping)
+                / max(len(poll_stats), 1), 1),
+        },
+        "decode": measure_decode(plan),
+        "serializer": measure_serializer(args.params),
+        "influx_write": {
+            "batches": batches,
+            "lines": lines,
+            "bytes": written,
+            "lines_per_second": round(lines / max(elapsed, 1e-9), 1),
+            "avg_batch_lines": round(lines / batches, 1) if batches else 0.0,
+            "writer": influx_stats.get("writer") if influx_stats else None,
+        },
+        "websocket": {**ws_result, "hub": ws_stats},
+        "rss_mb": {"start": round(rss_samples[0], 1), "peak": round(max(rss_samples), 1),
+                   "end": round(rss_samples[-1], 1)},
+    }
+
+    server.should_exit = True
+    await server_task
+    await slaves.stop()
+    fake_influx.stop()
+    os.chdir(BACKEND_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CEMS end-to-end ingest benchmark (offline)")
+    parser.add_argument("--devices", type=int, default=4, help="จำนวน gas analyzer จำลอง")
+    parser.add_argument("--params", type=int, default=20, help="จำนวนพารามิเตอร์ต่ออุปกรณ์")
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval (วินาที)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Modbus timeout (วินาที)")
+    parser.add_argument("--duration", type=float, default=20.0, help="ระยะเวลาวัด (วินาที)")
+    parser.add_argument("--ws-clients", type=int, default=12, help="จำนวน WebSocket client")
+    parser.add_argument("--base-port", type=int, default=15020, help="port แรกของ slave จำลอง")
+    parser.add_argument("--port", type=int, default=18000, help="port ของ backend")
+    parser.add_argument("--serializer-only", action="store_true",
+                        help="วัดเฉพาะต้นทุนการแปลงเป็น line protocol (ไม่ต้องมี Modbus/InfluxDB)")
+    parser.add_argument("--output", help="บันทึกผลเป็น JSON")
+    args = parser.parse_args()
+
+    if args.serializer_only:
+        sys.path.insert(0, BACKEND_DIR)
+        result = {"serializer": measure_serializer(args.params)}
+    else:
+        result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ Benchmark results saved to {args.output}")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
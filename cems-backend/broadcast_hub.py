@@ -0,0 +1,481 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+from starlette.websockets import WebSocketDisconnect
+
+import ws_frames
+from metrics import ws_clients, ws_dropped_total, ws_send_lag_seconds, ws_sent_bytes_total
+import log_level
+
+
+class View:
+    """สิ่งที่ client หนึ่งรับจากหัวข้อหนึ่ง: พารามิเตอร์ที่ subscribe และค่าที่ส่งไปแล้วล่าสุด
+
+    parameters=None คือทั้งหัวข้อ delta เทียบกับค่าที่ส่งถึง client จริง (ไม่ใช่รอบก่อนหน้า)
+    จึงถูกต้องเสมอแม้ client ช้าจนข้ามบางรอบไป
+    """
+
+    def __init__(self, topic, parameters=None, implicit=False):
+        self.topic = topic
+        self.parameters = parameters
+        # รับทั้งหัวข้อเพราะเชื่อมต่อที่ path ของหัวข้อ (subscribe พารามิเตอร์ครั้งแรกจะแทนที่)
+        self.implicit = implicit
+        self.names = []
+        self.index = None
+        self.schema = None
+        self.last = None
+        self.since_key = 0
+        self.seq = 0
+        self.sent = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    def reset(self):
+        """ส่ง schema และ keyframe ใหม่ใน frame ถัดไป"""
+        self.schema = None
+        self.last = None
+
+    def frames(self, fmt, keyframe_interval):
+        """ข้อความที่ต้องส่งสำหรับค่าปัจจุบันของหัวข้อ (ว่างถ้าไม่มีอะไรเปลี่ยน)"""
+        topic = self.topic
+        if topic.vector is None:
+            return []
+        out = []
+        if self.schema != topic.schema_version:
+            self.names = [n for n in topic.schema if self.parameters is None or n in self.parameters]
+            self.index = np.array([topic.positions[n] for n in self.names], dtype=np.intp)
+            self.schema = topic.schema_version
+            self.last = None
+            out.append(json.dumps({
+                "type": "schema",
+                "topic": topic.name,
+                "topic_id": topic.topic_id,
+                "schema": self.schema,
+                "format": fmt,
+                "version": ws_frames.FRAME_VERSION,
+                "parameters": self.names,
+            }))
+        values = topic.vector[self.index]
+        indices = None
+        if self.last is None or self.since_key >= keyframe_interval:
+            kind = ws_frames.KEYFRAME
+            self.since_key = 0
+            self.keyframes += 1
+        else:
+            indices = ws_frames.changed_indices(values, self.last)
+            if not len(indices):
+                return out
+            kind = ws_frames.DELTA
+            self.since_key += 1
+            self.deltas += 1
+        self.seq += 1
+        self.last = values
+        if fmt == "binary":
+            out.append(ws_frames.encode_binary(kind, topic.topic_id, self.schema, self.seq,
+                                               topic.stamp, values, indices))
+        else:
+            out.append(ws_frames.encode_json(kind, topic.name, self.seq, topic.stamp,
+                                             self.names, values, indices))
+        return out
+
+
+class Subscriber:
+    """client หนึ่งราย (หนึ่ง WebSocket) รับได้หลายหัวข้อ
+
+    client ที่ไม่ได้ส่งคำสั่งอะไรได้ payload JSON เดิมที่ serialize ครั้งเดียวร่วมกัน
+    ผ่าน send queue จำกัดขนาด (เต็มแล้วทิ้งข้อความเก่าสุด) ส่วน client ที่เลือกพารามิเตอร์
+    หรือใช้ format binary ได้ keyframe/delta ที่สร้างตอนส่ง รอบที่ค้างอยู่ถูกรวมเป็น frame เดียว
+    """
+
+    def __init__(self, websocket, max_queue, fmt="json", keyframe_interval=30):
+        self.websocket = websocket
+        self.format = fmt
+        self.keyframe_interval = keyframe_interval
+        self.queue = deque(maxlen=max_queue)
+        self.views = {}
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def shared(self, view):
+        """view นี้รับ payload JSON เดิม (ไม่กรองพารามิเตอร์ ไม่ใช้ delta)"""
+        return self.format == "json" and view.parameters is None
+
+    def offer(self, topic, stamp, data):
+        view = self.views.get(topic.name)
+        if view is None:
+            return
+        if data and not self.shared(view):
+            self.pending.setdefault(topic.name, stamp)
+        else:
+            self.send_text(topic.message(), stamp, topic)
+        self.ready.set()
+
+    def send_text(self, message, stamp=None, topic=None):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            dropped_topic = self.queue[0][2]
+            if dropped_topic is not None and dropped_topic.name in self.views:
+                self.views[dropped_topic.name].dropped += 1
+        self.queue.append((message, time.monotonic() if stamp is None else stamp, topic))
+        self.ready.set()
+
+    def prime(self, topic):
+        """ส่งค่าล่าสุดของหัวข้อให้ทันทีหลัง subscribe หรือเปลี่ยนการ subscribe"""
+        view = self.views.get(topic.name)
+        if view is None:
+            return
+        if topic.vector is not None and not self.shared(view):
+            self.pending.setdefault(topic.name, time.monotonic())
+            self.ready.set()
+        elif topic.has_payload and self.shared(view):
+            self.send_text(topic.message(), time.monotonic(), topic)
+
+    def lag(self):
+        """ความล่าช้าปัจจุบัน: อายุของข้อความที่ค้างนานสุด หรือ lag ของข้อความล่าสุด"""
+        oldest = list(self.pending.values())
+        if self.queue:
+            oldest.append(self.queue[0][1])
+        if oldest:
+            return max(self.last_lag, time.monotonic() - min(oldest))
+        return self.last_lag
+
+    async def _send(self, message, stamp, topic):
+        if isinstance(message, bytes):
+            await self.websocket.send_bytes(message)
+        else:
+            await self.websocket.send_text(message)
+        self.sent += 1
+        self.last_lag = time.monotonic() - stamp
+        self.max_lag = max(self.max_lag, self.last_lag)
+        if topic is None:
+            return
+        view = self.views.get(topic.name)
+        if view is not None:
+            view.sent += 1
+            view.bytes += len(message)
+        topic.bytes_metric[self.format].inc(len(message))
+        topic.lag_metric.observe(self.last_lag)
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.queue or self.pending:
+                if self.queue:
+                    await self._send(*self.queue.popleft())
+                    continue
+                name = next(iter(self.pending))
+                stamp = self.pending.pop(name)
+                view = self.views.get(name)
+                if view is None:
+                    continue
+                for message in view.frames(self.format, self.keyframe_interval):
+                    await self._send(message, stamp, view.topic)
+
+
+class Topic:
+    """หัวข้อหนึ่งของ hub: ข้อมูลถูก sample ครั้งเดียวต่อรอบ แล้วกระจายให้ทุกคน
+
+    ถ้ามี producer จะถูกเรียกทุก interval วินาทีเฉพาะตอนที่มีผู้รับอยู่
+    (ไม่มีคนดูก็ไม่อ่านข้อมูล) หรือจะส่งข้อมูลเข้ามาเองผ่าน publish() ก็ได้
+
+    flatten แปลง payload เป็น {พารามิเตอร์: ตัวเลข} สำหรับ client แบบ binary/เลือกพารามิเตอร์
+    payload ที่ไม่มีตัวเลข (เช่น config_version) ถือเป็นข้อความควบคุม ส่งเป็น JSON ให้ทุกคน
+    """
+
+    def __init__(self, name, producer=None, interval=1.0, max_queue=8, flatten=None, topic_id=0):
+        self.name = name
+        self.topic_id = topic_id
+        self.producer = producer
+        self.interval = float(interval)
+        self.max_queue = max_queue
+        self.flatten = flatten or ws_frames.flatten_numeric
+        self.subscribers = set()
+        self.schema = []
+        self.positions = {}
+        self.schema_version = 0
+        self.vector = None
+        self.stamp = None
+        self.has_payload = False
+        self._payload = None
+        self._message = None
+        self.published = 0
+        self.produce_errors = 0
+        self.lag_metric = ws_send_lag_seconds.labels(name)
+        self.bytes_metric = {fmt: ws_sent_bytes_total.labels(name, fmt) for fmt in ws_frames.FORMATS}
+        self._task = None
+
+    def message(self):
+        """payload ล่าสุดเป็น JSON (serialize ครั้งเดียวต่อรอบ เฉพาะเมื่อมี client ที่ต้องใช้)"""
+        if self._message is None:
+            payload = self._payload
+            self._message = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+        return self._message
+
+    def _update_vector(self, values):
+        # พารามิเตอร์ใหม่ต่อท้าย schema (ลำดับเดิมไม่เปลี่ยน) แล้วขึ้นเลข schema
+        added = [name for name in values if name not in self.positions]
+        for name in added:
+            self.positions[name] = len(self.schema)
+            self.schema.append(name)
+        if added or self.vector is None:
+            self.schema_version += 1
+        self.vector = ws_frames.to_float32([values.get(name) for name in self.schema])
+        self.stamp = time.time()
+
+    def publish(self, payload):
+        values = self.flatten(payload) if isinstance(payload, dict) else None
+        if values:
+            self._update_vector(values)
+        self._payload = payload
+        self._message = None
+        self.has_payload = True
+        self.published += 1
+        stamp = time.monotonic()
+        for subscriber in self.subscribers:
+            subscriber.offer(self, stamp, bool(values))
+
+    async def _produce_loop(self):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while self.subscribers:
+            try:
+                payload = await self.producer()
+                if payload is not None:
+                    self.publish(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.produce_errors += 1
+                log_level.error(f"❌ Broadcast producer error ({self.name}): {e}")
+            next_run += self.interval
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            next_run = max(next_run, loop.time())
+
+    def _ensure_producer(self):
+        if self.producer is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._produce_loop(), name=f"broadcast-{self.name}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        lags = [s.lag() for s in self.subscribers]
+        views = [s.views[self.name] for s in self.subscribers if self.name in s.views]
+        return {
+            "subscribers": len(self.subscribers),
+            "binary": sum(1 for s in self.subscribers if s.format == "binary"),
+            "filtered": sum(1 for v in views if v.parameters is not None),
+            "interval": self.interval if self.producer else None,
+            "published": self.published,
+            "produce_errors": self.produce_errors,
+            "parameters": len(self.schema),
+            "schema": self.schema_version,
+            "queued": sum(1 for s in self.subscribers for entry in s.queue if entry[2] is self),
+            "dropped": sum(v.dropped for v in views),
+            "sent": sum(v.sent for v in views),
+            "bytes": sum(v.bytes for v in views),
+            "keyframes": sum(v.keyframes for v in views),
+            "deltas": sum(v.deltas for v in views),
+            "last_lag_ms": round(max(lags) * 1000, 2) if lags else 0.0,
+            "max_lag_ms": round(max((s.max_lag for s in self.subscribers), default=0.0) * 1000, 2),
+        }
+
+
+class BroadcastHub:
+    """single-producer hub ของ WebSocket (/ws/gas, /ws/compliance, /ws/stream)
+
+    client ส่งคำสั่ง JSON เพื่อเลือกสิ่งที่จะรับได้ (topic ไม่ระบุ = หัวข้อของ path):
+        {"op": "subscribe", "topic": "gas", "parameters": ["SO2", "NOx"]}
+        {"op": "unsubscribe", "topic": "gas", "parameters": ["NOx"]}   (ไม่ระบุ parameters = ทั้งหัวข้อ)
+        {"op": "format", "format": "binary" | "json"}
+        {"op": "keyframe"}
+    หรือกำหนดตอนเชื่อมต่อด้วย ?format=binary&parameters=SO2,NOx
+    """
+
+    def __init__(self, max_queue=8, keyframe_interval=30):
+        self.max_queue = max_queue
+        self.keyframe_interval = keyframe_interval
+        self.topics = {}
+
+    def configure(self, max_queue=None, keyframe_interval=None):
+        if max_queue is not None:
+            self.max_queue = int(max_queue)
+        if keyframe_interval is not None:
+            self.keyframe_interval = max(1, int(keyframe_interval))
+
+    def register(self, name, producer=None, interval=1.0, max_queue=None, flatten=None):
+        """ลงทะเบียนหัวข้อ producer เป็น async function ที่คืน payload (dict) หรือ None
+
+        flatten(payload) -> {พารามิเตอร์: ตัวเลข} สำหรับ frame แบบ binary/delta
+        (ค่าเริ่มต้นใช้ตัวเลขทุกตัวใน payload ชื่อต่อกันด้วย '.')
+        """
+        existing = self.topics.get(name)
+        topic_id = existing.topic_id if existing else len(self.topics)
+        topic = Topic(name, producer, interval, max_queue or self.max_queue, flatten, topic_id)
+        if existing:
+            topic.subscribers = existing.subscribers
+            for subscriber in topic.subscribers:
+                subscriber.views[name].topic = topic
+                subscriber.views[name].reset()
+        self.topics[name] = topic
+        return topic
+
+    def topic(self, name):
+        topic = self.topics.get(name)
+        if topic is None:
+            topic = self.register(name)
+        return topic
+
+    def publish(self, name, payload):
+        self.topic(name).publish(payload)
+
+    async def serve(self, websocket, name=None):
+        """รับ WebSocket (เข้าหัวข้อ name ถ้าระบุ) แล้วส่งข้อมูลจนกว่า client จะปิด"""
+        await websocket.accept()
+        query = websocket.query_params
+        fmt = query.get("format", "json")
+        parameters = [p.strip() for p in query.get("parameters", "").split(",") if p.strip()] or None
+        max_queue = self.topic(name).max_queue if name else self.max_queue
+        subscriber = Subscriber(websocket, max_queue, fmt if fmt in ws_frames.FORMATS else "json",
+                                self.keyframe_interval)
+        if name:
+            self.subscribe(subscriber, name, parameters)
+            subscriber.views[name].implicit = parameters is None
+        sender = asyncio.create_task(subscriber.run())
+        receiver = asyncio.create_task(self._receive(websocket, subscriber, name))
+        try:
+            await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            topics = [view.topic for view in subscriber.views.values()]
+            for topic in topics:
+                topic.subscribers.discard(subscriber)
+            for task in (sender, receiver):
+                task.cancel()
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+            for topic in topics:
+                await self._release(topic)
+
+    def subscribe(self, subscriber, name, parameters=None):
+        """เพิ่มหัวข้อ หรือเพิ่มพารามิเตอร์ในหัวข้อที่รับอยู่ (parameters=None = ทั้งหัวข้อ)"""
+        topic = self.topic(name)
+        view = subscriber.views.get(name)
+        if view is None:
+            subscriber.views[name] = View(topic, set(parameters) if parameters else None)
+            topic.subscribers.add(subscriber)
+            topic._ensure_producer()
+        else:
+            if not parameters:
+                view.parameters = None
+            elif view.implicit:
+                view.parameters = set(parameters)
+            elif view.parameters is not None:
+                view.parameters |= set(parameters)
+            view.implicit = False
+            view.reset()
+        subscriber.prime(topic)
+
+    async def unsubscribe(self, subscriber, name, parameters=None):
+        """เอาพารามิเตอร์ออกจากหัวข้อ หรือเลิกรับทั้งหัวข้อเมื่อไม่ระบุ parameters"""
+        view = subscriber.views.get(name)
+        if view is None:
+            return
+        if parameters:
+            current = set(view.topic.schema) if view.parameters is None else view.parameters
+            view.parameters = current - set(parameters)
+            view.reset()
+            subscriber.prime(view.topic)
+            return
+        del subscriber.views[name]
+        subscriber.pending.pop(name, None)
+        view.topic.subscribers.discard(subscriber)
+        await self._release(view.topic)
+
+    async def _release(self, topic):
+        # ไม่มีผู้รับแล้ว หยุด producer (ถ้ามีคนเข้ามาระหว่างรอ ให้เริ่มใหม่)
+        if not topic.subscribers:
+            await topic.stop()
+            if topic.subscribers:
+                topic._ensure_producer()
+
+    async def _receive(self, websocket, subscriber, default_topic):
+        # อ่านคำสั่งจาก client และรู้ทันทีเมื่อ client ปิดการเชื่อมต่อ
+        # ข้อความที่ไม่ใช่คำสั่ง JSON ถูกข้ามไปเหมือนเดิม
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    command = json.loads(text)
+                except ValueError:
+                    continue
+                if isinstance(command, dict) and "op" in command:
+                    error = await self._command(subscriber, command, default_topic)
+                    if error:
+                        subscriber.send_text(json.dumps({"type": "error", "op": command.get("op"), "detail": error}))
+        except (WebSocketDisconnect, RuntimeError, KeyError):
+            pass
+
+    async def _command(self, subscriber, command, default_topic):
+        """ทำตามคำสั่งของ client คืนข้อความ error หรือ None"""
+        op = command["op"]
+        name = command.get("topic") or default_topic
+        parameters = command.get("parameters")
+        if parameters is not None and (not isinstance(parameters, list)
+                                       or not all(isinstance(p, str) for p in parameters)):
+            return "parameters must be a list of names"
+        if op in ("subscribe", "unsubscribe"):
+            if name not in self.topics:
+                return f"Unknown topic: {name}"
+            if op == "subscribe":
+                self.subscribe(subscriber, name, parameters)
+            else:
+                await self.unsubscribe(subscriber, name, parameters)
+        elif op == "format":
+            fmt = command.get("format")
+            if fmt not in ws_frames.FORMATS:
+                return f"format must be one of {', '.join(ws_frames.FORMATS)}"
+            if fmt != subscriber.format:
+                subscriber.format = fmt
+                for view in subscriber.views.values():
+                    view.reset()
+                    subscriber.prime(view.topic)
+        elif op == "keyframe":
+            for view in subscriber.views.values():
+                if command.get("topic") in (None, view.topic.name):
+                    view.last = None
+                    subscriber.prime(view.topic)
+        else:
+            return f"Unknown op: {op}"
+        return None
+
+    async def close(self):
+        for topic in self.topics.values():
+            await topic.stop()
+
+    def stats(self):
+        return {name: topic.stats() for name, topic in self.topics.items()}
+
+
+# Global instance
+broadcast_hub = BroadcastHub()
+
+ws_clients.set_function(lambda: {name: len(t.subscribers) for name, t in broadcast_hub.topics.items()})
+ws_dropped_total.set_function(
+    lambda: {name: sum(s.views[name].dropped for s in t.subscribers if name in s.views)
+             for name, t in broadcast_hub.topics.items()}
+)
@@ -0,0 +1,295 @@
+import math
+import time
+from collections import deque
+
+# น้ำหนักโมเลกุล (g/mol) สำหรับแปลง ppm -> mg/m³ (NOx คิดเป็น NO2)
+MOLECULAR_WEIGHTS = {
+    "SO2": 64.066,
+    "NOx": 46.006,
+    "NO": 30.006,
+    "NO2": 46.006,
+    "CO": 28.010,
+}
+
+# ปริมาตรโมลาร์ที่ 0°C, 1 atm (L/mol)
+MOLAR_VOLUME = 22.414
+
+BLOCK_WINDOWS = (("1m", 60), ("15m", 900), ("1h", 3600), ("24h", 86400))
+ROLLING_WINDOWS = (("15m", 900), ("1h", 3600), ("24h", 86400))
+
+
+def stack_area(stack_info):
+    """พื้นที่หน้าตัดปล่อง (m²) จาก area หรือคำนวณจาก diameter"""
+    stack_info = stack_info or {}
+    area = stack_info.get("area")
+    if area:
+        return float(area)
+    diameter = stack_info.get("diameter")
+    if diameter:
+        return math.pi * (float(diameter) / 2) ** 2
+    return None
+
+
+class BlockAverage:
+    """ค่าเฉลี่ยแบบ block ที่ตรงกับขอบเวลา (1m/15m/1h/24h ตามเวลาเครื่อง)"""
+
+    __slots__ = ("name", "seconds", "offset", "start", "total", "count")
+
+    def __init__(self, name, seconds, offset):
+        self.name = name
+        self.seconds = seconds
+        self.offset = offset
+        self.start = None
+        self.total = 0.0
+        self.count = 0
+
+    def block_start(self, ts):
+        return (ts + self.offset) // self.seconds * self.seconds - self.offset
+
+    def close(self):
+        """ปิด block ปัจจุบัน คืน (start, mean, count) หรือ None"""
+        closed = None
+        if self.count:
+            closed = (self.start, self.total / self.count, self.count)
+        self.start = None
+        self.total = 0.0
+        self.count = 0
+        return closed
+
+    def expired(self, now):
+        return self.start is not None and now >= self.start + self.seconds
+
+    def add(self, ts, value):
+        """เพิ่มค่า คืน block ที่ถูกปิด (ถ้าค่านี้อยู่ใน block ใหม่)"""
+        start = self.block_start(ts)
+        closed = None
+        if self.start is not None and start != self.start:
+            closed = self.close()
+        self.start = start
+        self.total += value
+        self.count += 1
+        return closed
+
+    def current(self):
+        return self.total / self.count if self.count else None
+
+
+class RollingAverage:
+    """ค่าเฉลี่ยเคลื่อนที่ เก็บผลรวมเป็นรายนาที (O(1) ต่อค่า)"""
+
+    __slots__ = ("name", "seconds", "minutes", "total", "count")
+
+    def __init__(self, name, seconds):
+        self.name = name
+        self.seconds = seconds
+        self.minutes = deque()
+        self.total = 0.0
+        self.count = 0
+
+    def _evict(self, now):
+        cutoff = now - self.seconds
+        minutes = self.minutes
+        while minutes and minutes[0][0] + 60 <= cutoff:
+            _, total, count = minutes.popleft()
+            self.total -= total
+            self.count -= count
+
+    def add(self, ts, value):
+        minute = ts // 60 * 60
+        if self.minutes and self.minutes[-1][0] == minute:
+            bucket = self.minutes[-1]
+            bucket[1] += value
+            bucket[2] += 1
+        else:
+            self.minutes.append([minute, value, 1])
+        self.total += value
+        self.count += 1
+        self._evict(ts)
+
+    def value(self, now):
+        self._evict(now)
+        return self.total / self.count if self.count else None
+
+
+class Channel:
+    """ค่าหนึ่งช่อง (เช่น SO2, SO2Corr, SO2Rate) พร้อม block และ rolling averages"""
+
+    __slots__ = ("name", "blocks", "rolling", "last")
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.blocks = [BlockAverage(n, s, offset) for n, s in BLOCK_WINDOWS]
+        self.rolling = [RollingAverage(n, s) for n, s in ROLLING_WINDOWS]
+        self.last = None
+
+    def add(self, ts, value):
+        self.last = value
+        closed = []
+        for block in self.blocks:
+            result = block.add(ts, value)
+            if result:
+                closed.append((block, result))
+        for rolling in self.rolling:
+            rolling.add(ts, value)
+        return closed
+
+
+class ComplianceEngine:
+    """คำนวณค่าเฉลี่ยตามข้อกำหนดแบบต่อเนื่องจากค่าที่ poll ได้
+
+    สำหรับแต่ละก๊าซจะคำนวณค่าที่ปรับ O2 อ้างอิง ({gas}Corr):
+        C_corr = C x (20.9 - O2_ref) / (20.9 - O2)
+    และอัตราการปล่อย ({gas}Rate, kg/h) จาก Velocity x พื้นที่ปล่อง
+    ทุกช่องมี block average 1m/15m/1h/24h และ rolling average 15m/1h/24h
+    พร้อม % data availability เทียบกับ sample_interval ที่คาดไว้
+    """
+
+    def __init__(self, reference_o2=7.0, gases=("SO2", "NOx", "CO", "Dust"), sample_interval=60.0,
+                 o2_ambient=20.9, molar_volume=MOLAR_VOLUME):
+        self.reference_o2 = float(reference_o2)
+        self.gases = tuple(gases)
+        self.sample_interval = float(sample_interval)
+        self.o2_ambient = float(o2_ambient)
+        self.molar_volume = float(molar_volume)
+        self.area = None
+        self.units = {}
+        self.offset = time.localtime().tm_gmtoff
+        self.channels = {}
+        # ค่าล่าสุดของทุกพารามิเตอร์ (O2/Velocity อาจมาจากอุปกรณ์อื่น)
+        self.current = {}
+        self.latest = {}
+        self.samples = 0
+        self.closed_blocks = 0
+
+    def configure(self, config):
+        """อ่านค่าจาก config (compliance, stack_info, gas_config)"""
+        config = config or {}
+        settings = config.get("compliance", {})
+        connection = config.get("connection", {})
+        self.reference_o2 = float(settings.get("reference_o2", self.reference_o2))
+        self.gases = tuple(settings.get("gases", self.gases))
+        self.sample_interval = float(settings.get(
+            "sample_interval", connection.get("poll_interval", connection.get("log_interval", self.sample_interval))
+        ))
+        self.o2_ambient = float(settings.get("o2_ambient", self.o2_ambient))
+        self.area = stack_area(config.get("stack_info"))
+        gas_config = config.get("gas_config", {})
+        self.units = {
+            gas.get("name"): gas.get("unit")
+            for gas in list(gas_config.get("default_gases", [])) + list(gas_config.get("additional_gases", []))
+        }
+
+    def _channel(self, name):
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(name, self.offset)
+        return channel
+
+    def to_mg_m3(self, gas, value):
+        """แปลงความเข้มข้นเป็น mg/m³ (ค่าที่เป็น ppm ใช้น้ำหนักโมเลกุล)"""
+        unit = self.units.get(gas)
+        if unit == "ppm" or (unit is None and gas in MOLECULAR_WEIGHTS):
+            weight = MOLECULAR_WEIGHTS.get(gas)
+            return None if weight is None else value * weight / self.molar_volume
+        return value
+
+    def derive(self, values, gases=None):
+        """ค่าที่คำนวณจาก sample: {gas}Corr และ {gas}Rate"""
+        derived = {}
+        o2 = values.get("O2")
+        factor = None
+        if o2 is not None and o2 < self.o2_ambient - 0.1:
+            factor = (self.o2_ambient - self.reference_o2) / (self.o2_ambient - o2)
+        velocity = values.get("Velocity")
+        flow = velocity * self.area if velocity is not None and self.area else None
+        for gas in self.gases if gases is None else gases:
+            value = values.get(gas)
+            if value is None:
+                continue
+            if factor is not None:
+                derived[f"{gas}Corr"] = value * factor
+            if flow is not None:
+                concentration = self.to_mg_m3(gas, value)
+                if concentration is not None:
+                    # mg/m³ x m³/s -> kg/h
+                    derived[f"{gas}Rate"] = concentration * flow * 3600 / 1e6
+        return derived
+
+    def process(self, values, ts=None):
+        """ป้อน sample หนึ่งชุด คืน list ของ block ที่ปิดแล้ว"""
+        ts = time.time() if ts is None else ts
+        sample = {}
+        for name, value in values.items():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(value):
+                sample[name] = value
+        self.current.update(sample)
+        derived = self.derive(self.current, [g for g in self.gases if g in sample])
+        self.latest.update(derived)
+        self.samples += 1
+
+        closed = self._close_expired(ts)
+        tracked = set(self.gases) | {"O2", "Velocity"}
+        for name, value in list(sample.items()) + list(derived.items()):
+            if name in tracked or name in derived:
+                for block, result in self._channel(name).add(ts, value):
+                    closed.append(self._block_record(name, block, result))
+        self.closed_blocks += len(closed)
+        return closed
+
+    def _close_expired(self, now):
+        closed = []
+        for name, channel in self.channels.items():
+            for block in channel.blocks:
+                if block.expired(now):
+                    result = block.close()
+                    if result:
+                        closed.append(self._block_record(name, block, result))
+        return closed
+
+    def tick(self, now=None):
+        """ปิด block ที่หมดเวลาแล้วแม้ไม่มีข้อมูลใหม่เข้ามา"""
+        closed = self._close_expired(time.time() if now is None else now)
+        self.closed_blocks += len(closed)
+        return closed
+
+    def _block_record(self, name, block, result):
+        start, mean, count = result
+        expected = max(1.0, block.seconds / self.sample_interval)
+        return {
+            "parameter": name,
+            "window": block.name,
+            "start": start,
+            "mean": mean,
+            "count": count,
+            "availability": round(min(100.0, count / expected * 100), 1),
+        }
+
+    def snapshot(self, now=None):
+        """ค่าเฉลี่ยปัจจุบันของทุกช่องสำหรับส่งทาง WebSocket"""
+        now = time.time() if now is None else now
+        channels = {}
+        for name, channel in self.channels.items():
+            channels[name] = {
+                "last": channel.last,
+                "block": {b.name: b.current() for b in channel.blocks},
+                "rolling": {r.name: r.value(now) for r in channel.rolling},
+            }
+        return {"time": now, "reference_o2": self.reference_o2, "channels": channels}
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "closed_blocks": self.closed_blocks,
+            "channels": len(self.channels),
+            "reference_o2": self.reference_o2,
+            "sample_interval": self.sample_interval,
+            "stack_area": self.area,
+        }
+
+
+# Global instance
+compliance_engine = ComplianceEngine()
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import threading
+
+import log_level
+
+# Config/mapping file paths (original relative)
+CONFIG_FILE = "config.json"
+MAPPING_FILE = "mapping.json"
+
+
+class FrozenDict(dict):
+    """dict ที่แก้ไขไม่ได้ (ยัง json.dumps ได้ตามปกติ)"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("config snapshot is read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def freeze(value):
+    """แปลง dict/list ทั้งโครงสร้างให้เป็น FrozenDict/tuple"""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """สำเนาที่แก้ไขได้ของ snapshot (ใช้ก่อนแก้แล้ว save)"""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class JsonFileStore:
+    """snapshot ของไฟล์ JSON ในหน่วยความจำ โหลดใหม่เฉพาะเมื่อไฟล์เปลี่ยน
+
+    ทุกครั้งที่เนื้อหาเปลี่ยน (จาก watcher ที่ตรวจ mtime หรือจาก save())
+    version จะเพิ่มขึ้นและ listener ที่ลงทะเบียนไว้จะถูกเรียก ผู้ใช้ snapshot
+    ห้ามแก้ไขค่า (ค่าเป็น FrozenDict/tuple) ให้ใช้ thaw() แล้ว save() แทน
+    """
+
+    def __init__(self, path, default=None):
+        self.path = path
+        self.default = default
+        self.data = freeze(default)
+        self.version = 0
+        self.etag = None
+        self.reloads = 0
+        self.errors = 0
+        self._stamp = None
+        self._pending = False
+        self._listeners = []
+        self._task = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload(self):
+        """อ่านไฟล์ใหม่ คืน True ถ้าเนื้อหาเปลี่ยน"""
+        with self._lock:
+            stamp = self._file_stamp()
+            try:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                data = json.loads(raw.decode('utf-8'))
+            except Exception as e:
+                self.errors += 1
+                self._stamp = stamp
+                log_level.error(f"❌ Error loading {self.path}: {e}")
+                return False
+            self._stamp = stamp
+            etag = hashlib.sha1(raw).hexdigest()
+            if etag == self.etag:
+                return False
+            self.data = freeze(data)
+            self.etag = etag
+            self.version += 1
+            self.reloads += 1
+            return True
+
+    def get(self):
+        """snapshot ปัจจุบัน (ไม่อ่านไฟล์)"""
+        return self.data
+
+    def changed_on_disk(self):
+        return self._file_stamp() != self._stamp
+
+    def save(self, data):
+        """เขียนไฟล์แบบ atomic แล้วโหลด snapshot ใหม่ทันที (listener ถูกเรียกในรอบ watcher ถัดไป)"""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(thaw(data), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        changed = self.reload()
+        self._pending = self._pending or changed
+        return changed
+
+    def on_change(self, listener):
+        """ลงทะเบียน callback(store) (sync หรือ async) ที่ถูกเรียกเมื่อ version เปลี่ยน"""
+        self._listeners.append(listener)
+
+    async def notify(self):
+        for listener in self._listeners:
+            try:
+                result = listener(self)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                log_level.error(f"❌ Config listener error ({self.path}): {e}")
+
+    async def check(self):
+        """โหลดใหม่ถ้าไฟล์ถูกแก้ แล้วแจ้ง listener"""
+        if self.changed_on_disk() and await asyncio.to_thread(self.reload):
+            log_level.info(f"🔄 {self.path} reloaded (version {self.version})")
+            self._pending = True
+        if self._pending:
+            self._pending = False
+            await self.notify()
+
+    async def _watch_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    def watch(self, interval=2.0):
+        """เริ่ม watcher ที่ตรวจ mtime ของไฟล์ทุก interval วินาที"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch_loop(interval), name=f"watch-{self.path}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "etag": self.etag,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+
+# Global instances
+config_store = JsonFileStore(CONFIG_FILE)
+mapping_store = JsonFileStore(MAPPING_FILE, default=[])
+
+
+def config_version():
+    """version รวมของ config และ mapping"""
+    return f"{config_store.version}.{mapping_store.version}"
@@ -0,0 +1,531 @@
+"""
+Bulk import of historical CSV logs
+
+นำเข้าไฟล์ CSV รูปแบบ CEMS_DataLog.csv (Timestamp,SO2,...) หรือไฟล์ export
+จาก CEMS เครื่องอื่นเข้า storage ที่ใช้อยู่ (InfluxDB cems_data และ/หรือ local store)
+โดยใช้เวลาของแต่ละแถวเอง
+
+- อ่านไฟล์ทีละ chunk (ตัดที่ขึ้นบรรทัดใหม่) แปลง timestamp และค่าแบบ vectorized ด้วย numpy
+- ชื่อคอลัมน์จับคู่กับ gas_config (name/display_name ไม่สนตัวพิมพ์และหน่วยในวงเล็บ)
+- หลาย worker thread สร้าง line protocol และเขียน InfluxDB เป็น batch พร้อมกัน
+- local store เขียนตามลำดับ chunk และบันทึก checkpoint (byte offset) ไว้ใน
+  csv_import.checkpoint_directory เริ่มใหม่จะทำต่อจาก checkpoint (ข้อมูลที่ถูกเขียนซ้ำทับค่าเดิม ไม่เกิดแถวซ้ำ)
+- POST /api/import-csv นำเข้าได้เฉพาะไฟล์ใน csv_import.directory
+
+ตัวอย่าง:
+    python csv_import.py CEMS_DataLog.csv
+    python csv_import.py old_unit.csv --workers 8 --map "SO2 ppm=SO2" --device stack2
+    python csv_import.py CEMS_DataLog.csv --utc --restart
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from database_influx import influx_manager, local_store, load_config, storage_config
+from line_protocol import LineProtocolEncoder
+import log_level
+
+TIMESTAMP_COLUMNS = ("timestamp", "time", "datetime", "date", "_time")
+CHECKPOINT_SUFFIX = ".import.json"
+_UNIT = re.compile(r"\s*[\(\[].*?[\)\]]\s*")
+
+
+def import_settings(config):
+    """โฟลเดอร์ที่ API นำเข้าไฟล์ได้ และโฟลเดอร์ checkpoint ของ backend"""
+    settings = dict((config or {}).get("csv_import", {}))
+    settings.setdefault("directory", "imports")
+    settings.setdefault("checkpoint_directory", "import_checkpoints")
+    return settings
+
+
+def resolve_import_path(path, directory):
+    """path เต็มของไฟล์ใน directory (ระบุแบบ relative หรือ absolute ที่อยู่ภายใน)
+
+    ValueError ถ้าอยู่นอก directory (รวม .. และ symlink ที่ชี้ออกไป) หรือไม่ใช่ไฟล์
+    """
+    root = os.path.realpath(directory)
+    full = os.path.realpath(os.path.join(root, path or ""))
+    if full == root or os.path.commonpath([root, full]) != root:
+        raise ValueError(f"path must be a file inside the import directory {directory!r}")
+    if not os.path.isfile(full):
+        raise ValueError("path must be an existing file")
+    return full
+
+
+def checkpoint_file(path, directory):
+    """ไฟล์ checkpoint ของ path ใน directory (ชื่อไฟล์ + hash ของ path เต็ม)"""
+    full = os.path.abspath(path)
+    digest = hashlib.sha1(full.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{os.path.basename(full)}.{digest}{CHECKPOINT_SUFFIX}")
+
+
+def normalize_column(name):
+    """ชื่อคอลัมน์สำหรับจับคู่: ตัดหน่วยในวงเล็บ ช่องว่าง และตัวห้อย (SO₂ -> so2)"""
+    name = _UNIT.sub("", str(name)).translate(str.maketrans("₀₁₂₃₄₅₆₇₈₉", "0123456789"))
+    return re.sub(r"[\s_\-]+", "", name).casefold()
+
+
+def column_aliases(config):
+    """{ชื่อที่ normalize แล้ว: parameter} จาก gas_config"""
+    gas_config = (config or {}).get("gas_config", {})
+    aliases = {}
+    for gas in list(gas_config.get("default_gases", [])) + list(gas_config.get("additional_gases", [])):
+        name = gas.get("name")
+        if not name:
+            continue
+        for alias in (name, gas.get("display_name")):
+            if alias:
+                aliases.setdefault(normalize_column(alias), name)
+    return aliases
+
+
+def _local_offset(naive_seconds):
+    """offset ของเวลาเครื่อง (วินาที) ณ เวลาท้องถิ่น naive_seconds"""
+    wall = datetime.fromtimestamp(naive_seconds, tz=timezone.utc).replace(tzinfo=None)
+    return wall.astimezone().utcoffset().total_seconds()
+
+
+def _parse_one(text):
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        for fmt in ("%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y/%m/%d %H:%M:%S"):
+            try:
+                dt = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if dt.tzinfo is not None:
+        return ("utc", dt.astimezone(timezone.utc).replace(tzinfo=None))
+    return ("naive", dt)
+
+
+def parse_timestamps(strings, utc=False):
+    """แปลง timestamp เป็น epoch milliseconds (int64) แถวที่แปลงไม่ได้เป็น -1
+
+    รูปแบบ ISO (รวม "YYYY-MM-DD HH:MM:SS" ของ CEMS_DataLog.csv) แปลงทั้ง array ในครั้งเดียว
+    เวลาไม่มี timezone ถือเป็นเวลาเครื่อง (เหมือนตอน export) เว้นแต่ utc=True
+    """
+    strings = np.char.strip(np.asarray(strings))
+    aware = np.zeros(len(strings), dtype=bool)
+    # numpy ไม่รองรับ timezone ในข้อความ แถวที่มี Z/+hh:mm/-hh:mm ต้องแปลงทีละแถว
+    zoned = np.char.endswith(strings, "Z") | (np.char.rfind(strings, "+") > 9) | (np.char.rfind(strings, "-") > 9)
+    try:
+        if zoned.any():
+            raise ValueError("timezone designator")
+        stamps = np.array(strings, dtype="datetime64[ms]")
+    except ValueError:
+        # มีบางแถวไม่ใช่ ISO (เช่น dd/mm/yyyy หรือมี timezone) แปลงทีละแถว
+        stamps = np.empty(len(strings), dtype="datetime64[ms]")
+        for i, text in enumerate(strings.tolist()):
+            parsed = _parse_one(text)
+            if parsed is None:
+                stamps[i] = np.datetime64("NaT")
+                continue
+            kind, dt = parsed
+            aware[i] = kind == "utc"
+            stamps[i] = np.datetime64(dt, "ms")
+    missing = np.isnat(stamps)
+    millis = stamps.astype(np.int64)
+    if not utc:
+        local = ~missing & ~aware
+        if local.any():
+            hours, inverse = np.unique(millis[local] // 3_600_000, return_inverse=True)
+            offsets = np.array([_local_offset(int(h) * 3600) for h in hours.tolist()]) * 1000
+            millis[local] -= offsets[inverse].astype(np.int64)
+    millis[missing] = -1
+    return millis
+
+
+def _to_float(strings):
+    """แปลงคอลัมน์ข้อความเป็น float64 (ช่องว่าง/ข้อความที่ไม่ใช่ตัวเลขเป็น NaN)"""
+    strings = np.char.strip(np.asarray(strings))
+    strings = np.where(strings == "", "nan", strings)
+    try:
+        return strings.astype(np.float64)
+    except ValueError:
+        out = np.empty(len(strings))
+        for i, text in enumerate(strings.tolist()):
+            try:
+                out[i] = float(text)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+def read_header(path, encoding="utf-8-sig"):
+    """(คอลัมน์, byte offset ของแถวข้อมูลแรก)"""
+    with open(path, "rb") as f:
+        line = f.readline()
+    return next(csv.reader([line.decode(encoding).strip("\r\n")])), len(line)
+
+
+def iter_chunks(path, start, chunk_bytes):
+    """(ลำดับ, offset ท้าย chunk, bytes) โดยแต่ละ chunk จบที่ขึ้นบรรทัดใหม่"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        remainder = b""
+        seq = 0
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            data = remainder + block
+            cut = data.rfind(b"\n") + 1
+            if not cut:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            offset += cut
+            yield seq, offset, data[:cut]
+            seq += 1
+        if remainder.strip():
+            yield seq, offset + len(remainder), remainder
+
+
+class CsvImporter:
+    """นำเข้า CSV หนึ่งไฟล์ (รันใน thread เดียวกับผู้เรียก worker เป็น thread pool)"""
+
+    def __init__(self, path, workers=4, chunk_mb=8, batch_size=5000, utc=False, device="import",
+                 mapping=None, only_mapped=False, checkpoint=None, restart=False, encoding="utf-8-sig"):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.chunk_bytes = max(64 * 1024, int(float(chunk_mb) * 1024 * 1024))
+        self.batch_size = batch_size
+        self.utc = utc
+        self.device = device
+        self.mapping = dict(mapping or {})
+        self.only_mapped = only_mapped
+        self.checkpoint_path = checkpoint or checkpoint_file(
+            path, import_settings(load_config())["checkpoint_directory"])
+        self.restart = restart
+        self.encoding = encoding
+
+        self.header, self.data_start = read_header(path, encoding)
+        self.total_bytes = os.path.getsize(path)
+        self.columns = self._map_columns(column_aliases(load_config()))
+        self.timestamp_index = self._timestamp_index()
+
+        self.influx = influx_manager if influx_manager.enabled and influx_manager.connected else None
+        self.local = local_store if storage_config['backend'] != 'influxdb' else None
+        self._schema = influx_manager.encoder.schema
+        self._digits = influx_manager.encoder.digits
+        self._stop = threading.Event()
+
+        self.state = "pending"
+        self.error = None
+        self.offset = self.data_start
+        self.rows = 0
+        self.points = 0
+        self.bad_rows = 0
+        self.local_points = 0
+        self.oldest_ms = None
+        self.started = None
+        self.finished = None
+        self.resumed_from = None
+        self._start_rows = 0
+
+    def _map_columns(self, aliases):
+        """{ตำแหน่งคอลัมน์: parameter}"""
+        columns = {}
+        for i, name in enumerate(self.header):
+            name = name.strip()
+            if normalize_column(name) in TIMESTAMP_COLUMNS:
+                continue
+            if name in self.mapping:
+                columns[i] = self.mapping[name]
+            elif normalize_column(name) in aliases:
+                columns[i] = aliases[normalize_column(name)]
+            elif not self.only_mapped and name:
+                columns[i] = _UNIT.sub("", name).strip()
+        return columns
+
+    def _timestamp_index(self):
+        for i, name in enumerate(self.header):
+            if normalize_column(name) in TIMESTAMP_COLUMNS:
+                return i
+        return 0
+
+    # ---- checkpoint ----
+
+    def _load_checkpoint(self):
+        if self.restart:
+            return
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("header") != self.header or not self.data_start <= saved.get("offset", 0) <= self.total_bytes:
+            log_level.warning(f"⚠️ Ignoring checkpoint {self.checkpoint_path} (file changed)")
+            return
+        self.offset = self.resumed_from = saved["offset"]
+        self.rows = saved.get("rows", 0)
+        self.points = saved.get("points", 0)
+        self.bad_rows = saved.get("bad_rows", 0)
+
+    def _save_checkpoint(self):
+        data = {
+            "path": os.path.abspath(self.path), "header": self.header, "offset": self.offset,
+            "rows": self.rows, "points": self.points, "bad_rows": self.bad_rows,
+            "state": self.state, "updated": datetime.now(timezone.utc).isoformat(),
+        }
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # ---- worker ----
+
+    def _parse(self, data):
+        """chunk เป็น (เวลา ms เรียงแล้ว, {parameter: float64 array}, แถวที่ใช้ไม่ได้)"""
+        rows = [row for row in csv.reader(io.StringIO(data.decode(self.encoding, errors="replace"))) if row]
+        width = len(self.header)
+        good = [row for row in rows if len(row) == width]
+        bad = len(rows) - len(good)
+        if not good:
+            return np.empty(0, dtype=np.int64), {}, bad
+        cells = list(zip(*good))
+        millis = parse_timestamps(cells[self.timestamp_index], self.utc)
+        valid = millis >= 0
+        bad += int((~valid).sum())
+        order = np.argsort(millis[valid], kind="stable")
+        millis = millis[valid][order]
+        columns = {}
+        for index, name in self.columns.items():
+            values = _to_float(cells[index])[valid][order]
+            columns[name] = np.where(np.isfinite(values), values, np.nan)
+        return millis, columns, bad
+
+    def _encode(self, millis, columns):
+        """line protocol ทีละแถว (NaN ถูกข้าม) แบ่งเป็น batch"""
+        encoder = LineProtocolEncoder(self._schema, self._digits)
+        names = list(columns)
+        lists = [columns[name].tolist() for name in names]
+        batch, batches, points = [], [], 0
+        for i, ms in enumerate(millis.tolist()):
+            record, fields = encoder.encode({name: column[i] for name, column in zip(names, lists)},
+                                            self.device, ms * 1_000_000)
+            if fields:
+                batch.append(record)
+                points += fields
+                if len(batch) >= self.batch_size:
+                    batches.append(batch)
+                    batch = []
+        if batch:
+            batches.append(batch)
+        return batches, points
+
+    def _write_influx(self, batches, retries=3):
+        for batch in batches:
+            for attempt in range(retries + 1):
+                try:
+                    self.influx.write_lines(batch)
+                    break
+                except Exception:
+                    if attempt == retries or self._stop.is_set():
+                        raise
+                    time.sleep(0.5 * 2 ** attempt)
+
+    def _process(self, data):
+        millis, columns, bad = self._parse(data)
+        points = sum(int(np.isfinite(values).sum()) for values in columns.values())
+        if self.influx is not None and len(millis):
+            batches, points = self._encode(millis, columns)
+            self._write_influx(batches)
+        return millis, columns, bad, points
+
+    # ---- run ----
+
+    def _commit(self, end, result):
+        """chunk ที่เสร็จตามลำดับ: เขียน local store แล้วเลื่อน checkpoint"""
+        millis, columns, bad, points = result
+        if self.local is not None and len(millis):
+            seconds = millis / 1000.0
+            self.local_points += self.local.import_columns(
+                {name: (seconds, values) for name, values in columns.items()}
+            )
+        if len(millis):
+            first = int(millis[0])
+            self.oldest_ms = first if self.oldest_ms is None else min(self.oldest_ms, first)
+        self.rows += len(millis)
+        self.points += points
+        self.bad_rows += bad
+        self.offset = end
+
+    def run(self, report_interval=None, checkpoint_interval=5.0):
+        if self.influx is None and self.local is None:
+            raise RuntimeError("No storage available (InfluxDB not connected and storage.backend is influxdb)")
+        self._load_checkpoint()
+        self.state = "running"
+        self.started = time.monotonic()
+        self._start_rows = self.rows
+        last_checkpoint = last_report = self.started
+        pending = []
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix="csv-import") as pool:
+                chunks = iter_chunks(self.path, self.offset, self.chunk_bytes)
+                for _, end, data in chunks:
+                    if self._stop.is_set():
+                        break
+                    pending.append((end, pool.submit(self._process, data)))
+                    # commit ตามลำดับ chunk โดยมีงานค้างไม่เกิน 2 เท่าของจำนวน worker
+                    while len(pending) >= self.workers * 2 or (pending and pending[0][1].done()):
+                        end, future = pending.pop(0)
+                        self._commit(end, future.result())
+                    now = time.monotonic()
+                    if now - last_checkpoint >= checkpoint_interval:
+                        self._save_checkpoint()
+                        last_checkpoint = now
+                    if report_interval and now - last_report >= report_interval:
+                        print(f"📥 {self.progress():.1f}%  {self.rows} rows  {self.rows_per_second():.0f} rows/s")
+                        last_report = now
+                while pending:
+                    end, future = pending.pop(0)
+                    if self._stop.is_set():
+                        future.cancel()
+                        continue
+                    self._commit(end, future.result())
+        except KeyboardInterrupt:
+            self._stop.set()
+            for _, future in pending:
+                future.cancel()
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            for _, future in pending:
+                future.cancel()
+            raise
+        finally:
+            self.finished = time.monotonic()
+            if self.state == "running":
+                self.state = "cancelled" if self._stop.is_set() else "done"
+            if self.local is not None:
+                self.local.flush()
+            self._save_checkpoint()
+            self._after_import()
+        return self.stats()
+
+    def _after_import(self):
+        """ให้ rollup คำนวณช่วงที่เพิ่งได้ข้อมูลย้อนหลังใหม่"""
+        if self.influx is not None and self.oldest_ms is not None and self.influx.rollups:
+            self.influx.rollups.invalidate_from(datetime.fromtimestamp(self.oldest_ms / 1000, tz=timezone.utc))
+
+    def cancel(self):
+        self._stop.set()
+
+    def progress(self):
+        span = self.total_bytes - self.data_start
+        return 100.0 if span <= 0 else 100.0 * (self.offset - self.data_start) / span
+
+    def rows_per_second(self):
+        """อัตราของรอบนี้ (ไม่นับแถวที่ import ไปแล้วก่อน resume)"""
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return (self.rows - self._start_rows) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        elapsed = None
+        if self.started is not None:
+            elapsed = round((self.finished or time.monotonic()) - self.started, 2)
+        return {
+            "path": os.path.abspath(self.path),
+            "state": self.state,
+            "error": self.error,
+            "targets": [name for name, target in (("influxdb", self.influx), ("local", self.local)) if target],
+            "columns": {self.header[i]: name for i, name in self.columns.items()},
+            "workers": self.workers,
+            "offset": self.offset,
+            "total_bytes": self.total_bytes,
+            "progress": round(self.progress(), 2),
+            "resumed_from": self.resumed_from,
+            "rows": self.rows,
+            "points": self.points,
+            "local_points": self.local_points,
+            "bad_rows": self.bad_rows,
+            "elapsed_seconds": elapsed,
+            "rows_per_second": round(self.rows_per_second(), 1),
+        }
+
+
+# import ที่สั่งผ่าน API (path -> CsvImporter)
+import_jobs = {}
+
+
+def parse_mapping(items):
+    """["CSV column=parameter", ...] -> dict"""
+    mapping = {}
+    for item in items or []:
+        column, sep, parameter = item.partition("=")
+        if not sep or not column.strip() or not parameter.strip():
+            raise ValueError(f"invalid mapping {item!r} (expected 'column=parameter')")
+        mapping[column.strip()] = parameter.strip()
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical CSV logs into the sensor data store")
+    parser.add_argument("files", nargs="+", help="CSV files with a timestamp column and one column per parameter")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk-mb", type=float, default=8)
+    parser.add_argument("--batch-size", type=int, default=5000, help="line protocol records per InfluxDB write")
+    parser.add_argument("--map", action="append", metavar="COLUMN=PARAMETER", help="explicit column mapping (repeatable)")
+    parser.add_argument("--only-mapped", action="store_true", help="skip columns not found in gas_config or --map")
+    parser.add_argument("--device", default="import", help="device tag for the wide schema")
+    parser.add_argument("--utc", action="store_true", help="timestamps without an offset are UTC (default: local time)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="show the column mapping and exit")
+    args = parser.parse_args()
+
+    if influx_manager.enabled and not args.dry_run and not influx_manager.connect():
+        if storage_config['backend'] == 'influxdb':
+            raise SystemExit("❌ InfluxDB not available")
+        print("⚠️ InfluxDB not available, importing into the local store only")
+    try:
+        mapping = parse_mapping(args.map)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+
+    for path in args.files:
+        importer = CsvImporter(path, args.workers, args.chunk_mb, args.batch_size, args.utc, args.device,
+                               mapping, args.only_mapped, restart=args.restart)
+        if args.dry_run:
+            print(json.dumps({"path": path, "timestamp": importer.header[importer.timestamp_index],
+                              "columns": importer.stats()["columns"], "targets": importer.stats()["targets"]},
+                             ensure_ascii=False, indent=2))
+            continue
+        print(f"🔁 Importing {path} ({importer.total_bytes / 1e6:.1f} MB) with {importer.workers} workers")
+        try:
+            result = importer.run(report_interval=5.0)
+        except KeyboardInterrupt:
+            importer.cancel()
+            print(f"🛑 Stopped at {importer.progress():.1f}%; run again to resume from the checkpoint")
+            break
+        print(f"✅ {result['rows']} rows, {result['points']} values in {result['elapsed_seconds']}s "
+              f"({result['rows_per_second']:.0f} rows/s, {result['bad_rows']} bad rows)")
+    local_store.close()
+    if influx_manager.connected:
+        influx_manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,51 @@
-import json
+import asyncio
 import os
-from datetime import datetime
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-from influxdb_client.client.exceptions import InfluxDBError
-
-# Config file path (original relative)
-CONFIG_FILE = "config.json"
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from influx_writer import InfluxBatchWriter
+from influx_spool import WriteAheadSpool
+from rollup_service import RollupScheduler
+from live_store import live_store
+from alert_index import alert_index
+from storage_backend import SensorStorage
+from query_cache import query_cache
+from local_store import LocalColumnStore
+import downsampling
+from line_protocol import LineProtocolEncoder, NARROW_MEASUREMENT, WIDE_MEASUREMENT
+from config_store import CONFIG_FILE, config_store
+from metrics import (
+    Timer, influx_write_seconds, influx_query_seconds,
+    influx_points_written, influx_points_dropped, influx_queue_depth
+)
+import log_level
 
 def load_config():
-    """โหลด config จากไฟล์"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"❌ Error loading config: {e}")
-        return None
+    """config ปัจจุบัน (snapshot ในหน่วยความจำ แก้ไขไม่ได้ โหลดใหม่เมื่อไฟล์เปลี่ยน)"""
+    return config_store.get()
+
+# (config snapshot, thresholds) ล่าสุด คำนวณใหม่เฉพาะเมื่อ snapshot เปลี่ยน
+_thresholds_cache = (None, {})
+
+def get_alarm_thresholds(config=None):
+    """รวม alarm threshold ของทุกพารามิเตอร์ (gas_config มีความสำคัญสูงสุด)"""
+    global _thresholds_cache
+    config = config or load_config() or {}
+    if _thresholds_cache[0] is config:
+        return dict(_thresholds_cache[1])
+    connection = config.get('connection', {})
+    thresholds = {}
+    for source in (config.get('alarm_threshold'),
+                   connection.get('alarm_threshold'),
+                   connection.get('parameter_threshold')):
+        if isinstance(source, dict):
+            thresholds.update({k: v for k, v in source.items() if v is not None})
+    gas_config = config.get('gas_config', {})
+    for gas in list(gas_config.get('default_gases', [])) + list(gas_config.get('additional_gases', [])):
+        if gas.get('name') and gas.get('alarm_threshold') is not None:
+            thresholds[gas['name']] = gas['alarm_threshold']
+    _thresholds_cache = (config, thresholds)
+    return dict(thresholds)
 
 def get_influx_config():
     """ดึง InfluxDB config"""
@@ -25,7 +55,7 @@ def get_influx_config():
     
     influx_config = config.get('influxdb', {})
     if not influx_config:
-        print("❌ No InfluxDB configuration found")
+        log_level.error("❌ No InfluxDB configuration found")
         return None
     
     return {
@@ -33,24 +63,92 @@ def get_influx_config():
         'token': influx_config.get('token', ''),
         'org': influx_config.get('org', 'CEMS'),
         'bucket': influx_config.get('bucket', 'cems_data'),
-        'agg_bucket': influx_config.get('agg_bucket', influx_config.get('bucket', 'cems_data'))
+        'agg_bucket': influx_config.get('agg_bucket', influx_config.get('bucket', 'cems_data')),
+        'writer': influx_config.get('writer', {}),
+        'spool': influx_config.get('spool', {}),
+        'rollup': influx_config.get('rollup', {}),
+        # narrow = แถวละพารามิเตอร์ (แบบเดิม), wide = แถวเดียวต่ออุปกรณ์, dual = เขียนทั้งสองแบบระหว่าง migrate
+        'schema': influx_config.get('schema', 'narrow'),
+        'round_digits': influx_config.get('round_digits', 1),
+        'reconnect_interval': config.get('connection', {}).get('reconnect_interval', 5)
     }
 
-class InfluxDBManager:
+# backend ของข้อมูลเซ็นเซอร์: influxdb (เดิม), local (ไม่ใช้ InfluxDB) หรือ auto
+# (เขียนทั้งสองที่ อ่านจาก InfluxDB เมื่อเชื่อมต่ออยู่ ไม่เช่นนั้นอ่านจาก local store)
+STORAGE_BACKENDS = ("influxdb", "local", "auto")
+
+def get_storage_config():
+    """ดึง storage config"""
+    storage = (load_config() or {}).get('storage', {})
+    backend = storage.get('backend', 'auto')
+    if backend not in STORAGE_BACKENDS:
+        log_level.warning(f"⚠️ Unknown storage backend {backend!r}, using auto")
+        backend = 'auto'
+    return {'backend': backend, 'local': storage.get('local', {})}
+
+storage_config = get_storage_config()
+
+class InfluxDBManager(SensorStorage):
+    name = "influxdb"
+
     def __init__(self):
         self.client = None
         self.write_api = None
         self.query_api = None
+        self.writer = None
+        # ค่าเฉลี่ย compliance block เขียนลง agg_bucket ผ่าน writer/spool ของตัวเอง
+        self.agg_writer = None
         self.config = get_influx_config()
         self.connected = False
+        # storage.backend = local: ไม่เชื่อมต่อและไม่ spool ข้อมูลไว้รอ InfluxDB
+        self.enabled = storage_config['backend'] != 'local'
+        config = self.config or {}
+        self.encoder = LineProtocolEncoder(config.get('schema', 'narrow'), config.get('round_digits', 1))
+        # เก็บข้อมูลลงดิสก์ระหว่างที่ InfluxDB ใช้งานไม่ได้
+        # spool เปิดเฉพาะ process ที่เป็นเจ้าของการเขียน (open_spool) process อื่นใช้ query อย่างเดียว
+        self.spool = None
+        self.agg_spool = None
+        self._recovery_thread = None
+        self._recovery_stop = threading.Event()
+        self._alert_load_lock = threading.Lock()
+        # rollup 1m/1h ลง agg_bucket
+        self.rollups = None
+        if self.config:
+            self.rollups = RollupScheduler(self, get_alarm_thresholds, **self.config['rollup'])
+            if self.enabled:
+                # ช่วงเวลาที่ writer (ใน process ใดก็ได้) ยัง retry อยู่หรือยังไม่ถูก rollup ห้าม cache ถาวร
+                writer_delay = InfluxBatchWriter(None, **self.config['writer']).worst_case_delay()
+                query_cache.settle_after(max(writer_delay, self.rollups.lateness))
         
+    @property
+    def owner(self):
+        """process นี้เป็นผู้เขียนข้อมูล (มี writer, spool, recovery replay และ rollup)"""
+        return self.spool is not None
+
+    def open_spool(self):
+        """เปิด spool บนดิสก์ (ทำให้ process นี้เป็นเจ้าของ spool มีได้ process เดียว)"""
+        if self.spool is None and self.enabled:
+            spool_config = dict((self.config or {}).get('spool', {}))
+            self.spool = WriteAheadSpool(**spool_config)
+            spool_config['directory'] = os.path.join(spool_config.get('directory', 'spool'), 'compliance')
+            self.agg_spool = WriteAheadSpool(**spool_config)
+
     def connect(self):
         """เชื่อมต่อ InfluxDB"""
+        if not self.enabled:
+            log_level.info("ℹ️ InfluxDB disabled (storage.backend = local)")
+            return False
         if not self.config:
-            print("❌ No InfluxDB configuration")
+            log_level.error("❌ No InfluxDB configuration")
             return False
             
         try:
+            # influxdb_client import ช้า (urllib3, reactivex ฯลฯ) จึง import เมื่อเชื่อมต่อครั้งแรก
+            from influxdb_client import InfluxDBClient
+            from influxdb_client.client.write_api import SYNCHRONOUS
+
+            if self.client:
+                self.client.close()
             self.client = InfluxDBClient(
                 url=self.config['url'],
                 token=self.config['token'],
@@ -63,168 +161,486 @@ class InfluxDBManager:
                 self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
                 self.query_api = self.client.query_api()
                 self.connected = True
-                print(f"✅ Connected to InfluxDB: {self.config['url']}")
+                if self.owner:
+                    self._start_writer()
+                log_level.info(f"✅ Connected to InfluxDB: {self.config['url']}")
                 return True
             else:
-                print(f"❌ InfluxDB health check failed: {health.message}")
+                log_level.error(f"❌ InfluxDB health check failed: {health.message}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Error connecting to InfluxDB: {e}")
+            log_level.error(f"❌ Error connecting to InfluxDB: {e}")
             return False
     
+    def _start_writer(self):
+        """เริ่ม background writer สำหรับเขียนข้อมูลแบบ batch"""
+        if self.writer is None:
+            self.writer = InfluxBatchWriter(
+                self._write_batch,
+                fallback_fn=self._spool_failed_batch,
+                **self.config['writer']
+            )
+            self.agg_writer = InfluxBatchWriter(
+                self._write_agg_batch,
+                fallback_fn=self._spool_failed_agg_batch,
+                **self.config['writer']
+            )
+        self.writer.start()
+        self.agg_writer.start()
+
+    def _write_batch(self, records, bucket=None):
+        """เขียน batch ลง InfluxDB (เรียกจาก writer thread)"""
+        with Timer(influx_write_seconds):
+            self.write_api.write(
+                bucket=bucket or self.config['bucket'],
+                org=self.config['org'],
+                record=records
+            )
+
+    def _write_agg_batch(self, records):
+        self._write_batch(records, self.config['agg_bucket'])
+
+    def write_lines(self, records):
+        """เขียน line protocol ลง bucket ทันที ไม่ผ่านคิวของ writer (งาน bulk เช่น import ย้อนหลัง)"""
+        self._write_batch(records)
+
+    def _query(self, query, kind):
+        """query_api.query พร้อมบันทึก latency แยกตามชนิด query"""
+        with Timer(influx_query_seconds.labels(kind)):
+            return self.query_api.query(query)
+
+    def _spool_failed_batch(self, records, spool=None):
+        """batch ที่เขียนไม่สำเร็จ ให้เก็บลง spool และถือว่าหลุดการเชื่อมต่อ"""
+        (spool or self.spool).append(records)
+        if self.connected:
+            self.connected = False
+            log_level.warning("⚠️ InfluxDB write failed, spooling data to disk")
+
+    def _spool_failed_agg_batch(self, records):
+        self._spool_failed_batch(records, self.agg_spool)
+
+    def _replay_write(self, records, bucket=None, spool=None):
+        """เขียนข้อมูลจาก spool ข้าม batch ที่ InfluxDB ปฏิเสธถาวร (4xx)"""
+        from influxdb_client.client.exceptions import InfluxDBError
+
+        try:
+            self._write_batch(records, bucket)
+        except InfluxDBError as e:
+            status = getattr(e.response, 'status', None)
+            if status and 400 <= status < 500 and status != 429:
+                (spool or self.spool).rejected += len(records)
+                log_level.error(f"❌ InfluxDB rejected {len(records)} spooled points: {e}")
+                return
+            raise
+
+    def replay_spool(self):
+        """ส่งข้อมูลที่ค้างใน spool เข้า InfluxDB"""
+        if not self.connected or not self.owner:
+            return 0
+        if self.agg_spool.has_backlog():
+            try:
+                self.agg_spool.replay(
+                    lambda records: self._replay_write(records, self.config['agg_bucket'], self.agg_spool))
+            except Exception as e:
+                log_level.error(f"❌ Error replaying compliance spool: {e}")
+        if not self.spool.has_backlog():
+            return 0
+        try:
+            replayed = self.spool.replay(self._replay_write)
+        except Exception as e:
+            log_level.error(f"❌ Error replaying spool: {e}")
+            return 0
+        oldest = self.spool.last_replay_oldest_ns
+        if replayed and oldest and self.rollups:
+            # คำนวณ rollup ของช่วงที่เพิ่งได้ข้อมูลใหม่
+            self.rollups.invalidate_from(datetime.fromtimestamp(oldest / 1e9, tz=timezone.utc))
+        return replayed
+
+    def start_recovery(self):
+        """เริ่ม thread สำหรับ reconnect และ replay spool"""
+        if self._recovery_thread and self._recovery_thread.is_alive():
+            return
+        self._recovery_stop.clear()
+        self._recovery_thread = threading.Thread(
+            target=self._recovery_loop, name="influx-recovery", daemon=True
+        )
+        self._recovery_thread.start()
+
+    def _recovery_loop(self):
+        interval = (self.config or {}).get('reconnect_interval', 5)
+        while not self._recovery_stop.wait(interval):
+            if self.owner:
+                self.spool.sync()
+                self.agg_spool.sync()
+            if not self.connected and self.config:
+                self.connect()
+            if self.connected:
+                self.replay_spool()
+
+    def shutdown(self):
+        """หยุด background thread ทั้งหมดและปิดการเชื่อมต่อ"""
+        self._recovery_stop.set()
+        if self.rollups:
+            self.rollups.stop()
+        if self._recovery_thread:
+            self._recovery_thread.join(5)
+            self._recovery_thread = None
+        self.disconnect()
+        if self.owner:
+            self.spool.close()
+            self.agg_spool.close()
+
+    def get_writer_stats(self):
+        """สถิติของ background writer"""
+        if self.writer is None:
+            return {"running": False}
+        return {**self.writer.stats(), "compliance": self.agg_writer.stats()}
+
+    def get_spool_stats(self):
+        """สถิติของ spool บนดิสก์"""
+        if not self.owner:
+            return {"owner": False}
+        return {**self.spool.stats(), "compliance": self.agg_spool.stats()}
+
+    def get_rollup_stats(self):
+        """สถิติของ rollup scheduler"""
+        if self.rollups is None:
+            return {"enabled": False}
+        return self.rollups.stats()
+
     def disconnect(self):
         """ปิดการเชื่อมต่อ"""
+        if self.writer:
+            self.writer.stop()
+            self.agg_writer.stop()
         if self.client:
             self.client.close()
             self.connected = False
-            print("🔌 Disconnected from InfluxDB")
+            log_level.info("🔌 Disconnected from InfluxDB")
     
-    def save_sensor_data(self, data):
-        """บันทึกข้อมูลเซ็นเซอร์"""
-        if not self.connected:
-            print(" Not connected to InfluxDB")
-            return False
-            
+    @property
+    def raw_measurement(self):
+        return WIDE_MEASUREMENT if self.read_schema == 'wide' else NARROW_MEASUREMENT
+
+    @property
+    def read_schema(self):
+        """schema ที่ใช้ query ข้อมูลดิบ (dual ยังอ่านจาก narrow จนกว่า migrate เสร็จ)"""
+        return 'wide' if self.encoder.schema == 'wide' else 'narrow'
+
+    def save_sensor_data(self, data, device=None, ts=None):
+        """บันทึกข้อมูลเซ็นเซอร์ (line protocol ก้อนเดียวต่อ sample ตาม schema ที่ตั้งไว้)"""
         try:
-            # สร้าง Point สำหรับแต่ละพารามิเตอร์
-            points = []
-            timestamp = datetime.utcnow()
-            
-            for key, value in data.items():
-                if value is not None and key != 'timestamp':
-                    try:
-                        float_value = float(value)
-                        # ปัดเศษเป็น 1 ตำแหน่งสำหรับการแสดงผล
-                        rounded_value = round(float_value, 1)
-                        point = Point("sensor_data") \
-                            .tag("parameter", key) \
-                            .field("value", rounded_value) \
-                            .time(timestamp)
-                        points.append(point)
-                    except (ValueError, TypeError):
-                        continue
-            
-            if points:
-                self.write_api.write(
-                    bucket=self.config['bucket'],
-                    org=self.config['org'],
-                    record=points
-                )
-                print(f" Saved {len(points)} data points to InfluxDB")
+            if 'timestamp' in data:
+                data = {k: v for k, v in data.items() if k != 'timestamp'}
+            ts_ns = time.time_ns() if ts is None else int(ts * 1e9)
+            record, fields = self.encoder.encode(data, device, ts_ns)
+            if fields:
+                if self.connected and self.writer:
+                    # ใส่คิวแล้วกลับทันที writer thread จะเขียนเป็น batch
+                    self.writer.submit([record])
+                elif self.owner:
+                    # InfluxDB ใช้งานไม่ได้ เก็บลง spool ไว้ replay ภายหลัง
+                    self.spool.append([record])
                 return True
             else:
-                print(" No valid data points to save")
+                log_level.debug(" No valid data points to save")
                 return False
                 
         except Exception as e:
-            print(f" Error saving to InfluxDB: {e}")
+            log_level.error(f"❌ Error saving to InfluxDB: {e}")
             return False
     
-    def save_system_alert(self, alert_data):
-        """บันทึกระบบแจ้งเตือน"""
-        if not self.connected:
+    def save_compliance_blocks(self, blocks):
+        """บันทึกค่าเฉลี่ย block จาก compliance engine ลง agg_bucket (compliance_{window})
+
+        ผ่าน writer เหมือนข้อมูลเซ็นเซอร์ ระหว่างที่ InfluxDB ใช้งานไม่ได้เก็บลง spool ไว้ replay
+        """
+        if not self.enabled or not self.config or not blocks:
             return False
-            
+        from influxdb_client import Point
+
+        try:
+            points = [
+                Point(f"compliance_{block['window']}")
+                .tag("parameter", block['parameter'])
+                .field("mean", float(block['mean']))
+                .field("count", int(block['count']))
+                .field("availability", float(block['availability']))
+                .time(datetime.fromtimestamp(block['start'], tz=timezone.utc))
+                for block in blocks
+            ]
+            if self.connected and self.agg_writer:
+                self.agg_writer.submit(points)
+            elif self.owner:
+                self.agg_spool.append(points)
+            else:
+                return False
+            return True
+        except Exception as e:
+            log_level.error(f"❌ Error saving compliance averages: {e}")
+            return False
+
+    def save_system_alert(self, alert_data):
+        """บันทึกระบบแจ้งเตือน (เข้า index ทันที ส่วน InfluxDB เขียนเป็น batch ผ่าน writer)"""
+        from influxdb_client import Point
+
         try:
+            ts = alert_data.get('time') or datetime.now(timezone.utc).timestamp()
+            alert = {
+                'time': ts,
+                'type': alert_data.get('type', 'general'),
+                'message': alert_data.get('message', ''),
+                'level': alert_data.get('level', 'info'),
+            }
             point = Point("system_alerts") \
-                .tag("type", alert_data.get('type', 'general')) \
-                .field("message", alert_data.get('message', '')) \
-                .field("level", alert_data.get('level', 'info')) \
-                .time(datetime.utcnow())
-            
-            self.write_api.write(
-                bucket=self.config['bucket'],
-                org=self.config['org'],
-                record=point
-            )
+                .tag("type", alert['type']) \
+                .field("message", alert['message']) \
+                .field("level", alert['level']) \
+                .time(datetime.fromtimestamp(ts, tz=timezone.utc))
+            for key in ('parameter', 'state'):
+                if alert_data.get(key) is not None:
+                    alert[key] = alert_data[key]
+                    point.tag(key, alert[key])
+            for key in ('value', 'limit'):
+                if alert_data.get(key) is not None:
+                    alert[key] = float(alert_data[key])
+                    point.field(key, alert[key])
+            alert_index.add(alert)
+
+            if self.connected and self.writer:
+                self.writer.submit([point])
+            elif self.owner:
+                self.spool.append([point])
             return True
-            
+
         except Exception as e:
-            print(f"❌ Error saving alert to InfluxDB: {e}")
+            log_level.error(f"❌ Error saving alert to InfluxDB: {e}")
             return False
-    
+
+    def load_alert_index(self):
+        """โหลด alert ย้อนหลังจาก InfluxDB เข้า index (ครั้งเดียวหลังเชื่อมต่อได้)
+
+        request ที่มาพร้อมกันรอการโหลดครั้งเดียวกัน (ไม่โหลดซ้ำ)
+        """
+        with self._alert_load_lock:
+            if alert_index.loaded or not self.connected:
+                return alert_index.loaded
+            days = max(1, int(alert_index.retention // 86400))
+            query = f'''
+            from(bucket: {downsampling.flux_string(self.config['bucket'])})
+                |> range(start: -{days}d)
+                |> filter(fn: (r) => r["_measurement"] == "system_alerts")
+                |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+            '''
+            try:
+                # pivot คืนหนึ่ง table ต่อชุด tag จึงได้ข้อมูลสลับเวลากัน เก็บทั้งหมดแล้วเรียงครั้งเดียว
+                alerts = []
+                for table in self._query(query, 'alerts'):
+                    for record in table.records:
+                        alert = {
+                            'time': record.get_time().timestamp(),
+                            'type': record.values.get('type', 'general'),
+                            'message': record.values.get('message', ''),
+                            'level': record.values.get('level', 'info'),
+                        }
+                        for key in ('parameter', 'state', 'value', 'limit'):
+                            if record.values.get(key) is not None:
+                                alert[key] = record.values[key]
+                        alerts.append(alert)
+                alert_index.load(alerts)
+            except Exception as e:
+                log_level.error(f"❌ Error loading alerts: {e}")
+            return alert_index.loaded
+
     def get_latest_data(self, parameter=None, limit=1):
-        """ดึงข้อมูลล่าสุด"""
+        """ดึงข้อมูลล่าสุด (จากหน่วยความจำ ถ้ายังไม่มีจึง query InfluxDB)"""
+        latest = live_store.get_latest(parameter)
+        if latest:
+            return latest
         if not self.connected:
             return None
             
         try:
-            if parameter:
-                query = f'''
-                from(bucket: "{self.config['bucket']}")
-                    |> range(start: -1h)
-                    |> filter(fn: (r) => r["_measurement"] == "sensor_data")
-                    |> filter(fn: (r) => r["parameter"] == "{parameter}")
-                    |> last()
-                '''
-            else:
-                query = f'''
-                from(bucket: "{self.config['bucket']}")
-                    |> range(start: -1h)
-                    |> filter(fn: (r) => r["_measurement"] == "sensor_data")
-                    |> last()
-                '''
+            source = "\n".join(downsampling.sensor_source([parameter] if parameter else None, self.read_schema))
+            query = f'''
+            from(bucket: "{self.config['bucket']}")
+                |> range(start: -1h)
+{source}
+                |> last()
+            '''
             
-            result = self.query_api.query(query)
+            result = self._query(query, 'latest')
             
             if result:
                 data = {}
                 for table in result:
                     for record in table.records:
-                        param = record.get_value()
-                        value = record.get_field()
-                        data[param] = value
+                        data[record.values.get("parameter")] = record.get_value()
                 return data
             return None
             
         except Exception as e:
-            print(f"❌ Error querying InfluxDB: {e}")
+            log_level.error(f"❌ Error querying InfluxDB: {e}")
             return None
     
-    def get_system_alerts(self, hours=24):
-        """ดึงระบบแจ้งเตือน"""
-        if not self.connected:
-            return []
-            
-        try:
+    def thresholds(self):
+        return get_alarm_thresholds()
+
+    def fetch_bucket_rows(self, parameters, start, stop, every, thresholds, configured=True):
+        """bucket ของช่วง [start, stop) (เรียกผ่าน query_history_buckets/query_cache)
+
+        ช่วงที่ rollup ครอบคลุมแล้ว ([coverage, watermark)) อ่านจาก rollup ที่หยาบที่สุด
+        ที่ใช้ได้ ช่วงก่อน coverage (เก่ากว่าที่ backfill ไว้) และส่วนท้ายที่ยังไม่ถูก rollup
+        อ่านจากข้อมูลดิบแล้วรวมกัน
+        """
+        # rollup คำนวณด้วย threshold จาก config จึงใช้ไม่ได้ถ้ามีการ override
+        tier = self.rollups.route(every) if self.rollups and configured else None
+        start = datetime.fromtimestamp(start, tz=timezone.utc)
+        stop = datetime.fromtimestamp(stop, tz=timezone.utc)
+        raw_ranges = [(start, stop)]
+        rows = {}
+        if tier:
+            coverage, watermark = self.rollups.span(tier)
+            lower, upper = max(start, coverage), min(watermark, stop)
+            if lower < upper:
+                raw_ranges = [(start, lower), (upper, stop)]
+                query = downsampling.build_rollup_query(
+                    self.config['agg_bucket'], tier.measurement, parameters,
+                    downsampling.flux_time(lower), downsampling.flux_time(upper), every
+                )
+                downsampling.merge_bucket_rows(self._query(query, 'history_rollup'), rows)
+            else:
+                tier = None
+        for lower, upper in raw_ranges:
+            if lower >= upper:
+                continue
+            query = downsampling.build_bucket_query(
+                self.config['bucket'], parameters,
+                downsampling.flux_time(lower), downsampling.flux_time(upper), every, thresholds, self.read_schema
+            )
+            downsampling.merge_bucket_rows(self._query(query, 'history_raw'), rows)
+        source = tier.measurement if tier else 'raw'
+        return rows, source
+
+    def get_first_timestamp(self, start="0"):
+        """เวลาของข้อมูลเซ็นเซอร์จุดแรกใน bucket"""
+        query = f'''
+        from(bucket: "{self.config['bucket']}")
+            |> range(start: {start})
+            |> filter(fn: (r) => r["_measurement"] == "{self.raw_measurement}")
+            |> group()
+            |> first()
+        '''
+        for table in self._query(query, 'first_timestamp'):
+            for record in table.records:
+                return record.get_time()
+        return None
+
+    def get_parameter_names(self):
+        """รายชื่อพารามิเตอร์ทั้งหมดที่มีใน bucket"""
+        if self.read_schema == 'wide':
+            query = f'''
+            import "influxdata/influxdb/schema"
+            schema.measurementFieldKeys(bucket: "{self.config['bucket']}", measurement: "{WIDE_MEASUREMENT}")
+            '''
+        else:
+            query = f'''
+            import "influxdata/influxdb/schema"
+            schema.tagValues(bucket: "{self.config['bucket']}", tag: "parameter")
+            '''
+        return [record.get_value() for table in self._query(query, 'parameter_names') for record in table.records]
+
+    def iter_sensor_rows(self, fields, start, stop, chunk_hours=24):
+        """อ่านข้อมูลเป็นแถว (time, {parameter: value}) เรียงตามเวลา
+
+        แบ่ง query ทีละช่วง chunk_hours และอ่านแบบ stream
+        หน่วยความจำจึงคงที่ไม่ว่าช่วงเวลาจะยาวแค่ไหน
+        """
+        chunk = timedelta(hours=chunk_hours)
+        cursor = start
+        while cursor < stop:
+            end = min(cursor + chunk, stop)
+            source = "\n".join(downsampling.sensor_source(fields, self.read_schema))
             query = f'''
             from(bucket: "{self.config['bucket']}")
-                |> range(start: -{hours}h)
-                |> filter(fn: (r) => r["_measurement"] == "system_alerts")
-                |> sort(columns: ["_time"], desc: true)
-                |> limit(n: 100)
+                |> range(start: {downsampling.flux_time(cursor)}, stop: {downsampling.flux_time(end)})
+{source}
+                |> pivot(rowKey: ["_time"], columnKey: ["parameter"], valueColumn: "_value")
+                |> group()
+                |> sort(columns: ["_time"])
             '''
-            
-            result = self.query_api.query(query)
-            alerts = []
-            
-            for table in result:
-                for record in table.records:
-                    alerts.append({
-                        'time': record.get_time(),
-                        'type': record.get_value(),
-                        'message': record.get_field(),
-                        'level': record.get_field()
-                    })
-            
-            return alerts
-            
-        except Exception as e:
-            print(f"❌ Error querying alerts: {e}")
-            return []
+            for record in self.query_api.query_stream(query):
+                yield record.get_time(), {field: record.values.get(field) for field in fields}
+            cursor = end
+
+    def latest_rows(self, fields, limit=100, hours=24):
+        """แถวล่าสุด (time, {parameter: value}) ใหม่สุดก่อน"""
+        source = "\n".join(downsampling.sensor_source(fields, self.read_schema))
+        query = f'''
+        from(bucket: "{self.config['bucket']}")
+            |> range(start: -{downsampling.flux_duration(max(60, int(float(hours) * 3600)))})
+{source}
+            |> pivot(rowKey: ["_time"], columnKey: ["parameter"], valueColumn: "_value")
+            |> group()
+            |> sort(columns: ["_time"], desc: true)
+            |> limit(n: {int(limit)})
+        '''
+        return [(record.get_time(), {field: record.values.get(field) for field in fields})
+                for table in self._query(query, 'latest_rows') for record in table.records]
+
+    def get_system_alerts(self, hours=24, limit=100, before=None, alert_type=None):
+        """ดึงระบบแจ้งเตือน (ใหม่สุดก่อน) จาก index ในหน่วยความจำ แบ่งหน้าด้วย before"""
+        self.load_alert_index()
+        return alert_index.query(hours, limit, before, alert_type)['alerts']
 
 # Global instance
 influx_manager = InfluxDBManager()
+local_store = LocalColumnStore(get_alarm_thresholds, **storage_config['local'])
+
+def get_sensor_storage():
+    """ที่เก็บข้อมูลเซ็นเซอร์ที่ใช้อ่านตอนนี้ (ตาม storage.backend)"""
+    backend = storage_config['backend']
+    if backend == 'local' or (backend == 'auto' and not influx_manager.connected):
+        return local_store
+    return influx_manager
 
 # Functions for main.py
-async def init_influx_database():
-    """เริ่มต้น InfluxDB"""
-    return influx_manager.connect()
+async def init_influx_database(owner=True):
+    """เริ่มต้น InfluxDB (health check รันใน thread ไม่ block event loop)
+
+    owner=False (API process เมื่อ acquisition.mode = process): เชื่อมต่อเพื่อ query เท่านั้น
+    spool, การ replay และการคำนวณ rollup เป็นของ acquisition process ที่เดียว
+    """
+    if not influx_manager.enabled:
+        return False
+    if owner:
+        influx_manager.open_spool()
+    connected = await asyncio.to_thread(influx_manager.connect)
+    # reconnect อัตโนมัติ (replay spool เฉพาะ owner)
+    influx_manager.start_recovery()
+    if influx_manager.rollups:
+        if owner:
+            influx_manager.rollups.start()
+        else:
+            influx_manager.rollups.follow()
+    return connected
+
+async def close_influx_database():
+    """flush คิวที่ค้างและปิดการเชื่อมต่อ"""
+    influx_manager.shutdown()
+    local_store.close()
 
-async def save_sensor_data_to_influx(data):
-    """บันทึกข้อมูลเซ็นเซอร์"""
-    return influx_manager.save_sensor_data(data)
+async def save_sensor_data_to_influx(data, device=None, ts=None):
+    """บันทึกข้อมูลเซ็นเซอร์ (InfluxDB และ/หรือ local store ตาม storage.backend)"""
+    saved = influx_manager.save_sensor_data(data, device, ts) if influx_manager.enabled else False
+    if storage_config['backend'] != 'influxdb':
+        saved = local_store.submit(data, device, ts) or saved
+    return saved
+
+async def save_compliance_blocks_to_influx(blocks):
+    """บันทึกค่าเฉลี่ย block (รันใน thread แยก)"""
+    return await asyncio.to_thread(influx_manager.save_compliance_blocks, blocks)
 
 async def save_system_alert_to_influx(alert_data):
     """บันทึกระบบแจ้งเตือน"""
@@ -232,8 +648,54 @@ async def save_system_alert_to_influx(alert_data):
 
 async def get_latest_data_from_influx(parameter=None):
     """ดึงข้อมูลล่าสุด"""
-    return influx_manager.get_latest_data(parameter)
+    return get_sensor_storage().get_latest_data(parameter)
 
-async def get_system_alerts_from_influx(hours=24):
+async def get_system_alerts_from_influx(hours=24, limit=100, before=None, alert_type=None):
     """ดึงระบบแจ้งเตือน"""
-    return influx_manager.get_system_alerts(hours) 
\ No newline at end of file
+    return await asyncio.to_thread(influx_manager.get_system_alerts, hours, limit, before, alert_type)
+
+async def save_system_alerts_to_influx(alerts):
+    """บันทึก alert หลายรายการ (รวมเป็น batch เดียวในคิวของ writer)"""
+    return [influx_manager.save_system_alert(alert) for alert in alerts]
+
+async def get_history_buckets_from_influx(parameters, hours=24, max_points=500,
+                                          method="aggregate", thresholds=None):
+    """ดึงข้อมูลย้อนหลังแบบ bucket (รันใน thread แยกไม่ให้ block event loop)"""
+    return await asyncio.to_thread(
+        get_sensor_storage().query_history_buckets,
+        parameters, hours, max_points, method, thresholds
+    )
+
+async def get_latest_rows_from_storage(fields, limit=100, hours=24):
+    """แถวล่าสุด ใหม่สุดก่อน สำหรับ log preview (ทุก client ใช้ผลเดียวกันภายใน tail_ttl)"""
+    storage = get_sensor_storage()
+    key = ('latest_rows', storage.name, tuple(fields), int(limit), float(hours))
+    return await asyncio.to_thread(
+        query_cache.get, key, lambda: storage.latest_rows(fields, limit, hours),
+        lambda rows: 120 + len(rows) * (160 + 40 * len(fields)), query_cache.tail_ttl
+    )
+
+def _writer_value(attribute):
+    writer = influx_manager.writer
+    return getattr(writer, attribute) if writer is not None else 0
+
+# ตัวนับของ writer มีอยู่แล้ว อ่านตอน scrape แทนการนับซ้ำใน hot path
+influx_points_written.set_function(lambda: _writer_value('written'))
+influx_points_dropped.set_function(lambda: _writer_value('dropped'))
+influx_queue_depth.set_function(lambda: _writer_value('queue_depth'))
+
+def get_influx_writer_stats():
+    """สถิติคิวการเขียน InfluxDB"""
+    return influx_manager.get_writer_stats()
+
+def get_influx_spool_stats():
+    """สถิติ spool ที่รอ replay"""
+    return influx_manager.get_spool_stats()
+
+def get_local_store_stats():
+    """สถิติ local column store"""
+    return {"backend": storage_config['backend'], **local_store.stats()}
+
+def get_influx_rollup_stats():
+    """สถิติ rollup 1m/1h"""
+    return influx_manager.get_rollup_stats() 
\ No newline at end of file
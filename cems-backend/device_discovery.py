@@ -0,0 +1,287 @@
+import asyncio
+import ipaddress
+import time
+
+import log_level
+
+# จำนวน host ที่ยอมให้สแกนต่อครั้ง (กันการสแกนทั้ง /16 โดยไม่ตั้งใจ)
+MAX_HOSTS = 4096
+# unit id ของ Modbus เป็น 1 byte
+MAX_SLAVE_ID = 255
+
+
+def parse_ip_range(value):
+    """แปลง "192.168.1.0/24", "192.168.1.10-192.168.1.50", "192.168.1.10-50" หรือ list เป็น list ของ IP"""
+    if isinstance(value, (list, tuple)):
+        hosts = []
+        for item in value:
+            hosts.extend(parse_ip_range(item))
+        return hosts
+    value = str(value).strip()
+    if "/" in value:
+        network = ipaddress.ip_network(value, strict=False)
+        _check_host_count(network.num_addresses - 2 if network.num_addresses > 2 else network.num_addresses)
+        hosts = [str(ip) for ip in network.hosts()] or [str(network.network_address)]
+    elif "-" in value:
+        first, last = (part.strip() for part in value.split("-", 1))
+        start = ipaddress.ip_address(first)
+        if "." not in last:
+            last = first.rsplit(".", 1)[0] + "." + last
+        end = ipaddress.ip_address(last)
+        if int(end) < int(start):
+            raise ValueError(f"invalid IP range: {value}")
+        _check_host_count(int(end) - int(start) + 1)
+        hosts = [str(ipaddress.ip_address(i)) for i in range(int(start), int(end) + 1)]
+    else:
+        hosts = [str(ipaddress.ip_address(value))]
+    _check_host_count(len(hosts))
+    return hosts
+
+
+def _check_host_count(count):
+    # ตรวจก่อนสร้าง list จะได้ไม่ต้องไล่ทั้ง /8 เพื่อปฏิเสธ
+    if count > MAX_HOSTS:
+        raise ValueError(f"IP range too large ({count} hosts, max {MAX_HOSTS})")
+
+
+def parse_id_range(value, default=1):
+    """slave id: ตัวเลขเดียว, "1-10", "1,3,5-7", {"from": 1, "to": 10} หรือ list ของ id
+
+    list คือ id ที่ระบุทีละตัวเสมอ ([3, 10] = slave 3 และ 10) ช่วงต้องเขียนเป็น "a-b" หรือ
+    {"from", "to"} ผลลัพธ์ไม่มี id ซ้ำ เรียงตามลำดับที่ระบุ
+    """
+    if value is None:
+        value = default
+    if isinstance(value, dict):
+        if "from" not in value or "to" not in value:
+            raise ValueError('slave id range needs "from" and "to"')
+        ids = _id_span(value["from"], value["to"])
+    elif isinstance(value, str):
+        ids = []
+        for part in value.split(","):
+            part = part.strip()
+            if "-" in part:
+                first, last = part.split("-", 1)
+                ids.extend(_id_span(first, last))
+            elif part:
+                ids.append(int(part))
+    elif isinstance(value, (list, tuple)):
+        ids = []
+        for item in value:
+            ids.extend(parse_id_range(item))
+    else:
+        ids = [int(value)]
+    for slave_id in ids:
+        if not 0 <= slave_id <= MAX_SLAVE_ID:
+            raise ValueError(f"invalid slave id: {slave_id}")
+    return list(dict.fromkeys(ids))
+
+
+def _id_span(first, last):
+    first, last = int(first), int(last)
+    if not 0 <= first <= last <= MAX_SLAVE_ID:
+        raise ValueError(f"invalid slave id range: {first}-{last}")
+    return range(first, last + 1)
+
+
+class NegativeCache:
+    """จำ endpoint/slave ที่ไม่ตอบไว้ ttl วินาที ไม่ต้อง probe ซ้ำทุกครั้งที่สแกน"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+
+    def __contains__(self, key):
+        expires = self._entries.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._entries[key]
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, key):
+        self._entries[key] = time.monotonic() + self.ttl
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DeviceDiscovery:
+    """สแกนหาอุปกรณ์ Modbus แบบขนาน
+
+    ขั้นแรกเปิด TCP ไปยังทุก ip:port พร้อมกัน (จำกัดด้วย semaphore) ขั้นที่สอง
+    probe slave id ทีละตัวต่อ endpoint ผ่าน connection เดียว เพื่อไม่ให้ gateway
+    ราคาถูก/RTU ถูกยิงพร้อมกันหลาย transaction จำนวน endpoint ที่ probe พร้อมกัน
+    จำกัดด้วย probe_concurrency ผลลัพธ์ถูกส่งออกทันทีที่พบ
+    """
+
+    def __init__(self, concurrency=128, probe_concurrency=16, connect_timeout=0.5, probe_timeout=0.5,
+                 negative_ttl=300, tcp_client=None, serial_client=None):
+        self.concurrency = concurrency
+        self.probe_concurrency = probe_concurrency
+        self.connect_timeout = connect_timeout
+        self.probe_timeout = probe_timeout
+        self.negative = NegativeCache(negative_ttl)
+        self.tcp_client = tcp_client
+        self.serial_client = serial_client
+        self.scans = 0
+
+    async def _port_open(self, ip, port, timeout):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _probe(self, client, slave_id, register_type, address, timeout):
+        """คืน dict ของอุปกรณ์ที่ตอบ หรือ None"""
+        try:
+            if register_type == "input":
+                request = client.read_input_registers(address=address, count=1, slave=slave_id)
+            else:
+                request = client.read_holding_registers(address=address, count=1, slave=slave_id)
+            res = await asyncio.wait_for(request, timeout)
+        except Exception:
+            return None
+        if res is None:
+            return None
+        if res.isError():
+            # ตอบเป็น exception response (เช่น illegal address) แปลว่ามีอุปกรณ์อยู่
+            return {"slaveId": slave_id, "responding": True, "value": None,
+                    "exception": getattr(res, "exception_code", None)}
+        return {"slaveId": slave_id, "responding": True, "value": res.registers[0]}
+
+    async def _scan_slaves(self, client, key_prefix, slave_ids, register_type, address, timeout):
+        for slave_id in slave_ids:
+            key = key_prefix + (slave_id,)
+            if key in self.negative:
+                continue
+            found = await self._probe(client, slave_id, register_type, address, timeout)
+            if found is None:
+                self.negative.add(key)
+                if not client.connected:
+                    return
+                continue
+            yield found
+
+    async def scan(self, request):
+        """async generator ของ event: {"type": "hit" | "progress" | "done" | "error", ...}"""
+        self.scans += 1
+        started = time.monotonic()
+        mode = request.get("mode", "tcp")
+        slave_ids = parse_id_range(request.get("slave_ids", request.get("slaveIds")))
+        register_type = request.get("register_type", request.get("registerType", "holding"))
+        address = int(request.get("address", 0))
+        probe_timeout = float(request.get("timeout", self.probe_timeout))
+        if request.get("refresh"):
+            self.negative.clear()
+
+        if mode == "rtu":
+            events = self._scan_serial(request, slave_ids, register_type, address, probe_timeout)
+        else:
+            events = self._scan_tcp(request, slave_ids, register_type, address, probe_timeout)
+        found = 0
+        async for event in events:
+            if event["type"] == "hit":
+                found += 1
+            yield event
+        yield {"type": "done", "found": found, "elapsed": round(time.monotonic() - started, 3)}
+
+    async def _scan_serial(self, request, slave_ids, register_type, address, timeout):
+        port = request.get("comPort", request.get("port"))
+        baudrate = int(request.get("baudrate", 9600))
+        if self.serial_client is None:
+            from pymodbus.client import AsyncModbusSerialClient
+            self.serial_client = AsyncModbusSerialClient
+        client = self.serial_client(port=port, baudrate=baudrate, timeout=timeout)
+        try:
+            await asyncio.wait_for(client.connect(), max(timeout, 1.0))
+            if not client.connected:
+                yield {"type": "error", "message": f"cannot open {port}"}
+                return
+            async for hit in self._scan_slaves(client, ("rtu", port, baudrate), slave_ids,
+                                               register_type, address, timeout):
+                yield {"type": "hit", "mode": "rtu", "comPort": port, "baudrate": baudrate, **hit}
+        finally:
+            client.close()
+
+    async def _scan_tcp(self, request, slave_ids, register_type, address, timeout):
+        hosts = parse_ip_range(request.get("ip_range", request.get("ipRange", request.get("ip", "127.0.0.1"))))
+        ports = [int(p) for p in request.get("ports", [request.get("port", 502)])]
+        connect_timeout = float(request.get("connect_timeout", self.connect_timeout))
+        semaphore = asyncio.Semaphore(int(request.get("concurrency", self.concurrency)))
+        # probe slave ใช้เวลานาน (สูงสุด slave ids x timeout ต่อ endpoint) จำกัด connection Modbus แยกต่างหาก
+        probe_semaphore = asyncio.Semaphore(int(request.get("probe_concurrency", self.probe_concurrency)))
+        if self.tcp_client is None:
+            from pymodbus.client import AsyncModbusTcpClient
+            self.tcp_client = AsyncModbusTcpClient
+        queue = asyncio.Queue()
+        total = len(hosts) * len(ports)
+
+        async def scan_endpoint(ip, port):
+            key = ("tcp", ip, port)
+            try:
+                if key in self.negative:
+                    return
+                async with semaphore:
+                    if not await self._port_open(ip, port, connect_timeout):
+                        self.negative.add(key)
+                        return
+                # slave ของ endpoint เดียวกัน probe ทีละตัวบน connection เดียว
+                async with probe_semaphore:
+                    client = self.tcp_client(ip, port=port, timeout=timeout)
+                    try:
+                        await asyncio.wait_for(client.connect(), connect_timeout)
+                        if not client.connected:
+                            return
+                        async for hit in self._scan_slaves(client, key, slave_ids, register_type, address, timeout):
+                            await queue.put({"type": "hit", "mode": "tcp", "ip": ip, "port": port, **hit})
+                    finally:
+                        client.close()
+            except Exception as e:
+                log_level.warning(f"⚠️ Scan {ip}:{port} failed: {e}")
+            finally:
+                await queue.put({"type": "endpoint_done"})
+
+        tasks = [asyncio.create_task(scan_endpoint(ip, port)) for ip in hosts for port in ports]
+        done = 0
+        try:
+            while done < total:
+                event = await queue.get()
+                if event["type"] == "endpoint_done":
+                    done += 1
+                    if done == total or done % 64 == 0:
+                        yield {"type": "progress", "scanned": done, "total": total}
+                    continue
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "scans": self.scans,
+            "negative_cache": len(self.negative),
+            "negative_hits": self.negative.hits,
+            "concurrency": self.concurrency,
+            "probe_concurrency": self.probe_concurrency,
+        }
+
+
+# Global instance
+device_discovery = DeviceDiscovery()
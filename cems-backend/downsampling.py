@@ -0,0 +1,224 @@
+import math
+
+from line_protocol import NARROW_MEASUREMENT, WIDE_MEASUREMENT
+
+# ความกว้าง bucket ที่อนุญาต (วินาที) เลือกค่าที่เล็กที่สุดที่ไม่ต่ำกว่าที่คำนวณได้
+NICE_STEPS = [
+    1, 2, 5, 10, 15, 30,
+    60, 2 * 60, 5 * 60, 10 * 60, 15 * 60, 30 * 60,
+    3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+    86400, 2 * 86400, 3 * 86400, 7 * 86400, 14 * 86400, 30 * 86400,
+]
+
+# วิธีรวมค่าเมื่อ bucket เดียวกันมาจากหลายแหล่ง (เช่น rollup + raw ช่วงท้าย)
+MERGE_OPS = {
+    "sum": lambda a, b: a + b,
+    "count": lambda a, b: a + b,
+    "alarms": lambda a, b: a + b,
+    "alarm_minutes": lambda a, b: a + b,
+    "min": min,
+    "max": max,
+}
+
+
+def bucket_seconds(range_seconds, max_points):
+    """คำนวณความกว้าง bucket จากช่วงเวลาและจำนวนจุดสูงสุด"""
+    max_points = max(1, int(max_points))
+    raw = max(1, math.ceil(range_seconds / max_points))
+    for step in NICE_STEPS:
+        if step >= raw:
+            return step
+    return int(math.ceil(raw / 86400) * 86400)
+
+
+def flux_duration(seconds):
+    """แปลงวินาทีเป็น duration ของ Flux เช่น 300 -> 5m"""
+    seconds = int(seconds)
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def flux_time(dt):
+    """แปลง datetime (UTC) เป็น time literal ของ Flux"""
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def flux_string(value):
+    """string literal ของ Flux"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def flux_string_set(values):
+    """สร้าง array ของ string สำหรับ contains() ใน Flux"""
+    return "[" + ", ".join(flux_string(v) for v in values) + "]"
+
+
+def alarm_predicate(thresholds):
+    """สร้างเงื่อนไข Flux สำหรับนับค่าที่เกิน threshold ของแต่ละพารามิเตอร์"""
+    clauses = [
+        f'(r["parameter"] == {flux_string(name)} and r["_value"] > {float(limit)})'
+        for name, limit in thresholds.items()
+    ]
+    return " or ".join(clauses)
+
+
+def _range_clause(start, stop):
+    stop_clause = f", stop: {stop}" if stop else ""
+    return f'    |> range(start: {start}{stop_clause})'
+
+
+def _parameter_filter(parameters):
+    if not parameters:
+        return []
+    return [f'    |> filter(fn: (r) => contains(value: r["parameter"], set: {flux_string_set(parameters)}))']
+
+
+def sensor_source(parameters, schema="narrow"):
+    """filter ข้อมูลเซ็นเซอร์ดิบตาม schema ให้ผลลัพธ์มีคอลัมน์ parameter เหมือนกันทุก schema
+
+    wide เก็บพารามิเตอร์เป็น field จึงกรองด้วย _field (push down ได้) แล้ว rename เป็น parameter
+    """
+    if schema != "wide":
+        return [
+            f'    |> filter(fn: (r) => r["_measurement"] == "{NARROW_MEASUREMENT}" and r["_field"] == "value")',
+        ] + _parameter_filter(parameters)
+    lines = [f'    |> filter(fn: (r) => r["_measurement"] == "{WIDE_MEASUREMENT}")']
+    if parameters:
+        fields = " or ".join(f'r["_field"] == {flux_string(p)}' for p in parameters)
+        lines.append(f'    |> filter(fn: (r) => {fields})')
+    lines.append('    |> rename(columns: {_field: "parameter"})')
+    return lines
+
+
+def _window(every, fn, name):
+    return (f' |> aggregateWindow(every: {flux_duration(every)}, fn: {fn}, timeSrc: "_start", createEmpty: false)'
+            f' |> yield(name: "{name}")')
+
+
+def build_bucket_query(bucket, parameters, start, stop, every, thresholds, schema="narrow"):
+    """สร้าง Flux query เดียวจากข้อมูลดิบ คืนค่า sum/min/max/count/alarms ของหลายพารามิเตอร์
+
+    parameters เป็น None หมายถึงทุกพารามิเตอร์
+    """
+    lines = [
+        f'data = from(bucket: {flux_string(bucket)})',
+        _range_clause(start, stop),
+    ] + sensor_source(parameters, schema)
+    for fn in ("sum", "min", "max", "count"):
+        lines.append("data" + _window(every, fn, fn))
+    active = {
+        k: v for k, v in thresholds.items()
+        if v is not None and math.isfinite(float(v)) and (not parameters or k in parameters)
+    }
+    if active:
+        lines.append(f'data |> filter(fn: (r) => {alarm_predicate(active)})' + _window(every, "count", "alarms"))
+    return "\n".join(lines)
+
+
+def build_rollup_query(bucket, measurement, parameters, start, stop, every):
+    """สร้าง Flux query จาก rollup (เช่น rollup_1m) ให้ผลลัพธ์รูปแบบเดียวกับข้อมูลดิบ"""
+    lines = [
+        f'data = from(bucket: {flux_string(bucket)})',
+        _range_clause(start, stop),
+        f'    |> filter(fn: (r) => r["_measurement"] == "{measurement}")',
+    ] + _parameter_filter(parameters)
+    for field, fn, name in (("sum", "sum", "sum"), ("min", "min", "min"), ("max", "max", "max"),
+                            ("count", "sum", "count"), ("alarm_count", "sum", "alarms"),
+                            ("alarm_minutes", "sum", "alarm_minutes")):
+        lines.append(f'data |> filter(fn: (r) => r["_field"] == "{field}")' + _window(every, fn, name))
+    return "\n".join(lines)
+
+
+def merge_bucket_rows(tables, rows=None):
+    """รวมผลลัพธ์หลาย yield เป็น {parameter: {ts_ms: {agg: value}}}"""
+    if rows is None:
+        rows = {}
+    for table in tables:
+        for record in table.records:
+            param = record.values.get("parameter")
+            agg = record.values.get("result")
+            value = record.get_value()
+            if param is None or agg not in MERGE_OPS or value is None:
+                continue
+            ts = int(record.get_time().timestamp() * 1000)
+            row = rows.setdefault(param, {}).setdefault(ts, {})
+            row[agg] = MERGE_OPS[agg](row[agg], value) if agg in row else value
+    return rows
+
+
+def rows_to_series(rows, digits=3):
+    """แปลง rows เป็น series แบบ columnar ต่อพารามิเตอร์"""
+    series = {}
+    for param, by_time in rows.items():
+        out = {"t": [], "mean": [], "min": [], "max": [], "count": [], "alarms": []}
+        for ts in sorted(by_time):
+            row = by_time[ts]
+            count = int(row.get("count") or 0)
+            if not count:
+                continue
+            out["t"].append(ts)
+            out["mean"].append(_round(row.get("sum", 0.0) / count, digits))
+            out["min"].append(_round(row.get("min"), digits))
+            out["max"].append(_round(row.get("max"), digits))
+            out["count"].append(count)
+            out["alarms"].append(int(row.get("alarms", 0)))
+        series[param] = out
+    return series
+
+
+def collect_buckets(tables):
+    """รวมผลลัพธ์หลาย yield ให้เป็น series แบบ columnar ต่อพารามิเตอร์"""
+    return rows_to_series(merge_bucket_rows(tables))
+
+
+def _round(value, digits=3):
+    if value is None or digits is None:
+        return value
+    return round(float(value), digits)
+
+
+def lttb(times, values, threshold):
+    """Largest-Triangle-Three-Buckets: เลือกจุดตัวแทนที่รักษารูปทรงกราฟ
+
+    คืนค่า index ของจุดที่เลือก (รวมจุดแรกและจุดสุดท้ายเสมอ)
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # ค่าเฉลี่ยของ bucket ถัดไป
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        span = next_end - next_start
+        avg_t = sum(times[next_start:next_end]) / span
+        avg_v = sum(values[next_start:next_end]) / span
+
+        # เลือกจุดใน bucket ปัจจุบันที่ได้สามเหลี่ยมใหญ่สุด
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        ta, va = times[a], values[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ta - avg_t) * (values[j] - va) - (ta - times[j]) * (avg_v - va))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
+
+
+def lttb_series(series, max_points):
+    """ใช้ LTTB กับ series ที่ bucket แล้ว โดยอิงค่า mean"""
+    result = {}
+    for param, cols in series.items():
+        keep = lttb(cols["t"], cols["mean"], max_points)
+        result[param] = {name: [col[i] for i in keep] for name, col in cols.items()}
+    return result
@@ -0,0 +1,229 @@
+import ast
+import math
+import operator
+from functools import reduce
+
+import numpy as np
+
+
+def _vector_min(*args):
+    return reduce(np.minimum, args)
+
+
+def _vector_max(*args):
+    return reduce(np.maximum, args)
+
+
+def _vector_log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+# ฟังก์ชันที่อนุญาตใน formula (scalar, vector, จำนวน argument ต่ำสุด, สูงสุด; None = ไม่จำกัด)
+FUNCTIONS = {
+    "abs": (abs, np.abs, 1, 1),
+    "min": (min, _vector_min, 2, None),
+    "max": (max, _vector_max, 2, None),
+    "round": (round, np.round, 1, 2),
+    "sqrt": (math.sqrt, np.sqrt, 1, 1),
+    "log": (math.log, _vector_log, 1, 2),
+    "log10": (math.log10, np.log10, 1, 1),
+    "exp": (math.exp, np.exp, 1, 1),
+    "pow": (pow, np.power, 2, 2),
+}
+
+# เลขชี้กำลังที่เป็นค่าคงที่ต้องไม่เกินค่านี้ (กัน 9**9**9 ที่คำนวณไม่จบ)
+MAX_EXPONENT = 1000
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+
+class FormulaError(ValueError):
+    """formula ไม่ถูกต้องหรือใช้ syntax ที่ไม่อนุญาต"""
+
+
+def _constant_value(node):
+    """ค่าของ expression ที่ไม่ขึ้นกับ x หรือ None ถ้าขึ้นกับ x"""
+    if isinstance(node, ast.Constant):
+        return node.value if isinstance(node.value, (int, float)) else None
+    if isinstance(node, ast.Name):
+        return CONSTANTS.get(node.id)
+    if isinstance(node, ast.UnaryOp):
+        value = _constant_value(node.operand)
+        if value is None:
+            return None
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left, right = _constant_value(node.left), _constant_value(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Pow):
+            _check_power(left, right)
+        try:
+            return _BINARY_OPERATORS[type(node.op)](left, right)
+        except ArithmeticError as e:
+            raise FormulaError(f"invalid constant expression: {e}") from None
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+        args = [_constant_value(arg) for arg in node.args]
+        if not args or any(arg is None for arg in args):
+            return None
+        if node.func.id == "pow" and len(args) == 2:
+            _check_power(*args)
+        try:
+            return FUNCTIONS[node.func.id][0](*args)
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise FormulaError(f"invalid constant expression: {e}") from None
+    return None
+
+
+def _check_power(base, exponent):
+    """เลขชี้กำลังที่เป็นค่าคงที่ต้องไม่เกิน MAX_EXPONENT และถ้าฐานเป็นค่าคงที่ด้วย ผลต้อง finite"""
+    if abs(exponent) > MAX_EXPONENT:
+        raise FormulaError(f"exponent {exponent:g} is larger than {MAX_EXPONENT}")
+    if base is not None:
+        try:
+            math.pow(base, exponent)
+        except (OverflowError, ValueError):
+            raise FormulaError(f"invalid constant power {base:g} ** {exponent:g}") from None
+
+
+def _validate(tree):
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise FormulaError(f"unsupported syntax: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise FormulaError(f"unsupported constant: {node.value!r}")
+        if isinstance(node, ast.Name) and node.id != "x" and node.id not in FUNCTIONS and node.id not in CONSTANTS:
+            raise FormulaError(f"unknown name: {node.id}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise FormulaError("only built-in math functions may be called")
+            if node.keywords:
+                raise FormulaError("keyword arguments are not allowed")
+            _, _, min_args, max_args = FUNCTIONS[node.func.id]
+            count = len(node.args)
+            if count < min_args or (max_args is not None and count > max_args):
+                expected = str(min_args) if min_args == max_args else \
+                    f"at least {min_args}" if max_args is None else f"{min_args}-{max_args}"
+                plural = "" if expected == "1" else "s"
+                raise FormulaError(f"{node.func.id}() takes {expected} argument{plural}, got {count}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            power = (node.left, node.right)
+        elif isinstance(node, ast.Call) and node.func.id == "pow":
+            power = node.args
+        else:
+            continue
+        exponent = _constant_value(power[1])
+        if exponent is not None:
+            _check_power(_constant_value(power[0]), exponent)
+
+
+class CompiledFormula:
+    """formula ที่ parse และ compile แล้ว ใช้ได้ทั้งค่าเดียวและ array"""
+
+    __slots__ = ("source", "scalar", "vector")
+
+    def __init__(self, source, scalar, vector):
+        self.source = source
+        self.scalar = scalar
+        self.vector = vector
+
+    def __call__(self, x):
+        return self.scalar(x)
+
+
+def is_identity(formula):
+    """formula เป็น "x" (ไม่ต้องคำนวณ)"""
+    return formula is None or formula.replace(" ", "") in ("", "x", "(x)")
+
+
+def _compile(formula):
+    try:
+        tree = ast.parse(formula.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"invalid formula {formula!r}: {e.msg}") from None
+    _validate(tree)
+
+    # ห่อเป็น lambda x: <expr> แล้ว compile ครั้งเดียว
+    body = ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg="x")], kwonlyargs=[],
+                           kw_defaults=[], defaults=[]),
+        body=tree.body,
+    )
+    code = compile(ast.fix_missing_locations(ast.Expression(body)), "<formula>", "eval")
+
+    scalar_env = {"__builtins__": {}, **CONSTANTS}
+    vector_env = {"__builtins__": {}, **CONSTANTS}
+    for name, (scalar_fn, vector_fn, _, _) in FUNCTIONS.items():
+        scalar_env[name] = scalar_fn
+        vector_env[name] = vector_fn
+    return CompiledFormula(formula, eval(code, scalar_env), eval(code, vector_env))
+
+
+class FormulaCache:
+    """cache ของ formula ที่ compile แล้ว (key = ข้อความ formula)"""
+
+    def __init__(self):
+        self._cache = {}
+        self.compiles = 0
+
+    def get(self, formula):
+        """คืนค่า CompiledFormula หรือ None ถ้าเป็น identity"""
+        if is_identity(formula):
+            return None
+        compiled = self._cache.get(formula)
+        if compiled is None:
+            compiled = _compile(formula)
+            self._cache[formula] = compiled
+            self.compiles += 1
+        return compiled
+
+    def clear(self):
+        """ล้าง cache (เรียกเมื่อบันทึก mapping ใหม่)"""
+        self._cache.clear()
+
+    def stats(self):
+        return {"cached": len(self._cache), "compiles": self.compiles}
+
+
+# Global instance
+formula_cache = FormulaCache()
+
+
+def compile_formula(formula):
+    """compile formula (ผ่าน cache) คืน None ถ้าเป็น identity"""
+    return formula_cache.get(formula)
+
+
+def apply_formula(formula, x):
+    """คำนวณ formula กับค่าเดียว"""
+    compiled = formula_cache.get(formula)
+    return x if compiled is None else compiled.scalar(x)
+
+
+def validate_formula(formula):
+    """ตรวจสอบ formula คืนข้อความ error หรือ None ถ้าใช้ได้"""
+    try:
+        formula_cache.get(formula)
+    except FormulaError as e:
+        return str(e)
+    return None
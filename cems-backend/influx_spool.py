@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+
+import log_level
+
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".lp"
+
+
+def _line_timestamp(line):
+    """ดึง timestamp (ตัวสุดท้ายของ line protocol) สำหรับเรียงลำดับ"""
+    try:
+        return int(line.rsplit(b" ", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+class WriteAheadSpool:
+    """spool บนดิสก์สำหรับเก็บข้อมูลระหว่างที่ InfluxDB ใช้งานไม่ได้
+
+    ข้อมูลถูกเขียนแบบ append-only เป็น line protocol ทีละบรรทัด
+    แบ่งเป็น segment ตามขนาด และ fsync เป็นรอบ ๆ (ไม่ใช่ทุกบรรทัด)
+    เมื่อเชื่อมต่อได้อีกครั้งจะ replay เป็นกลุ่มเรียงตามเวลา
+    """
+
+    def __init__(self, directory="spool", segment_bytes=8 * 1024 * 1024,
+                 max_bytes=1024 * 1024 * 1024, fsync_interval=1.0,
+                 replay_batch_size=5000, replay_window_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.replay_batch_size = replay_batch_size
+        self.replay_window_bytes = replay_window_bytes
+
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._file = None
+        self._file_seq = None
+        self._file_bytes = 0
+        self._last_fsync = 0.0
+        self._dirty = False
+
+        # seq -> [bytes, points]
+        self._segments = {}
+
+        self.spooled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.last_replay_points = 0
+        self.last_replay_seconds = 0.0
+        self.last_replay_rate = 0.0
+        self.last_replay_oldest_ns = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan_existing()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _scan_existing(self):
+        """โหลดรายการ segment ที่ค้างจากการรันครั้งก่อน"""
+        for name in os.listdir(self.directory):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            try:
+                seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            path = self._segment_path(seq)
+            with open(path, "rb") as f:
+                points = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+            self._segments[seq] = [os.path.getsize(path), points]
+        if self._segments:
+            log_level.info(f"📦 Found {self.backlog_points} spooled points in {len(self._segments)} segments")
+
+    def _open_segment(self):
+        seq = max(self._segments, default=0) + 1
+        self._file = open(self._segment_path(seq), "ab")
+        self._file_seq = seq
+        self._file_bytes = 0
+        self._segments[seq] = [0, 0]
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._file_seq = None
+        self._dirty = False
+
+    def _enforce_limit(self):
+        """ลบ segment เก่าสุดเมื่อ spool ใหญ่เกิน max_bytes"""
+        while self.backlog_bytes > self.max_bytes and len(self._segments) > 1:
+            oldest = min(self._segments)
+            if oldest == self._file_seq:
+                break
+            size, points = self._segments.pop(oldest)
+            try:
+                os.remove(self._segment_path(oldest))
+            except OSError:
+                pass
+            self.dropped += points
+            log_level.warning(f"⚠️ Spool full, dropped oldest segment ({points} points)")
+
+    def append(self, records):
+        """เขียน record (line protocol หรือ Point) ต่อท้าย spool"""
+        lines = []
+        for record in records:
+            if not isinstance(record, (str, bytes)):
+                record = record.to_line_protocol()
+            if isinstance(record, str):
+                record = record.encode("utf-8")
+            if record:
+                lines.append(record)
+        if not lines:
+            return 0
+
+        data = b"\n".join(lines) + b"\n"
+        with self._lock:
+            if self._file is None or self._file_bytes >= self.segment_bytes:
+                self._close_segment()
+                self._open_segment()
+                self._enforce_limit()
+            self._file.write(data)
+            self._file_bytes += len(data)
+            segment = self._segments[self._file_seq]
+            segment[0] += len(data)
+            segment[1] += len(lines)
+            self.spooled += len(lines)
+            self._dirty = True
+
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+                self._dirty = False
+        return len(lines)
+
+    def sync(self):
+        """บังคับ fsync segment ปัจจุบัน"""
+        with self._lock:
+            if self._file is not None and self._dirty:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+                self._dirty = False
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    @property
+    def backlog_bytes(self):
+        return sum(size for size, _ in self._segments.values())
+
+    @property
+    def backlog_points(self):
+        return sum(points for _, points in self._segments.values())
+
+    def has_backlog(self):
+        return any(points for _, points in self._segments.values())
+
+    def _replay_groups(self, pending):
+        """แบ่ง segment เป็นกลุ่มขนาดไม่เกิน replay_window_bytes"""
+        group, size = [], 0
+        for seq in pending:
+            group.append(seq)
+            size += self._segments.get(seq, [0, 0])[0]
+            if size >= self.replay_window_bytes:
+                yield group
+                group, size = [], 0
+        if group:
+            yield group
+
+    def replay(self, write_fn):
+        """ส่งข้อมูลใน spool ทั้งหมดผ่าน write_fn เรียงตามเวลา
+
+        segment ถูกอ่านเป็นกลุ่ม (จำกัดหน่วยความจำด้วย replay_window_bytes)
+        แล้วเรียงตาม timestamp ก่อนส่ง เพื่อให้ batch ที่ถูก spool ช้า
+        (เช่นจาก writer ที่ retry ไม่สำเร็จ) กลับมาอยู่ในลำดับที่ถูกต้อง
+        segment จะถูกลบหลังเขียนครบเท่านั้น ถ้าล้มเหลวกลางทาง
+        ข้อมูลที่ส่งไปแล้วจะถูกส่งซ้ำรอบหน้า ซึ่ง InfluxDB เขียนทับ
+        (series + timestamp เดียวกัน) จึงไม่เกิดข้อมูลซ้ำ
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            # ปิด segment ปัจจุบันเพื่อให้ replay ได้ครบ
+            with self._lock:
+                self._close_segment()
+                pending = sorted(self._segments)
+
+            started = time.perf_counter()
+            total = 0
+            oldest = None
+            for group in self._replay_groups(pending):
+                lines = []
+                for seq in group:
+                    try:
+                        with open(self._segment_path(seq), "rb") as f:
+                            lines.extend(line for line in f.read().split(b"\n") if line)
+                    except FileNotFoundError:
+                        pass
+
+                lines.sort(key=_line_timestamp)
+                if lines:
+                    first = _line_timestamp(lines[0])
+                    oldest = first if oldest is None else min(oldest, first)
+                for i in range(0, len(lines), self.replay_batch_size):
+                    batch = [line.decode("utf-8") for line in lines[i:i + self.replay_batch_size]]
+                    write_fn(batch)
+                    total += len(batch)
+
+                for seq in group:
+                    with self._lock:
+                        self._segments.pop(seq, None)
+                    try:
+                        os.remove(self._segment_path(seq))
+                    except FileNotFoundError:
+                        pass
+                self.replayed += len(lines)
+
+            elapsed = time.perf_counter() - started
+            if total:
+                self.last_replay_points = total
+                self.last_replay_seconds = elapsed
+                self.last_replay_rate = total / elapsed if elapsed > 0 else float(total)
+                self.last_replay_oldest_ns = oldest
+                log_level.info(f"📤 Replayed {total} spooled points ({self.last_replay_rate:.0f} points/s)")
+            return total
+        finally:
+            self._replay_lock.release()
+
+    def stats(self):
+        """สถิติของ spool"""
+        return {
+            "directory": os.path.abspath(self.directory),
+            "backlog_points": self.backlog_points,
+            "backlog_bytes": self.backlog_bytes,
+            "backlog_segments": len(self._segments),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "last_replay_points": self.last_replay_points,
+            "last_replay_seconds": round(self.last_replay_seconds, 3),
+            "last_replay_rate": round(self.last_replay_rate, 1),
+        }
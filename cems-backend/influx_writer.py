@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+
+import log_level
+
+
+class InfluxBatchWriter:
+    """คิวเขียนข้อมูลแบบ background สำหรับ InfluxDB
+
+    ผู้เรียก (poll loop) แค่ใส่ record ลงคิวแล้วกลับทันที
+    thread เบื้องหลังจะรวม record เป็น batch ตามขนาดหรือช่วงเวลา
+    แล้วเขียนผ่าน write_fn พร้อม retry แบบ backoff
+    batch ที่เขียนไม่สำเร็จจะถูกส่งให้ fallback_fn (เช่น spool บนดิสก์)
+    """
+
+    def __init__(self, write_fn, fallback_fn=None, max_queue=20000, batch_size=500,
+                 flush_interval=1.0, max_retries=5,
+                 retry_base_delay=0.5, retry_max_delay=30.0):
+        self.write_fn = write_fn
+        self.fallback_fn = fallback_fn
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.spilled = 0
+        self.retries = 0
+        self.last_batch_size = 0
+        self.last_batch_latency_ms = 0.0
+        self.avg_batch_latency_ms = 0.0
+        self.max_batch_latency_ms = 0.0
+        self.last_error = None
+
+    def start(self):
+        """เริ่ม thread สำหรับ flush"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """หยุด thread และ flush ข้อมูลที่ค้างอยู่"""
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, records):
+        """ใส่ record ลงคิว (ไม่ block) คืนค่าจำนวนที่ถูกทิ้งเพราะคิวเต็ม"""
+        dropped = 0
+        with self._cond:
+            for record in records:
+                if len(self._queue) >= self.max_queue:
+                    # คิวเต็ม ทิ้งข้อมูลเก่าสุดเพื่อเก็บค่าล่าสุดไว้
+                    self._queue.popleft()
+                    dropped += 1
+                self._queue.append(record)
+            self.queued += len(records)
+            self.dropped += dropped
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        return dropped
+
+    def worst_case_delay(self, attempt_timeout=10.0):
+        """เวลานานสุด (วินาที) ที่ record อาจรอในคิวและ retry ก่อนถูกเขียนหรือส่งให้ fallback_fn
+
+        attempt_timeout = timeout ของการเขียนแต่ละครั้ง (ค่าเริ่มต้นของ influxdb_client คือ 10 วินาที)
+        """
+        backoff, delay = 0.0, self.retry_base_delay
+        for _ in range(self.max_retries):
+            backoff += delay
+            delay = min(delay * 2, self.retry_max_delay)
+        return self.flush_interval + backoff + (self.max_retries + 1) * attempt_timeout
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        """สถิติของ writer"""
+        return {
+            "running": self._running,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "spilled": self.spilled,
+            "retries": self.retries,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_latency_ms": round(self.last_batch_latency_ms, 2),
+            "avg_batch_latency_ms": round(self.avg_batch_latency_ms, 2),
+            "max_batch_latency_ms": round(self.max_batch_latency_ms, 2),
+            "last_error": self.last_error,
+        }
+
+    def _take_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while self._running and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write_with_retry(batch)
+            elif not self._running:
+                break
+        # flush ที่เหลือก่อนปิด
+        while self._queue:
+            with self._cond:
+                n = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(n)]
+            self._write_with_retry(batch, max_retries=0)
+
+    def _spill(self, batch):
+        if self.fallback_fn is None:
+            return False
+        try:
+            self.fallback_fn(batch)
+        except Exception as e:
+            log_level.error(f"❌ Fallback for failed batch failed: {e}")
+            return False
+        self.spilled += len(batch)
+        return True
+
+    def _write_with_retry(self, batch, max_retries=None):
+        if max_retries is None:
+            max_retries = self.max_retries
+        delay = self.retry_base_delay
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                self.write_fn(batch)
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt >= max_retries or not self._running:
+                    self.failed_batches += 1
+                    if self._spill(batch):
+                        return False
+                    self.dropped += len(batch)
+                    log_level.error(f"❌ Dropped batch of {len(batch)} points after {attempt + 1} attempts: {e}")
+                    return False
+                attempt += 1
+                self.retries += 1
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+                continue
+
+            latency = (time.perf_counter() - started) * 1000
+            self.batches += 1
+            self.written += len(batch)
+            self.last_batch_size = len(batch)
+            self.last_batch_latency_ms = latency
+            self.max_batch_latency_ms = max(self.max_batch_latency_ms, latency)
+            if self.batches == 1:
+                self.avg_batch_latency_ms = latency
+            else:
+                self.avg_batch_latency_ms += (latency - self.avg_batch_latency_ms) * 0.1
+            return True
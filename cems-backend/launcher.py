@@ -1,19 +1,22 @@
+import json
 import subprocess
 import sys
 import os
 import time
 import threading
+import urllib.request
 import webbrowser
 from pathlib import Path
 
+BACKEND_READY_URL = "http://127.0.0.1:8000/ready"
+FRONTEND_URL = "http://localhost:5173"
+
 def run_backend():
     """รัน backend server"""
     try:
-        # รัน backend
+        # รัน backend (ไม่ต่อ PIPE ที่ไม่มีใครอ่าน เพราะ buffer เต็มแล้ว backend จะค้าง)
         backend_process = subprocess.Popen([sys.executable, "main.py"], 
-                                         cwd=os.getcwd(),
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE)
+                                         cwd=os.getcwd())
         print("Backend started successfully")
         return backend_process
     except Exception as e:
@@ -29,19 +32,48 @@ def run_frontend():
         # รัน frontend
         frontend_process = subprocess.Popen(["npm", "run", "dev"], 
                                           cwd=frontend_dir,
-                                          stdout=subprocess.PIPE,
-                                          stderr=subprocess.PIPE)
+                                          stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL)
         print("Frontend started successfully")
         return frontend_process
     except Exception as e:
         print(f"❌ Failed to start frontend: {e}")
         return None
 
+def wait_for_url(url, timeout=30.0, interval=0.1, process=None):
+    """poll url จนตอบ 200 คืน (True, body) หรือ (False, None) เมื่อหมดเวลาหรือ process ตาย"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False, None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True, response.read()
+        except Exception:
+            pass
+        time.sleep(interval)
+    return False, None
+
+def wait_for_backend(process, timeout=30.0):
+    """รอ /ready ของ backend แล้วแสดงเวลาของแต่ละขั้นตอน"""
+    started = time.monotonic()
+    ready, body = wait_for_url(BACKEND_READY_URL, timeout, process=process)
+    if not ready:
+        return False
+    print(f"✅ Backend ready after {time.monotonic() - started:.2f}s")
+    try:
+        for name, phase in json.loads(body).get("phases", {}).items():
+            print(f"   {name:12s} {phase.get('status'):9s} {phase.get('duration_ms')} ms")
+    except ValueError:
+        pass
+    return True
+
 def open_browser():
-    """เปิด browser หลังจากรอสักครู่"""
-    time.sleep(5)  # รอให้ server เริ่มทำงาน
+    """เปิด browser เมื่อ frontend dev server ตอบแล้ว"""
+    wait_for_url(FRONTEND_URL, timeout=60.0, interval=0.2)
     try:
-        webbrowser.open("http://localhost:5173")
+        webbrowser.open(FRONTEND_URL)
         print("🌐 Browser opened automatically")
     except:
         print("⚠️ Please open browser manually: http://localhost:5173")
@@ -56,11 +88,14 @@ def main():
         print("❌ Cannot start backend. Exiting...")
         return
     
-    # รอสักครู่ให้ backend เริ่มทำงาน
-    time.sleep(3)
-    
-    # รัน frontend
+    # รัน frontend พร้อมกัน (ไม่ต้องรอ backend) แล้วรอ /ready แทนการ sleep
     frontend_process = run_frontend()
+    if frontend_process and not wait_for_backend(backend_process):
+        print("❌ Backend did not become ready. Exiting...")
+        frontend_process.terminate()
+        backend_process.terminate()
+        return
+
     if not frontend_process:
         print("❌ Cannot start frontend. Exiting...")
         backend_process.terminate()
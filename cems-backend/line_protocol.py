@@ -0,0 +1,114 @@
+import math
+import time
+
+# measurement/tag ของข้อมูลเซ็นเซอร์แต่ละ schema
+NARROW_MEASUREMENT = "sensor_data"
+WIDE_MEASUREMENT = "sensor_row"
+SCHEMAS = ("narrow", "wide", "dual")
+
+_MEASUREMENT_ESCAPE = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+_KEY_ESCAPE = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+
+
+def escape_measurement(name):
+    return str(name).translate(_MEASUREMENT_ESCAPE)
+
+
+def escape_key(name):
+    """escape tag key/tag value/field key ตาม line protocol"""
+    return str(name).translate(_KEY_ESCAPE)
+
+
+class LineProtocolEncoder:
+    """แปลง sample เป็น line protocol โดยตรง แทนการสร้าง Point ทีละพารามิเตอร์
+
+    schema:
+        narrow  sensor_data,parameter=<name> value=<v> <ts>   (แถวละพารามิเตอร์ แบบเดิม)
+        wide    sensor_row,device=<device> <p1>=<v1>,<p2>=<v2> <ts>   (แถวเดียวต่ออุปกรณ์)
+        dual    เขียนทั้งสองแบบ (ใช้ระหว่าง migrate ข้อมูลเก่า)
+
+    ชื่อที่ escape แล้วถูก cache ไว้ และทุก sample ต่อลง bytearray เดียวที่ใช้ซ้ำ
+    ผลลัพธ์ของหนึ่ง sample เป็น bytes หนึ่งก้อน (หลายบรรทัดได้)
+    """
+
+    def __init__(self, schema="narrow", digits=1):
+        if schema not in SCHEMAS:
+            raise ValueError(f"schema must be one of {', '.join(SCHEMAS)}")
+        self.schema = schema
+        self.digits = digits
+        self._format = f".{int(digits)}f" if digits is not None else None
+        self._buffer = bytearray()
+        self._narrow_prefix = {}
+        self._field_keys = {}
+        self._wide_prefix = {}
+
+    def _value(self, value):
+        """ค่าเป็น bytes หรือ None (ไม่ใช่ตัวเลข/NaN/inf) ตัวเลขที่เป็น string เช่น "12.3" ใช้ได้"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(value):
+            return None
+        if self._format is None:
+            return repr(value).encode()
+        return format(value, self._format).encode()
+
+    def _narrow(self, buf, values, ts):
+        prefixes = self._narrow_prefix
+        written = 0
+        for key, value in values.items():
+            encoded = self._value(value)
+            if encoded is None:
+                continue
+            prefix = prefixes.get(key)
+            if prefix is None:
+                prefix = prefixes[key] = f"{NARROW_MEASUREMENT},parameter={escape_key(key)} value=".encode()
+            if written:
+                buf += b"\n"
+            buf += prefix
+            buf += encoded
+            buf += ts
+            written += 1
+        return written
+
+    def _wide(self, buf, device, values, ts):
+        keys = self._field_keys
+        start = len(buf)
+        prefix = self._wide_prefix.get(device)
+        if prefix is None:
+            tag = f",device={escape_key(device)}" if device else ""
+            prefix = self._wide_prefix[device] = f"{WIDE_MEASUREMENT}{tag} ".encode()
+        if start:
+            buf += b"\n"
+        buf += prefix
+        written = 0
+        for key, value in values.items():
+            encoded = self._value(value)
+            if encoded is None:
+                continue
+            field = keys.get(key)
+            if field is None:
+                field = keys[key] = escape_key(key).encode() + b"="
+            if written:
+                buf += b","
+            buf += field
+            buf += encoded
+            written += 1
+        if not written:
+            del buf[start:]
+            return 0
+        buf += ts
+        return written
+
+    def encode(self, values, device=None, ts_ns=None):
+        """แปลง sample เป็น bytes ของ line protocol (b"" ถ้าไม่มีค่าที่ใช้ได้) พร้อมจำนวน field"""
+        ts = b" %d" % (time.time_ns() if ts_ns is None else ts_ns)
+        buf = self._buffer
+        buf.clear()
+        fields = 0
+        if self.schema != "wide":
+            fields = self._narrow(buf, values, ts)
+        if self.schema != "narrow":
+            fields = max(fields, self._wide(buf, device, values, ts))
+        return bytes(buf), fields
@@ -0,0 +1,179 @@
+import math
+import threading
+import time
+from array import array
+
+
+class RingBuffer:
+    """ประวัติของพารามิเตอร์หนึ่งตัว เก็บ (เวลา, ค่า) ใน array('d') ขนาดคงที่"""
+
+    __slots__ = ("capacity", "times", "values", "head", "size", "created")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        # เวลาของค่าแรก ก่อนหน้านั้นไม่มีข้อมูลของพารามิเตอร์นี้ในหน่วยความจำ
+        self.created = None
+
+    def append(self, ts, value):
+        if self.created is None:
+            self.created = ts
+        self.times[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    @property
+    def full(self):
+        return self.size == self.capacity
+
+    def oldest_time(self):
+        if not self.size:
+            return None
+        return self.times[(self.head - self.size) % self.capacity]
+
+    def since(self, start_ts):
+        """คืน (times, values) ตั้งแต่ start_ts เรียงตามเวลา"""
+        first = (self.head - self.size) % self.capacity
+        if first + self.size <= self.capacity:
+            times = self.times[first:first + self.size]
+            values = self.values[first:first + self.size]
+        else:
+            times = self.times[first:] + self.times[:self.head]
+            values = self.values[first:] + self.values[:self.head]
+        # หาตำแหน่งแรกที่ >= start_ts (times เรียงจากเก่าไปใหม่)
+        lo, hi = 0, len(times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] < start_ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return times[lo:], values[lo:]
+
+
+class LatestValueStore:
+    """ค่าล่าสุดและประวัติช่วงสั้นของทุกพารามิเตอร์ในหน่วยความจำ (เติมโดย poller)
+
+    ช่วงเวลาที่อยู่ใน ring buffer ครบถูกตอบจากหน่วยความจำ ไม่ต้อง query InfluxDB
+    ช่วงที่เก่ากว่านั้นให้ผู้เรียกไปอ่านจากฐานข้อมูล
+    """
+
+    def __init__(self, capacity=7200):
+        self.capacity = int(capacity)
+        self.latest = {}
+        self.latest_time = {}
+        self.buffers = {}
+        self.started = None
+        self.updates = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def configure(self, capacity=None):
+        """เปลี่ยนขนาด ring buffer (ล้างประวัติเดิม)"""
+        if capacity is not None and int(capacity) != self.capacity:
+            with self._lock:
+                self.capacity = int(capacity)
+                self.buffers = {}
+                self.started = None
+
+    def update(self, values, ts=None):
+        """บันทึกค่าชุดใหม่จาก poller"""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            if self.started is None:
+                self.started = ts
+            for name, value in values.items():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if not math.isfinite(value):
+                    continue
+                self.latest[name] = value
+                self.latest_time[name] = ts
+                buffer = self.buffers.get(name)
+                if buffer is None:
+                    buffer = self.buffers[name] = RingBuffer(self.capacity)
+                buffer.append(ts, value)
+            self.updates += 1
+
+    def get_latest(self, parameter=None):
+        """{parameter: value} ล่าสุด หรือ None ถ้ายังไม่มีข้อมูล"""
+        if parameter:
+            if parameter not in self.latest:
+                return None
+            return {parameter: self.latest[parameter]}
+        return dict(self.latest) or None
+
+    def coverage_start(self, parameters):
+        """เวลาเก่าสุดที่หน่วยความจำมีข้อมูลครบสำหรับพารามิเตอร์เหล่านี้
+
+        None ถ้ามีพารามิเตอร์ที่ไม่มี buffer (ไม่ได้ poll สด เช่นมีเฉพาะในข้อมูลที่ import)
+        buffer ที่ยังไม่เต็มครอบคลุมตั้งแต่ค่าแรกของพารามิเตอร์นั้น ไม่ใช่ตั้งแต่ started
+        """
+        if self.started is None:
+            return None
+        start = self.started
+        for name in parameters:
+            buffer = self.buffers.get(name)
+            if buffer is None or not buffer.size:
+                return None
+            start = max(start, buffer.oldest_time() if buffer.full else buffer.created)
+        return start
+
+    def covers(self, parameters, start_ts):
+        coverage = self.coverage_start(parameters)
+        ok = coverage is not None and coverage <= start_ts
+        if ok:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return ok
+
+    def bucket_rows(self, parameters, start_ts, every, thresholds=None):
+        """สรุปเป็น bucket รูปแบบเดียวกับ downsampling.merge_bucket_rows"""
+        thresholds = thresholds or {}
+        rows = {}
+        with self._lock:
+            for name in parameters:
+                buffer = self.buffers.get(name)
+                if buffer is None:
+                    continue
+                times, values = buffer.since(start_ts)
+                limit = thresholds.get(name)
+                by_time = rows.setdefault(name, {})
+                for ts, value in zip(times, values):
+                    key = int(ts // every * every) * 1000
+                    row = by_time.get(key)
+                    if row is None:
+                        row = by_time[key] = {"sum": 0.0, "min": value, "max": value, "count": 0, "alarms": 0}
+                    row["sum"] += value
+                    row["count"] += 1
+                    if value < row["min"]:
+                        row["min"] = value
+                    if value > row["max"]:
+                        row["max"] = value
+                    if limit is not None and value > limit:
+                        row["alarms"] += 1
+        return rows
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "parameters": len(self.buffers),
+            "updates": self.updates,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coverage_start": self.coverage_start(self.buffers),
+            "memory_bytes": sum(16 * b.capacity for b in self.buffers.values()),
+        }
+
+
+# Global instance
+live_store = LatestValueStore()
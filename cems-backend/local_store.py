@@ -0,0 +1,736 @@
+"""
+Local columnar time-series store
+
+ที่เก็บข้อมูลเซ็นเซอร์บนเครื่องสำหรับ install ที่ไม่มี InfluxDB (Electron desktop)
+
+    <directory>/
+        store.json                  block_size ที่ใช้ตอนสร้าง (เปลี่ยนภายหลังไม่ได้)
+        2024-05-01/                 partition รายวัน (UTC)
+            SO2.ts                  เวลา (epoch วินาที, float64) เรียงจากเก่าไปใหม่
+            SO2.val                 ค่า (float64) ตำแหน่งเดียวกับ .ts
+            SO2.idx                 summary ต่อ block_size จุด: first, last, min, max, sum, count
+
+ไฟล์เขียนแบบ append-only และอ่านผ่าน numpy.memmap การหาช่วงเวลาใช้ .idx
+เป็น sparse index (binary search ระดับ block แล้วค้นต่อภายใน block เดียว)
+การรวม bucket ใช้ summary ของ block ที่อยู่ใน bucket เดียวทั้ง block โดยไม่อ่านข้อมูลดิบ
+
+เปิดใช้ด้วย config.json:
+    "storage": {"backend": "local", "local": {"directory": "timeseries", "retention_days": 90}}
+"""
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from live_store import live_store
+from query_cache import query_cache
+from storage_backend import SensorStorage
+import log_level
+
+# summary ต่อ block ใช้เป็นทั้ง sparse index (first/last) และ aggregate สำเร็จรูป
+SUMMARY = np.dtype([
+    ("first", "<f8"), ("last", "<f8"),
+    ("min", "<f8"), ("max", "<f8"), ("sum", "<f8"), ("count", "<i8"),
+])
+COLUMN = np.dtype("<f8")
+TIME_SUFFIX = ".ts"
+VALUE_SUFFIX = ".val"
+INDEX_SUFFIX = ".idx"
+META_FILE = "store.json"
+DAY_SECONDS = 86400
+
+
+def day_key(ts):
+    """ชื่อ partition รายวัน (UTC) ของเวลา ts"""
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def day_start(key):
+    return datetime.strptime(key, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+def column_file(parameter):
+    """ชื่อไฟล์ของพารามิเตอร์ (escape อักขระที่ใช้ในชื่อไฟล์ไม่ได้)"""
+    return quote(parameter, safe="")
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _map(path, dtype, length):
+    if not length:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+class ColumnWriter:
+    """ต่อท้ายคอลัมน์ของพารามิเตอร์หนึ่งในวันเดียว
+
+    จุดใหม่พักใน array('d') แล้วเขียนลงไฟล์ทีละชุดเมื่อ flush summary ของ block
+    ที่ครบ block_size จุดเขียนตามหลังข้อมูลเสมอ ถ้า process หยุดกลางคัน
+    จะตัดส่วนที่ไม่ครบและสร้าง summary ที่ขาดใหม่ตอนเปิดไฟล์ครั้งถัดไป
+    """
+
+    def __init__(self, base, block_size):
+        self.base = base
+        self.block_size = block_size
+        self.times = array("d")
+        self.values = array("d")
+        self.summaries = []
+        self.block = None
+        self.last_ts = -math.inf
+        self.size = 0
+        self._files = None
+        self._recover()
+
+    def _recover(self):
+        paths = [self.base + suffix for suffix in (TIME_SUFFIX, VALUE_SUFFIX, INDEX_SUFFIX)]
+        length = min(_file_size(paths[0]), _file_size(paths[1])) // COLUMN.itemsize
+        for path in paths[:2]:
+            if _file_size(path) > length * COLUMN.itemsize:
+                os.truncate(path, length * COLUMN.itemsize)
+        if not length:
+            if _file_size(paths[2]):
+                os.truncate(paths[2], 0)
+            return
+        times = np.fromfile(paths[0], dtype=COLUMN)
+        values = np.fromfile(paths[1], dtype=COLUMN)
+        full = length // self.block_size
+        indexed = min(_file_size(paths[2]) // SUMMARY.itemsize, full)
+        os.truncate(paths[2], indexed * SUMMARY.itemsize)
+        missing = [
+            self._summary(times[b * self.block_size:(b + 1) * self.block_size],
+                          values[b * self.block_size:(b + 1) * self.block_size])
+            for b in range(indexed, full)
+        ]
+        if missing:
+            with open(paths[2], "ab") as f:
+                f.write(np.array(missing, dtype=SUMMARY).tobytes())
+        tail = slice(full * self.block_size, length)
+        if tail.stop > tail.start:
+            self.block = list(self._summary(times[tail], values[tail]))
+        self.last_ts = float(times[-1])
+        self.size = length
+
+    @staticmethod
+    def _summary(times, values):
+        return (float(times[0]), float(times[-1]), float(values.min()), float(values.max()),
+                float(values.sum()), len(values))
+
+    def append(self, ts, value):
+        """เพิ่มจุด (เวลาต้องเพิ่มขึ้นเสมอ คืน False ถ้าเวลาไม่ใหม่กว่าจุดล่าสุด)"""
+        if ts <= self.last_ts:
+            return False
+        self.times.append(ts)
+        self.values.append(value)
+        self.last_ts = ts
+        self.size += 1
+        block = self.block
+        if block is None:
+            block = self.block = [ts, ts, value, value, 0.0, 0]
+        block[1] = ts
+        if value < block[2]:
+            block[2] = value
+        if value > block[3]:
+            block[3] = value
+        block[4] += value
+        block[5] += 1
+        if block[5] == self.block_size:
+            self.summaries.append(tuple(block))
+            self.block = None
+        return True
+
+    def extend(self, times, values):
+        """เพิ่มหลายจุดที่เรียงตามเวลาแล้ว (numpy) คืนจำนวนจุดที่เพิ่ม
+
+        จุดที่เวลาไม่ใหม่กว่าจุดก่อนหน้าถูกข้าม block ที่ครบทั้ง block
+        คำนวณ summary แบบ vectorized
+        """
+        times = np.asarray(times, dtype=COLUMN)
+        values = np.asarray(values, dtype=COLUMN)
+        keep = times > self.last_ts
+        keep[1:] &= times[1:] > times[:-1]
+        times, values = times[keep], values[keep]
+        count = len(times)
+        i = 0
+        # เติม block ที่ค้างอยู่ให้ครบก่อน
+        while i < count and self.block is not None:
+            self.append(float(times[i]), float(values[i]))
+            i += 1
+        full = (count - i) // self.block_size * self.block_size
+        if full:
+            block_times = times[i:i + full].reshape(-1, self.block_size)
+            block_values = values[i:i + full].reshape(-1, self.block_size)
+            summaries = np.empty(len(block_times), dtype=SUMMARY)
+            summaries["first"] = block_times[:, 0]
+            summaries["last"] = block_times[:, -1]
+            summaries["min"] = block_values.min(axis=1)
+            summaries["max"] = block_values.max(axis=1)
+            summaries["sum"] = block_values.sum(axis=1)
+            summaries["count"] = self.block_size
+            self.times.frombytes(times[i:i + full].tobytes())
+            self.values.frombytes(values[i:i + full].tobytes())
+            self.summaries.extend(summaries.tolist())
+            self.last_ts = float(block_times[-1, -1])
+            self.size += full
+            i += full
+        for ts, value in zip(times[i:].tolist(), values[i:].tolist()):
+            self.append(ts, value)
+        return count
+
+    def flush(self):
+        if not self.times:
+            return 0
+        if self._files is None:
+            self._files = [open(self.base + suffix, "ab")
+                           for suffix in (VALUE_SUFFIX, TIME_SUFFIX, INDEX_SUFFIX)]
+        values, times, index = self._files
+        # ค่าก่อนเวลา: reader ใช้ความยาวของ .ts ที่สั้นกว่าจึงไม่เห็นจุดที่ยังเขียนไม่ครบ
+        values.write(self.values.tobytes())
+        values.flush()
+        times.write(self.times.tobytes())
+        times.flush()
+        if self.summaries:
+            index.write(np.array(self.summaries, dtype=SUMMARY).tobytes())
+            index.flush()
+        written = len(self.times)
+        self.times = array("d")
+        self.values = array("d")
+        self.summaries = []
+        return written
+
+    def close(self):
+        self.flush()
+        for f in self._files or ():
+            f.close()
+        self._files = None
+
+
+class ColumnReader:
+    """อ่านคอลัมน์ของพารามิเตอร์หนึ่งในวันเดียวผ่าน memmap (map ใหม่เมื่อไฟล์ยาวขึ้น)"""
+
+    def __init__(self, base, block_size):
+        self.base = base
+        self.block_size = block_size
+        self.size = -1
+        self.times = self.values = np.empty(0, dtype=COLUMN)
+        self.index = np.empty(0, dtype=SUMMARY)
+
+    def refresh(self):
+        times_path, values_path = self.base + TIME_SUFFIX, self.base + VALUE_SUFFIX
+        length = min(_file_size(times_path), _file_size(values_path)) // COLUMN.itemsize
+        if length != self.size:
+            blocks = min(_file_size(self.base + INDEX_SUFFIX) // SUMMARY.itemsize, length // self.block_size)
+            self.times = _map(times_path, COLUMN, length)
+            self.values = _map(values_path, COLUMN, length)
+            self.index = _map(self.base + INDEX_SUFFIX, SUMMARY, blocks)
+            self.size = length
+        return self
+
+    def locate(self, ts):
+        """ตำแหน่งแรกที่เวลา >= ts: หา block จาก sparse index แล้วค้นต่อภายใน block นั้น"""
+        lo, hi = 0, self.size
+        blocks = len(self.index)
+        if blocks:
+            block = int(np.searchsorted(self.index["first"], ts, side="right")) - 1
+            if block < 0:
+                return 0
+            lo = block * self.block_size
+            # block ถัดไปเริ่มหลัง ts แล้ว คำตอบจึงอยู่ใน block นี้ (หรือส่วนท้ายที่ยังไม่มี summary)
+            hi = lo + self.block_size if block + 1 < blocks else self.size
+        return lo + int(np.searchsorted(self.times[lo:hi], ts, side="left"))
+
+    def span(self, start, stop):
+        """ช่วงตำแหน่ง [lo, hi) ของจุดที่ start <= เวลา < stop"""
+        return self.locate(start), self.locate(stop)
+
+    def bucket_rows(self, start, stop, every, limit, rows):
+        """รวมจุดในช่วงลง rows ({ts_ms: {sum, min, max, count, alarms}})
+
+        block ที่อยู่ในช่วงและอยู่ใน bucket เดียวทั้ง block ใช้ summary แทนการอ่านข้อมูลดิบ
+        (ถ้ามี limit ต้องรู้จาก min/max ด้วยว่าทั้ง block เกินหรือไม่เกิน limit)
+        """
+        lo, hi = self.span(start, stop)
+        if lo >= hi:
+            return
+        size = self.block_size
+        first, last = -(-lo // size), min(hi // size, len(self.index))
+        scan = []
+        if first < last:
+            blocks = np.asarray(self.index[first:last])
+            keys = np.floor_divide(blocks["first"], every)
+            usable = keys == np.floor_divide(blocks["last"], every)
+            if limit is not None:
+                usable &= (blocks["max"] <= limit) | (blocks["min"] > limit)
+            if usable.any():
+                chosen = blocks[usable]
+                alarms = chosen["count"] * (chosen["min"] > limit) if limit is not None else np.zeros(len(chosen), np.int64)
+                _merge_rows(rows, (keys[usable] * every).astype(np.int64) * 1000,
+                            chosen["sum"], chosen["min"], chosen["max"], chosen["count"], alarms)
+                # ช่วงข้อมูลดิบที่ยังต้องอ่าน: ก่อน block แรก, block ที่ใช้ summary ไม่ได้ และหลัง block สุดท้าย
+                cursor = lo
+                for block in np.flatnonzero(usable) + first:
+                    if block * size > cursor:
+                        scan.append((cursor, block * size))
+                    cursor = (block + 1) * size
+                if hi > cursor:
+                    scan.append((cursor, hi))
+            else:
+                scan.append((lo, hi))
+        else:
+            scan.append((lo, hi))
+
+        if len(scan) == 1:
+            times, values = self.times[scan[0][0]:scan[0][1]], self.values[scan[0][0]:scan[0][1]]
+        else:
+            times = np.concatenate([self.times[a:b] for a, b in scan])
+            values = np.concatenate([self.values[a:b] for a, b in scan])
+        if not len(times):
+            return
+        keys = (np.floor_divide(times, every) * every).astype(np.int64) * 1000
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        counts = np.diff(np.append(starts, len(keys)))
+        if limit is not None:
+            alarms = np.add.reduceat((values > limit).astype(np.int64), starts)
+        else:
+            alarms = np.zeros(len(starts), np.int64)
+        _merge_rows(rows, keys[starts], np.add.reduceat(values, starts),
+                    np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts),
+                    counts, alarms)
+
+
+def _merge_rows(rows, keys, sums, mins, maxs, counts, alarms):
+    for key, total, low, high, count, alarm in zip(
+            keys.tolist(), sums.tolist(), mins.tolist(), maxs.tolist(), counts.tolist(), alarms.tolist()):
+        row = rows.get(key)
+        if row is None:
+            rows[key] = {"sum": total, "min": low, "max": high, "count": int(count), "alarms": int(alarm)}
+            continue
+        row["sum"] += total
+        row["min"] = min(row["min"], low)
+        row["max"] = max(row["max"], high)
+        row["count"] += int(count)
+        row["alarms"] += int(alarm)
+
+
+def _align(columns):
+    """รวมคอลัมน์ {parameter: (times, values)} เป็นเวลาร่วมและค่าต่อพารามิเตอร์ (None ถ้าไม่มี)"""
+    present = [times for times, _ in columns.values() if len(times)]
+    if not present:
+        return [], {}
+    times = np.unique(np.concatenate(present))
+    aligned = {}
+    for name, (column_times, column_values) in columns.items():
+        if not len(column_times):
+            aligned[name] = [None] * len(times)
+            continue
+        positions = np.searchsorted(column_times, times)
+        clipped = np.minimum(positions, len(column_times) - 1)
+        found = (positions < len(column_times)) & (column_times[clipped] == times)
+        values = np.asarray(column_values)[clipped].tolist()
+        aligned[name] = [v if ok else None for v, ok in zip(values, found.tolist())]
+    return times.tolist(), aligned
+
+
+class LocalColumnStore(SensorStorage):
+    """ที่เก็บข้อมูลเซ็นเซอร์แบบคอลัมน์บนดิสก์ (ไม่ต้องมี InfluxDB)
+
+    ผู้เรียก (poll loop) ใส่ sample ลงคิวด้วย submit แล้วกลับทันที
+    thread เบื้องหลังเขียนลงคอลัมน์ (สร้าง partition, ลบวันที่เกิน retention)
+    และ flush ลงไฟล์ทุก flush_interval วินาที
+    การอ่านทุกครั้ง flush ก่อน จึงเห็นข้อมูลล่าสุดเสมอ (ใน process เดียวกัน)
+    """
+
+    name = "local"
+    connected = True
+
+    def __init__(self, thresholds=dict, directory="timeseries", retention_days=90,
+                 block_size=1024, flush_interval=1.0, max_queue=20000):
+        self.thresholds = thresholds
+        self.directory = directory
+        self.retention_days = retention_days
+        self.block_size = int(block_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self._lock = threading.RLock()
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._writers = {}
+        self._readers = {}
+        self._writer_day = None
+        self._last_flush = 0.0
+        self._opened = False
+
+        self.points_written = 0
+        self.out_of_order = 0
+        self.flushes = 0
+        self.expired_days = 0
+        self.import_skipped = 0
+        self.dropped = 0
+
+    def _open(self):
+        """สร้าง directory และอ่าน block_size ที่ใช้กับข้อมูลเดิม (ครั้งแรกที่ใช้งาน)"""
+        if self._opened:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, META_FILE)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                self.block_size = int(json.load(f)["block_size"])
+        except (OSError, ValueError, KeyError):
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"block_size": self.block_size}, f)
+        self._opened = True
+
+    def _base(self, day, name):
+        return os.path.join(self.directory, day, column_file(name))
+
+    def days(self):
+        """partition รายวันที่มีอยู่ เรียงจากเก่าไปใหม่"""
+        try:
+            entries = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(e for e in entries if len(e) == 10 and e[4] == "-" and e[7] == "-")
+
+    def _days_between(self, start, stop):
+        first, last = day_key(start), day_key(stop)
+        return [day for day in self.days() if first <= day <= last]
+
+    def _reader(self, day, name):
+        key = (day, name)
+        reader = self._readers.get(key)
+        if reader is None:
+            reader = self._readers[key] = ColumnReader(self._base(day, name), self.block_size)
+        return reader.refresh()
+
+    def _parameters(self, day):
+        try:
+            entries = os.listdir(os.path.join(self.directory, day))
+        except OSError:
+            return []
+        return [unquote(e[:-len(VALUE_SUFFIX)]) for e in entries if e.endswith(VALUE_SUFFIX)]
+
+    # ---- write ----
+
+    def start(self):
+        """เริ่ม thread สำหรับเขียน sample จากคิว"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="local-store-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """หยุด thread (sample ที่ค้างในคิวถูกเขียนก่อนจบ)"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, data, device=None, ts=None):
+        """ใส่ sample ลงคิว (ไม่ block และไม่แตะดิสก์) คิวเต็มจะทิ้ง sample เก่าสุด"""
+        ts = time.time() if ts is None else float(ts)
+        if not self._running:
+            self.start()
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((dict(data), device, ts))
+            self._cond.notify()
+        return True
+
+    def _drain(self):
+        """เขียน sample ที่ค้างในคิวทั้งหมด (ต้องถือ _lock อยู่)"""
+        with self._cond:
+            pending, self._pending = self._pending, deque()
+        for data, device, ts in pending:
+            self.save_sensor_data(data, device, ts)
+        return len(pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and self._running:
+                    self._cond.wait(self.flush_interval)
+                stopping = not self._running and not self._pending
+            try:
+                with self._lock:
+                    if not self._drain() and self._writers \
+                            and time.monotonic() - self._last_flush >= self.flush_interval:
+                        self._flush()
+            except Exception as e:
+                log_level.error(f"❌ Local store write failed: {e}")
+            if stopping:
+                return
+
+    def save_sensor_data(self, data, device=None, ts=None):
+        """บันทึก sample (ค่าที่ไม่ใช่ตัวเลขหรือไม่ finite ถูกข้าม)"""
+        ts = time.time() if ts is None else float(ts)
+        day = day_key(ts)
+        saved = 0
+        with self._lock:
+            self._open()
+            if self._writer_day is None or day > self._writer_day:
+                self._rollover(day)
+            for name, value in data.items():
+                if name == 'timestamp':
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if not math.isfinite(value):
+                    continue
+                key = (day, name)
+                writer = self._writers.get(key)
+                if writer is None:
+                    os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+                    writer = self._writers[key] = ColumnWriter(self._base(day, name), self.block_size)
+                if writer.append(ts, value):
+                    saved += 1
+                else:
+                    self.out_of_order += 1
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+        return saved > 0
+
+    def _rollover(self, day):
+        """วันใหม่: ปิด writer ของวันก่อนหน้าและลบ partition ที่เก่ากว่า retention_days"""
+        self._writer_day = day
+        for key in [key for key in self._writers if key[0] < day]:
+            self._writers.pop(key).close()
+        if not self.retention_days:
+            return
+        cutoff = day_key(day_start(day) - self.retention_days * DAY_SECONDS)
+        for old in self.days():
+            if old < cutoff:
+                for key in [key for key in self._readers if key[0] == old]:
+                    del self._readers[key]
+                shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+                self.expired_days += 1
+
+    def _flush(self):
+        written = sum(writer.flush() for writer in self._writers.values())
+        self._last_flush = time.monotonic()
+        if written:
+            self.points_written += written
+            self.flushes += 1
+
+    def flush(self):
+        with self._lock:
+            self._drain()
+            self._flush()
+
+    def import_columns(self, columns):
+        """เขียนข้อมูลย้อนหลังเป็นชุด {parameter: (times, values)} (เรียงตามเวลาแล้ว)
+
+        แยกตามวันแล้วต่อท้ายแต่ละคอลัมน์ครั้งเดียว partition ที่ไม่ใช่วันปัจจุบัน
+        เปิดแล้วปิดทันที จุดที่เก่ากว่าข้อมูลที่มีอยู่แล้วในคอลัมน์ถูกข้าม
+        (นับใน out_of_order) คืนจำนวนจุดที่เขียน
+
+        partition ของวันนี้เป็นของ process ที่บันทึกข้อมูลสด ถ้า process นี้ไม่มี
+        writer ของคอลัมน์นั้นเปิดอยู่จะข้าม ไม่ให้สอง process ต่อท้ายไฟล์เดียวกัน
+        วันที่เก่ากว่า retention_days ก็ข้ามเช่นกัน (ตั้ง retention_days เป็น 0
+        เพื่อเก็บข้อมูลย้อนหลังหลายปี) ทั้งสองกรณีนับใน import_skipped
+        """
+        written = 0
+        oldest = None
+        today = day_key(time.time())
+        cutoff = day_key(time.time() - self.retention_days * DAY_SECONDS) if self.retention_days else ""
+        with self._lock:
+            self._open()
+            for name, (times, values) in columns.items():
+                times = np.asarray(times, dtype=COLUMN)
+                values = np.asarray(values, dtype=COLUMN)
+                valid = np.isfinite(values) & np.isfinite(times)
+                times, values = times[valid], values[valid]
+                if not len(times):
+                    continue
+                days = np.floor_divide(times, DAY_SECONDS)
+                bounds = np.flatnonzero(np.diff(days)) + 1
+                for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(times)]))):
+                    day = day_key(float(times[lo]))
+                    writer = self._writers.get((day, name))
+                    temporary = writer is None
+                    if day < cutoff or (temporary and day >= today):
+                        self.import_skipped += int(hi - lo)
+                        continue
+                    if temporary:
+                        os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+                        writer = ColumnWriter(self._base(day, name), self.block_size)
+                    added = writer.extend(times[lo:hi], values[lo:hi])
+                    written += added
+                    if added and (oldest is None or times[lo] < oldest):
+                        oldest = float(times[lo])
+                    self.out_of_order += int(hi - lo) - added
+                    if temporary:
+                        self.points_written += writer.flush()
+                        writer.close()
+        if oldest is not None:
+            query_cache.invalidate_from(oldest)
+        return written
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._drain()
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+            self._readers.clear()
+
+    # ---- read ----
+
+    def columns(self, names, start, stop):
+        """{parameter: (times, values)} ในช่วง [start, stop) (epoch วินาที) ต่อกันทุกวัน"""
+        self.flush()
+        out = {}
+        for name in names:
+            times, values = [], []
+            for day in self._days_between(start, stop):
+                reader = self._reader(day, name)
+                lo, hi = reader.span(start, stop)
+                if hi > lo:
+                    times.append(reader.times[lo:hi])
+                    values.append(reader.values[lo:hi])
+            if len(times) == 1:
+                out[name] = (times[0], values[0])
+            elif times:
+                out[name] = (np.concatenate(times), np.concatenate(values))
+            else:
+                out[name] = (np.empty(0, dtype=COLUMN), np.empty(0, dtype=COLUMN))
+        return out
+
+    def bucket_rows(self, parameters, start, stop, every, thresholds=None):
+        """สรุปเป็น bucket รูปแบบเดียวกับ downsampling.merge_bucket_rows"""
+        thresholds = thresholds or {}
+        self.flush()
+        rows = {}
+        days = self._days_between(start, stop)
+        for name in parameters:
+            by_time = {}
+            for day in days:
+                self._reader(day, name).bucket_rows(start, stop, every, thresholds.get(name), by_time)
+            if by_time:
+                rows[name] = by_time
+        return rows
+
+    def fetch_bucket_rows(self, parameters, start, stop, every, thresholds, configured=True):
+        return self.bucket_rows(parameters, start, stop, every, thresholds), 'local'
+
+    def get_latest_data(self, parameter=None, limit=1):
+        """ค่าล่าสุด (จากหน่วยความจำ ถ้ายังไม่มีจึงอ่านจุดสุดท้ายของแต่ละคอลัมน์)"""
+        latest = live_store.get_latest(parameter)
+        if latest:
+            return latest
+        self.flush()
+        days = self.days()
+        if not days:
+            return None
+        day = days[-1]
+        names = [parameter] if parameter else self._parameters(day)
+        data = {}
+        for name in names:
+            reader = self._reader(day, name)
+            if reader.size:
+                data[name] = float(reader.values[-1])
+        return data or None
+
+    def get_first_timestamp(self):
+        self.flush()
+        for day in self.days():
+            firsts = [self._reader(day, name).times[:1] for name in self._parameters(day)]
+            firsts = [float(t[0]) for t in firsts if len(t)]
+            if firsts:
+                return datetime.fromtimestamp(min(firsts), tz=timezone.utc)
+        return None
+
+    def get_parameter_names(self):
+        names = set()
+        for day in self.days():
+            names.update(self._parameters(day))
+        return sorted(names)
+
+    def iter_sensor_rows(self, fields, start, stop, chunk_hours=24):
+        """อ่านข้อมูลเป็นแถว (time, {parameter: value}) เรียงตามเวลา ทีละ chunk_hours"""
+        cursor, end = start.timestamp(), stop.timestamp()
+        chunk = chunk_hours * 3600
+        while cursor < end:
+            upper = min(cursor + chunk, end)
+            times, aligned = _align(self.columns(fields, cursor, upper))
+            columns = [aligned[field] for field in fields]
+            for i, ts in enumerate(times):
+                yield datetime.fromtimestamp(ts, tz=timezone.utc), {
+                    field: column[i] for field, column in zip(fields, columns)
+                }
+            cursor = upper
+
+    def latest_rows(self, fields, limit=100, hours=24):
+        """แถวล่าสุด ใหม่สุดก่อน (อ่านย้อนทีละวันจนได้ครบ limit แถว)"""
+        self.flush()
+        stop = time.time() + 1
+        since = stop - float(hours) * 3600
+        rows = []
+        for day in reversed(self._days_between(since, stop)):
+            lower = max(since, day_start(day))
+            columns = {}
+            for field in fields:
+                reader = self._reader(day, field)
+                lo, hi = reader.span(lower, stop)
+                # แต่ละคอลัมน์ใช้แค่ limit จุดท้าย เวลาร่วมจึงไม่เกิน limit ต่อคอลัมน์
+                lo = max(lo, hi - (limit - len(rows)))
+                columns[field] = (reader.times[lo:hi], reader.values[lo:hi])
+            times, aligned = _align(columns)
+            for i in range(len(times) - 1, -1, -1):
+                rows.append((datetime.fromtimestamp(times[i], tz=timezone.utc),
+                             {field: aligned[field][i] for field in fields}))
+                if len(rows) >= limit:
+                    return rows
+        return rows
+
+    def stats(self):
+        self.flush()
+        days = self.days()
+        disk_bytes = 0
+        for day in days:
+            folder = os.path.join(self.directory, day)
+            disk_bytes += sum(_file_size(os.path.join(folder, e)) for e in os.listdir(folder))
+        return {
+            "directory": os.path.abspath(self.directory),
+            "block_size": self.block_size,
+            "retention_days": self.retention_days,
+            "days": len(days),
+            "first_day": days[0] if days else None,
+            "last_day": days[-1] if days else None,
+            "open_columns": len(self._writers),
+            "points_written": self.points_written,
+            "out_of_order": self.out_of_order,
+            "flushes": self.flushes,
+            "expired_days": self.expired_days,
+            "import_skipped": self.import_skipped,
+            "queue_depth": len(self._pending),
+            "dropped": self.dropped,
+            "disk_bytes": disk_bytes,
+        }
@@ -0,0 +1,132 @@
+import io
+import zlib
+from datetime import datetime, timezone
+
+# ขนาด buffer ก่อนส่งออกแต่ละ chunk ของ response
+FLUSH_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "CEMS_DataLog.csv"),
+    "gzip": ("application/gzip", "CEMS_DataLog.csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "CEMS_DataLog.parquet"),
+}
+
+
+def parse_local_datetime(value):
+    """แปลง "YYYY-MM-DD HH:MM:SS" (เวลาเครื่อง) เป็น datetime UTC"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).astimezone().astimezone(timezone.utc)
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date: {value}")
+
+
+def format_local_time(dt):
+    """แสดงเวลาแบบเดียวกับ CEMS_DataLog.csv (เวลาเครื่อง)"""
+    return dt.astimezone().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def csv_stream(rows, fields):
+    """สร้าง CSV ทีละแถวจาก iterator ของ (time, {parameter: value})"""
+    buffer = io.StringIO()
+    buffer.write(",".join(["Timestamp"] + list(fields)) + "\n")
+    for ts, values in rows:
+        buffer.write(format_local_time(ts))
+        for field in fields:
+            buffer.write(",")
+            buffer.write(_format_value(values.get(field)))
+        buffer.write("\n")
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_stream(chunks, level=6):
+    """บีบอัด stream ของ bytes เป็น gzip แบบไม่ต้องเก็บทั้งไฟล์ในหน่วยความจำ"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _DrainSink:
+    """file-like สำหรับ ParquetWriter ที่ดึง bytes ออกไปส่งได้เรื่อย ๆ"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_stream(rows, fields, row_group_size=50000):
+    """เขียน Parquet เป็น row group ทีละชุด (ต้องติดตั้ง pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [pa.field("Timestamp", pa.timestamp("ms", tz="UTC"))]
+        + [pa.field(field, pa.float64()) for field in fields]
+    )
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+
+    def flush_group(times, columns):
+        arrays = [pa.array(times, type=pa.timestamp("ms", tz="UTC"))]
+        arrays += [pa.array(columns[field], type=pa.float64()) for field in fields]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    times, columns = [], {field: [] for field in fields}
+    for ts, values in rows:
+        times.append(ts)
+        for field in fields:
+            value = values.get(field)
+            columns[field].append(None if value is None else float(value))
+        if len(times) >= row_group_size:
+            flush_group(times, columns)
+            times, columns = [], {field: [] for field in fields}
+            yield sink.drain()
+    if times:
+        flush_group(times, columns)
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(rows, fields, fmt="csv"):
+    """เลือกตัวเข้ารหัสตามรูปแบบไฟล์"""
+    if fmt == "parquet":
+        return parquet_stream(rows, fields)
+    chunks = csv_stream(rows, fields)
+    if fmt == "gzip":
+        return gzip_stream(chunks)
+    return chunks
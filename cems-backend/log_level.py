@@ -0,0 +1,36 @@
+import os
+
+# ระดับ log ของ backend (ข้อความที่เกิดทุกรอบ poll อยู่ที่ debug)
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+_level = LEVELS.get(os.environ.get("CEMS_LOG_LEVEL", "info").lower(), LEVELS["info"])
+
+
+def set_log_level(name):
+    """ตั้งระดับ log จาก config (ตัวแปร CEMS_LOG_LEVEL มีความสำคัญกว่า)"""
+    global _level
+    name = os.environ.get("CEMS_LOG_LEVEL", name or "info").lower()
+    _level = LEVELS.get(name, LEVELS["info"])
+
+
+def enabled(level):
+    return LEVELS[level] >= _level
+
+
+def debug(message):
+    if _level <= 10:
+        print(message)
+
+
+def info(message):
+    if _level <= 20:
+        print(message)
+
+
+def warning(message):
+    if _level <= 30:
+        print(message)
+
+
+def error(message):
+    print(message)
@@ -1,6 +1,10 @@
+from startup_state import startup
 import asyncio
+import hashlib
 import uvicorn
-from fastapi import FastAPI
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -8,20 +12,184 @@ from contextlib import asynccontextmanager
 from app.core.config import config_manager
 from app.services.modbus_service import modbus_service
 from app.api.routes import config_routes, data_routes, auth_routes, websocket_routes
+from database_influx import (
+    influx_manager, init_influx_database, close_influx_database,
+    get_influx_writer_stats, get_influx_spool_stats, get_influx_rollup_stats,
+    get_history_buckets_from_influx, get_system_alerts_from_influx,
+    get_sensor_storage, get_latest_rows_from_storage, get_local_store_stats
+)
+from database_influx import load_config
+from log_export import EXPORT_FORMATS, export_stream, parse_local_datetime, format_local_time
+from modbus_planner import read_planner, load_mapping
+from poll_scheduler import poll_scheduler
+from modbus_pool import modbus_pool
+from broadcast_hub import broadcast_hub
+from ws_frames import flatten_numeric
+from live_store import live_store
+from query_cache import query_cache
+from config_store import config_store, mapping_store, config_version
+from compliance_engine import compliance_engine
+from alarm_engine import alarm_engine
+from alert_index import alert_index
+from device_discovery import device_discovery
+from acquisition import ingest, compliance_loop, acquisition_settings, AcquisitionMirror, RingConsumer, main as run_acquisition
+from csv_import import CsvImporter, import_jobs, import_settings, parse_mapping, resolve_import_path
+from metrics import registry, http_request_seconds, loop_lag_monitor
+import log_level
+import json
+import multiprocessing
+import os
+import time
+
+startup.mark("imports")
+
+# ลำดับค่าใน msg.gas ที่หน้า Home ใช้
+GAS_FIELDS = ["SO2", "NOx", "O2", "CO", "Dust", "Temperature", "Velocity", "Flowrate", "Pressure"]
+
+# อ่าน sample จาก acquisition process (เมื่อ acquisition.mode = "process")
+ring_consumer = None
+# ค่า Corr/alarm/compliance ที่ acquisition process คำนวณแล้ว (โหมด process)
+acquisition_mirror = AcquisitionMirror()
+
+async def store_sample(device_name, values):
+    """Keep the sample in memory and persist it (queued, never blocks the poller)"""
+    ts = time.time()
+    live_store.update(values, ts)
+    await ingest(values, ts, device_name)
+
+def on_ring_message(message):
+    """Sample/alert/state produced by the acquisition process (already persisted and evaluated there)"""
+    if message.get("kind") == "sample":
+        live_store.update(message["values"], message["time"])
+    elif message.get("kind") == "alert":
+        alert_index.add(message["alert"])
+    acquisition_mirror.apply(message)
+
+def current_compliance():
+    """(snapshot, stats) of the compliance averages, from the acquisition process in process mode"""
+    if ring_consumer is not None:
+        return acquisition_mirror.compliance_snapshot(), acquisition_mirror.compliance_stats
+    return compliance_engine.snapshot(), compliance_engine.stats()
+
+def current_alarms():
+    """(active alarms, stats), from the acquisition process in process mode"""
+    if ring_consumer is not None:
+        return acquisition_mirror.active, acquisition_mirror.alarm_stats
+    return alarm_engine.active(), alarm_engine.stats()
+
+async def compliance_snapshot():
+    """Block/rolling averages for /ws/compliance"""
+    return current_compliance()[0]
+
+async def gas_snapshot():
+    """One /ws/gas frame, built once per cycle for every viewer"""
+    latest = live_store.latest
+    if not latest:
+        return None
+    frame = {"gas": [latest.get(name) for name in GAS_FIELDS]}
+    derived = compliance_engine.latest if ring_consumer is None else acquisition_mirror.derived
+    for gas in compliance_engine.gases:
+        frame[f"{gas}Corr"] = derived.get(f"{gas}Corr")
+    return frame
+
+def gas_values(frame):
+    """{parameter: value} of a /ws/gas frame for binary/filtered clients ({} for control messages)"""
+    if "gas" not in frame:
+        return {}
+    values = dict(zip(GAS_FIELDS, frame["gas"]))
+    values.update((k, v) for k, v in frame.items() if k != "gas")
+    return values
+
+def compliance_values(snapshot):
+    """Numeric channels of a /ws/compliance snapshot (time travels in the frame header)"""
+    return flatten_numeric(snapshot, skip=("time",))
+
+def plan_reads_for_stats(config):
+    """Process mode: polling runs in the acquisition process, plan here only for /modbus/read-plan"""
+    connection = config.get("connection", {})
+    read_planner.configure(**connection.get("read_plan", {}))
+    read_planner.get_plan(load_mapping(), connection.get("devices", []))
+
+async def on_config_change(store):
+    """config.json/mapping.json changed: re-plan pollers and tell clients to refetch"""
+    if ring_consumer is None:
+        await poll_scheduler.apply(load_config() or {}, load_mapping())
+    else:
+        plan_reads_for_stats(load_config() or {})
+    compliance_engine.configure(load_config())
+    broadcast_hub.publish("gas", {"config_version": config_version()})
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Load configuration
-    config_manager.load_config()
-    
-    # Initialize services
     print("🚀 Starting CEMS Backend...")
+    with startup.phase("config"):
+        config_manager.load_config()
+        config = load_config() or {}
+        log_level.set_log_level(config.get("log_level"))
+        live_store.configure(**config.get("live_store", {}))
+        query_cache.configure(**config.get("query_cache", {}))
+        broadcast_hub.configure(**config.get("websocket", {}))
+        compliance_engine.configure(config)
+    loop_lag_monitor.start()
+
+    acquisition = acquisition_settings(config)
+    separate = acquisition["mode"] == "process"
+
+    # InfluxDB เชื่อมต่อเบื้องหลัง ระหว่างนั้นข้อมูลเข้า live_store/spool ตามปกติ
+    # โหมด process: spool/replay/rollup เป็นของ acquisition process ฝั่งนี้เชื่อมต่อเพื่อ query เท่านั้น
+    if influx_manager.enabled:
+        if not separate:
+            influx_manager.open_spool()
+        influx_task = asyncio.create_task(startup.run("influx", init_influx_database(owner=not separate)))
+    else:
+        influx_task = None
+        startup.done("influx", "disabled")
+
+    if not separate:
+        with startup.phase("modbus_pool"):
+            modbus_pool.configure(**config.get("connection", {}).get("pool", {}))
+            modbus_pool.start()
+    with startup.phase("broadcast"):
+        broadcast_hub.register("gas", gas_snapshot, interval=config.get("connection", {}).get("ws_interval", 1.0),
+                               flatten=gas_values)
+        broadcast_hub.register("compliance", compliance_snapshot, interval=config.get("compliance", {}).get("ws_interval", 5.0),
+                               flatten=compliance_values)
+    with startup.phase("pollers"):
+        if separate:
+            # polling/บันทึกข้อมูลอยู่ใน acquisition process ฝั่งนี้แค่อ่าน ring
+            global ring_consumer
+            ring_consumer = RingConsumer(acquisition["ring_name"], acquisition.get("ring_poll_interval", 0.05))
+            ring_consumer.start(on_ring_message)
+            plan_reads_for_stats(config)
+            compliance_task = None
+        else:
+            compliance_task = asyncio.create_task(compliance_loop())
+            poll_scheduler.add_sink(store_sample)
+            await poll_scheduler.apply(config, load_mapping())
+    for store in (config_store, mapping_store):
+        store.on_change(on_config_change)
+        store.watch(config.get("config_watch_interval", 2.0))
+    print(f"✅ Backend ready in {startup.report()['uptime_ms']:.0f} ms")
     
     yield
 
     # Cleanup
+    if influx_task:
+        influx_task.cancel()
+    if compliance_task:
+        compliance_task.cancel()
+    if ring_consumer:
+        await ring_consumer.stop()
+    await loop_lag_monitor.stop()
+    await config_store.stop()
+    await mapping_store.stop()
+    await broadcast_hub.close()
+    await poll_scheduler.stop()
     await modbus_service.close_all()
+    await modbus_pool.close_all()
+    await close_influx_database()
     print("🛑 CEMS Backend stopped")
 
 # Create FastAPI app
@@ -41,6 +209,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def config_etag(request: Request, call_next):
+    """ETag / If-None-Match for GET /config/* so unchanged config returns 304"""
+    response = await call_next(request)
+    if request.method != "GET" or not request.url.path.startswith("/config") or response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    headers["ETag"] = etag
+    headers["Cache-Control"] = "no-cache"
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(content=body, status_code=200, headers=headers, media_type=response.media_type)
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Request latency per route template (not per raw path, to keep label cardinality bounded)"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    http_request_seconds.labels(
+        request.method, getattr(route, "path", "unmatched"), response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+@app.get("/config/version")
+async def get_config_version():
+    """Current config/mapping snapshot versions (also pushed on /ws/gas when they change)"""
+    return {
+        "version": config_version(),
+        "config": config_store.stats(),
+        "mapping": mapping_store.stats()
+    }
+
+# WebSocket fan-out ผ่าน hub (ประกาศก่อน websocket_routes เพื่อให้ใช้ route นี้)
+@app.websocket("/ws/gas")
+async def ws_gas(websocket: WebSocket):
+    await broadcast_hub.serve(websocket, "gas")
+
+@app.websocket("/ws/compliance")
+async def ws_compliance(websocket: WebSocket):
+    await broadcast_hub.serve(websocket, "compliance")
+
+@app.websocket("/ws/stream")
+async def ws_stream(websocket: WebSocket):
+    """Multiplexed topics: the client picks topics/parameters with subscribe messages"""
+    await broadcast_hub.serve(websocket)
+
+# log preview จาก storage backend ที่ใช้อยู่ (ประกาศก่อน router เดิมเพื่อให้ใช้ route นี้)
+def _log_rows(rows):
+    return [{"Timestamp": format_local_time(ts), **values} for ts, values in rows]
+
+@app.get("/log-preview")
+@app.get("/api/log-preview")
+async def log_preview(limit: int = 100, hours: float = 24, fields: str = None):
+    """Latest sensor rows, newest first (Home shows the first row)"""
+    keys = [f.strip() for f in (fields or "").split(",") if f.strip()] or GAS_FIELDS
+    if not get_sensor_storage().connected:
+        raise HTTPException(status_code=503, detail="Storage not available")
+    return _log_rows(await get_latest_rows_from_storage(keys, max(1, min(limit, 5000)), hours))
+
+@app.get("/logs/influxdb")
+@app.get("/api/logs/influxdb")
+async def parameter_logs(parameter: str = None, limit: int = 200, hours: float = 168):
+    """Latest rows of one parameter (or all gas fields), newest first"""
+    keys = [parameter] if parameter else GAS_FIELDS
+    if not get_sensor_storage().connected:
+        raise HTTPException(status_code=503, detail="Storage not available")
+    return _log_rows(await get_latest_rows_from_storage(keys, max(1, min(limit, 5000)), hours))
+
 # Include routes
 app.include_router(config_routes.router, prefix="/config", tags=["config"])
 app.include_router(data_routes.router, prefix="/api/data", tags=["data"])
@@ -56,17 +295,283 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+async def readiness():
+    """Startup progress per subsystem; 503 until config and pollers are up (InfluxDB may still be connecting)"""
+    report = {**startup.report(), "influx_connected": influx_manager.connected,
+              "storage": get_sensor_storage().name}
+    return JSONResponse(report, status_code=200 if startup.ready else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of Modbus, InfluxDB, WebSocket, event-loop and HTTP metrics"""
+    return Response(content=registry.render(), media_type=registry.CONTENT_TYPE)
+
+@app.get("/influx/stats")
+async def influx_stats():
+    """InfluxDB write pipeline statistics"""
+    return {
+        "connected": influx_manager.connected,
+        "writer": get_influx_writer_stats(),
+        "spool": get_influx_spool_stats(),
+        "rollup": get_influx_rollup_stats(),
+        "live": live_store.stats()
+    }
+
+@app.get("/storage/stats")
+async def storage_stats():
+    """Which backend serves history/export/preview, and the local column store state"""
+    return {
+        "reading_from": get_sensor_storage().name,
+        "influx_connected": influx_manager.connected,
+        "local": await asyncio.to_thread(get_local_store_stats),
+        "query_cache": query_cache.stats()
+    }
+
+@app.get("/logs/influxdb/buckets")
+async def history_buckets(
+    parameters: str,
+    hours: float = 24,
+    max_points: int = 500,
+    method: str = "aggregate",
+    thresholds: str = None
+):
+    """Pre-bucketed history (min/max/mean/count/alarms) for several parameters
+
+    thresholds overrides the configured alarm limits, e.g. "SO2:80,NOx:200".
+    """
+    keys = [p.strip() for p in parameters.split(",") if p.strip()]
+    if not keys:
+        raise HTTPException(status_code=400, detail="parameters is required")
+    if method not in ("aggregate", "lttb"):
+        raise HTTPException(status_code=400, detail="method must be 'aggregate' or 'lttb'")
+
+    limits = None
+    if thresholds:
+        try:
+            limits = {
+                k.strip(): float(v)
+                for k, v in (item.split(":", 1) for item in thresholds.split(",") if item.strip())
+            }
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid thresholds")
+
+    result = await get_history_buckets_from_influx(
+        keys, hours, max(1, min(max_points, 10000)), method, limits
+    )
+    if result is None:
+        raise HTTPException(status_code=503, detail="Storage not available")
+    return result
+
+@app.get("/download-logs")
+@app.get("/api/download-logs")
+async def download_logs(
+    from_date: str = None,
+    to_date: str = None,
+    download_all: bool = False,
+    fields: str = None,
+    format: str = "csv"
+):
+    """Stream sensor logs as CSV, gzipped CSV or Parquet with bounded memory"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    storage = get_sensor_storage()
+    if not storage.connected:
+        raise HTTPException(status_code=503, detail="Storage not available")
+
+    keys = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    try:
+        if not keys:
+            keys = await asyncio.to_thread(storage.get_parameter_names)
+        stop = parse_local_datetime(to_date) if to_date and not download_all else datetime.now(timezone.utc)
+        if from_date and not download_all:
+            start = parse_local_datetime(from_date)
+        else:
+            start = await asyncio.to_thread(storage.get_first_timestamp) or stop
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type, filename = EXPORT_FORMATS[format]
+    rows = storage.iter_sensor_rows(keys, start, stop)
+    return StreamingResponse(
+        export_stream(rows, keys, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/import-csv")
+async def start_csv_import(request: Request):
+    """Import a historical CSV log from the import directory in the background
+
+    Body: {"path": "...", "workers": 4, "utc": false, "device": "import",
+    "map": ["SO2 ppm=SO2"], "only_mapped": false, "restart": false}.
+    "path" is relative to csv_import.directory in config.json (default
+    "imports"); paths outside it are rejected. Progress (rows/s, byte offset)
+    is on GET /api/import-csv; an interrupted import resumes from its
+    checkpoint when started again.
+    """
+    body = await request.json()
+    try:
+        path = resolve_import_path(body.get("path"), import_settings(load_config())["directory"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = path
+    job = import_jobs.get(key)
+    if job is not None and job.state == "running":
+        raise HTTPException(status_code=409, detail="import already running for this file")
+    try:
+        importer = CsvImporter(
+            path, body.get("workers", 4), body.get("chunk_mb", 8), body.get("batch_size", 5000),
+            bool(body.get("utc")), body.get("device", "import"), parse_mapping(body.get("map")),
+            bool(body.get("only_mapped")), restart=bool(body.get("restart"))
+        )
+    except (OSError, ValueError, StopIteration) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if importer.influx is None and importer.local is None:
+        raise HTTPException(status_code=503, detail="Storage not available")
+    import_jobs[key] = importer
+
+    async def run_import():
+        try:
+            await asyncio.to_thread(importer.run)
+        except Exception as e:
+            log_level.error(f"❌ CSV import {key} failed: {e}")
+    asyncio.create_task(run_import())
+    return importer.stats()
+
+@app.get("/api/import-csv")
+async def csv_import_status():
+    """Progress of CSV imports started through the API"""
+    return {"jobs": [job.stats() for job in import_jobs.values()]}
+
+@app.delete("/api/import-csv")
+async def cancel_csv_import(path: str):
+    """Stop an import after the chunks in flight; the checkpoint keeps its progress"""
+    try:
+        key = resolve_import_path(path, import_settings(load_config())["directory"])
+    except ValueError:
+        key = None
+    job = import_jobs.get(key)
+    if job is None:
+        raise HTTPException(status_code=404, detail="no import for this file")
+    job.cancel()
+    return job.stats()
+
+@app.get("/modbus/read-plan")
+async def modbus_read_plan():
+    """Coalesced Modbus block reads planned from mapping.json (the plan the pollers use)"""
+    return read_planner.stats()
+
+@app.get("/modbus/poll-stats")
+async def modbus_poll_stats():
+    """Per-device poll cycle latency, overruns and error counts"""
+    return poll_scheduler.stats()
+
+@app.get("/acquisition/stats")
+async def acquisition_stats():
+    """Acquisition mode and shared-memory ring state (process mode)"""
+    return {
+        "mode": "process" if ring_consumer else "inline",
+        "consumer": ring_consumer.stats() if ring_consumer else None
+    }
+
+@app.get("/modbus/pool-stats")
+async def modbus_pool_stats():
+    """Shared Modbus TCP connections: reuse, probes, evictions and waits per endpoint"""
+    return modbus_pool.stats()
+
+@app.get("/compliance/averages")
+async def compliance_averages():
+    """Current O2-corrected block and rolling averages per channel"""
+    snapshot, stats = current_compliance()
+    return {**snapshot, "stats": stats}
+
+@app.get("/alerts")
+async def list_alerts(hours: float = 24, limit: int = 100, before: float = None, type: str = None):
+    """Alert log, newest first; pass the last item's epoch time as `before` for the next page"""
+    limit = max(1, min(limit, 1000))
+    alerts = await get_system_alerts_from_influx(hours, limit, before, type)
+    return {
+        "alerts": alerts,
+        "next_before": datetime.fromisoformat(alerts[-1]["time"]).timestamp() if len(alerts) == limit else None
+    }
+
+@app.get("/alerts/active")
+async def active_alerts():
+    """Currently raised threshold/alarm-bit alerts"""
+    active, stats = current_alarms()
+    return {"active": active, "stats": stats, "index": alert_index.stats()}
+
+@app.post("/api/scan-devices")
+async def scan_devices(request: Request):
+    """Scan an IP range x ports x slave IDs (or an RTU port) concurrently.
+
+    Send `Accept: text/event-stream` (or "stream": true) to receive each hit
+    as a server-sent event while the scan runs; otherwise all hits are
+    returned together when the scan finishes.
+    """
+    scan_request = await request.json()
+    try:
+        events = device_discovery.scan(scan_request)
+        stream = scan_request.get("stream") or "text/event-stream" in request.headers.get("accept", "")
+        if stream:
+            async def sse():
+                try:
+                    async for event in events:
+                        yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                except ValueError as e:
+                    yield f"event: error\ndata: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            return StreamingResponse(sse(), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        devices, summary = [], {}
+        async for event in events:
+            if event["type"] == "hit":
+                devices.append(event)
+            elif event["type"] == "done":
+                summary = event
+        return {"devices": devices, **summary}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    """Per-topic subscriber counts, drops and send lag"""
+    return broadcast_hub.stats()
+
 @app.get("/")
 async def root():
     """Root endpoint - Home page data"""
     return config_manager.config
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     print("=" * 50)
     print("🔗 CEMS Backend Starting...")
     print("🔗 API: http://127.0.0.1:8000")
     print("🔗 Health: http://127.0.0.1:8000/health")
     print("🔗 WebSocket: ws://127.0.0.1:8000/ws/gas")
     print("=" * 50)
-    
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
+
+    acquisition = acquisition_settings(load_config())
+    acquisition_process = None
+    if acquisition["mode"] == "process" and acquisition.get("spawn", True):
+        # acquisition แยก process: sampling ไม่สะดุดจากงานของ API และรัน API หลาย worker ได้
+        acquisition_process = multiprocessing.Process(target=run_acquisition, name="cems-acquisition")
+        acquisition_process.start()
+        print(f"🔗 Acquisition process: pid {acquisition_process.pid}")
+    if int(acquisition.get("api_workers", 1)) > 1:
+        # import job, query cache, alert index ฯลฯ ยังอยู่ใน process ของแต่ละ worker
+        # request ถัดไปอาจไปถึง worker อื่นที่ไม่รู้สถานะ จึงรันได้ worker เดียว
+        log_level.warning("⚠️ acquisition.api_workers > 1 is not supported (per-process job and cache state), using 1")
+
+    try:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
+    finally:
+        if acquisition_process is not None:
+            acquisition_process.terminate()
+            acquisition_process.join(10)
@@ -0,0 +1,289 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+
+# ขอบ bucket (วินาที) สำหรับ latency ตั้งแต่ 0.5ms ถึง 10s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """ฐานของ metric: เก็บ child แยกตามค่า label (สร้างครั้งแรกครั้งเดียวแล้วใช้ซ้ำ)"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._function = None
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """child ของค่า label นี้ ควรเก็บไว้ใช้ซ้ำใน hot path แทนการเรียกทุกครั้ง"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(v) for v in values), None)
+
+    def set_function(self, fn):
+        """อ่านค่าจาก fn() ตอน scrape แทน คืนตัวเลข หรือ {label tuple: ตัวเลข}"""
+        self._function = fn
+
+    def _samples(self):
+        if self._function is not None:
+            result = self._function()
+            if isinstance(result, dict):
+                for values, value in result.items():
+                    values = values if isinstance(values, tuple) else (values,)
+                    yield "", _label_text(self.labelnames, values), value
+            elif result is not None:
+                yield "", "", result
+            return
+        for values, child in list(self._children.items()):
+            yield from child.samples(self.labelnames, values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, names, values):
+        yield "", _label_text(names, values), self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, names, values):
+        yield "", _label_text(names, values), self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._children[()].value = value
+
+
+class _HistogramChild:
+    """count ต่อ bucket จองไว้ล่วงหน้า observe() เป็นแค่ bisect + บวกเลข"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, names, values):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            yield "_bucket", _label_text(names, values, f'le="{_format_value(bound)}"'), cumulative
+        yield "_sum", _label_text(names, values), self.sum
+        yield "_count", _label_text(names, values), cumulative
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+
+class Registry:
+    """รวม metric ทั้งหมดแล้ว render เป็น Prometheus text format (0.0.4)"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """วัด event-loop lag: sleep interval แล้วดูว่าตื่นช้ากว่ากำหนดเท่าไร"""
+
+    def __init__(self, histogram, interval=0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            self.histogram.observe(self.last_lag)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="loop-lag")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class Timer:
+    """with Timer(histogram_child): ... บันทึกเวลาที่ใช้ (วินาที)"""
+
+    __slots__ = ("target", "started")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.started)
+        return False
+
+
+# Global registry และ metric ของเส้นทางหลัก
+registry = Registry()
+
+modbus_read_seconds = registry.histogram(
+    "cems_modbus_read_seconds", "Modbus poll cycle duration per device", ("device",))
+modbus_errors_total = registry.counter(
+    "cems_modbus_errors_total", "Failed Modbus poll cycles per device", ("device",))
+modbus_decode_seconds = registry.histogram(
+    "cems_modbus_decode_seconds", "Time to decode one register block",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005))
+influx_write_seconds = registry.histogram(
+    "cems_influx_write_seconds", "InfluxDB batch write latency")
+influx_query_seconds = registry.histogram(
+    "cems_influx_query_seconds", "InfluxDB query latency", ("query",))
+influx_points_written = registry.counter(
+    "cems_influx_points_written_total", "Points written to InfluxDB")
+influx_points_dropped = registry.counter(
+    "cems_influx_points_dropped_total", "Points dropped after retries and spool failed")
+influx_queue_depth = registry.gauge(
+    "cems_influx_queue_depth", "Points waiting in the write queue")
+query_cache_requests = registry.counter(
+    "cems_query_cache_requests_total", "History/log query cache lookups by result (hit, miss, shared)", ("result",))
+query_cache_bytes = registry.gauge(
+    "cems_query_cache_bytes", "Estimated size of cached query results")
+ws_clients = registry.gauge(
+    "cems_ws_clients", "Connected WebSocket clients per topic", ("topic",))
+ws_send_lag_seconds = registry.histogram(
+    "cems_ws_send_lag_seconds", "Delay between publish and WebSocket send", ("topic",))
+ws_dropped_total = registry.gauge(
+    "cems_ws_dropped_messages", "Messages dropped for slow WebSocket clients (current subscribers)", ("topic",))
+ws_sent_bytes_total = registry.counter(
+    "cems_ws_sent_bytes_total", "Bytes sent to WebSocket clients", ("topic", "format"))
+event_loop_lag_seconds = registry.histogram(
+    "cems_event_loop_lag_seconds", "Event loop wake-up delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+http_request_seconds = registry.histogram(
+    "cems_http_request_seconds", "HTTP request latency per route", ("method", "route", "status"))
+
+loop_lag_monitor = LoopLagMonitor(event_loop_lag_seconds)
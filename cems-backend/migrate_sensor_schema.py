@@ -0,0 +1,123 @@
+"""
+Migrate sensor data from the narrow schema to the wide schema
+
+narrow: sensor_data,parameter=<name> value=<v>      (แถวละพารามิเตอร์ แบบเดิม)
+wide:   sensor_row,device=<device> <name>=<v>,...   (แถวเดียวต่ออุปกรณ์)
+
+คัดลอกข้อมูลเก่าฝั่ง server ด้วย Flux to() ทีละช่วงเวลา (ไม่ดึงข้อมูลผ่าน Python)
+device ของแต่ละพารามิเตอร์มาจาก mapping.json พารามิเตอร์ที่ไม่มีใน mapping ใช้ --default-device
+
+ขั้นตอนที่แนะนำ:
+    1. ตั้ง "influxdb": {"schema": "dual"} ใน config.json (เขียนทั้งสองแบบ อ่านจาก narrow)
+    2. python migrate_sensor_schema.py --stop <เวลาที่เริ่มใช้ dual>
+    3. ตั้ง "schema": "wide" เมื่อ migrate เสร็จ (ข้อมูล narrow ลบทิ้งภายหลังได้)
+
+ตัวอย่าง:
+    python migrate_sensor_schema.py --dry-run
+    python migrate_sensor_schema.py --start 2024-01-01T00:00:00Z --chunk-hours 24
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import downsampling
+from database_influx import influx_manager
+from line_protocol import NARROW_MEASUREMENT, WIDE_MEASUREMENT
+from modbus_planner import load_mapping
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def device_groups(mapping, default_device):
+    """{device: [parameter, ...]} จาก mapping.json"""
+    groups = {}
+    for entry in mapping:
+        if entry.get("name"):
+            groups.setdefault(entry.get("device") or default_device, []).append(entry["name"])
+    return groups
+
+
+def build_copy_query(bucket, org, start, stop, device, parameters=None, exclude=None):
+    """Flux ที่คัดลอกข้อมูล narrow ของพารามิเตอร์ชุดหนึ่งไปเป็น wide (device เดียว)"""
+    lines = [
+        f'from(bucket: {downsampling.flux_string(bucket)})',
+        f'    |> range(start: {downsampling.flux_time(start)}, stop: {downsampling.flux_time(stop)})',
+        f'    |> filter(fn: (r) => r["_measurement"] == "{NARROW_MEASUREMENT}" and r["_field"] == "value")',
+    ]
+    if parameters:
+        lines.append(f'    |> filter(fn: (r) => contains(value: r["parameter"], set: {downsampling.flux_string_set(parameters)}))')
+    if exclude:
+        lines.append(f'    |> filter(fn: (r) => not contains(value: r["parameter"], set: {downsampling.flux_string_set(exclude)}))')
+    lines += [
+        f'    |> map(fn: (r) => ({{_time: r._time, _measurement: "{WIDE_MEASUREMENT}", '
+        f'_field: r.parameter, _value: float(v: r._value), device: {downsampling.flux_string(device)}}}))',
+        f'    |> to(bucket: {downsampling.flux_string(bucket)}, org: {downsampling.flux_string(org)}, tagColumns: ["device"])',
+        '    |> count()',
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy narrow sensor_data rows into the wide sensor_row schema")
+    parser.add_argument("--start", help="ISO time (default: first narrow point)")
+    parser.add_argument("--stop", help="ISO time (default: now)")
+    parser.add_argument("--chunk-hours", type=float, default=24)
+    parser.add_argument("--default-device", default="legacy", help="device tag for parameters not in mapping.json")
+    parser.add_argument("--dry-run", action="store_true", help="print the Flux for the first chunk and exit")
+    args = parser.parse_args()
+
+    config = influx_manager.config
+    if not config:
+        raise SystemExit("❌ No InfluxDB configuration")
+    if not (args.dry_run and args.start) and not influx_manager.connect():
+        raise SystemExit("❌ InfluxDB not available")
+    stop = parse_time(args.stop) if args.stop else datetime.now(timezone.utc)
+    if args.start:
+        start = parse_time(args.start)
+    else:
+        query = f'''
+        from(bucket: "{config['bucket']}")
+            |> range(start: 0)
+            |> filter(fn: (r) => r["_measurement"] == "{NARROW_MEASUREMENT}")
+            |> group()
+            |> first()
+        '''
+        start = next((rec.get_time() for table in influx_manager.query_api.query(query) for rec in table.records), None)
+        if start is None:
+            print("✅ No narrow data to migrate")
+            return
+
+    groups = device_groups(load_mapping(), args.default_device)
+    known = [name for names in groups.values() for name in names]
+    jobs = [(device, names, None) for device, names in groups.items()]
+    if args.default_device not in groups:
+        jobs.append((args.default_device, None, known))
+
+    chunk = timedelta(hours=args.chunk_hours)
+    print(f"🔁 Migrating {start.isoformat()} .. {stop.isoformat()} ({len(jobs)} device groups)")
+    cursor = start
+    total = 0
+    while cursor < stop:
+        end = min(cursor + chunk, stop)
+        started = time.perf_counter()
+        copied = 0
+        for device, names, exclude in jobs:
+            query = build_copy_query(config['bucket'], config['org'], cursor, end, device, names, exclude)
+            if args.dry_run:
+                print(query)
+                continue
+            copied += sum(rec.get_value() or 0 for table in influx_manager.query_api.query(query)
+                          for rec in table.records)
+        if args.dry_run:
+            return
+        total += copied
+        print(f"   {cursor.isoformat()} .. {end.isoformat()}: {copied} values ({time.perf_counter() - started:.1f}s)")
+        cursor = end
+    print(f"✅ Migrated {total} values; set influxdb.schema to \"wide\" to read from {WIDE_MEASUREMENT}")
+    influx_manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import re
+
+import numpy as np
+
+from formula_engine import FormulaError, compile_formula
+import log_level
+
+# dtype ของแต่ละ dataType (big-endian หลังเรียง byte ตาม byte order แล้ว)
+# int16 คงพฤติกรรมเดิม: อ่านเป็นค่า 0 - 65,535
+DATA_TYPES = {
+    "int16": np.dtype(">u2"),
+    "uint16": np.dtype(">u2"),
+    "int32": np.dtype(">i4"),
+    "uint32": np.dtype(">u4"),
+    "float32": np.dtype(">f4"),
+    "float64": np.dtype(">f8"),
+}
+
+BYTE_ORDERS = ("ABCD", "CDAB", "BADC", "DCBA")
+
+_ORDER_PATTERN = re.compile(r"[A-H]{2}(?:\s*[A-H]{2})*")
+
+
+def parse_byte_order(mapping):
+    """อ่าน byte order จาก byteOrder/dataFormat เช่น "Float CD AB" -> "CDAB"
+
+    คืนค่าหนึ่งใน ABCD (big-endian), CDAB (word swap), BADC (byte swap),
+    DCBA (little-endian) ใช้กับ 64-bit ได้ด้วย (เช่น "GH EF CD AB" -> CDAB)
+    """
+    for key in ("byteOrder", "dataFormat"):
+        value = mapping.get(key)
+        if not value:
+            continue
+        match = _ORDER_PATTERN.search(str(value))
+        if not match:
+            continue
+        letters = match.group(0).replace(" ", "")
+        words_reversed = letters[0] not in "AB"
+        bytes_swapped = letters[0] > letters[1]
+        return {
+            (False, False): "ABCD",
+            (True, False): "CDAB",
+            (False, True): "BADC",
+            (True, True): "DCBA",
+        }[(words_reversed, bytes_swapped)]
+    return "ABCD"
+
+
+def byte_permutation(words, order):
+    """ลำดับ byte ที่ต้องดึงจาก registers (big-endian ต่อ register) ให้เป็น big-endian"""
+    word_index = list(range(words))
+    if order in ("CDAB", "DCBA"):
+        word_index.reverse()
+    perm = []
+    for w in word_index:
+        if order in ("BADC", "DCBA"):
+            perm += [2 * w + 1, 2 * w]
+        else:
+            perm += [2 * w, 2 * w + 1]
+    return perm
+
+
+class BlockLayout:
+    """layout ที่ compile แล้วของ block: entries ถูกจัดกลุ่มตาม (dtype, byte order)
+
+    แต่ละกลุ่มมี index matrix ของ byte ที่ต้องดึง ทำให้ decode ทั้งกลุ่ม
+    ได้ด้วยการ gather + view ครั้งเดียว จากนั้น formula ของ mapping
+    ถูกคำนวณแบบ array ทีละ formula (ข้าม formula "x")
+    """
+
+    __slots__ = ("count", "groups", "names", "formulas")
+
+    def __init__(self, entries, count):
+        self.count = count
+        grouped = {}
+        by_formula = {}
+        for entry in entries:
+            dtype = DATA_TYPES.get(entry.data_type, DATA_TYPES["int16"])
+            words = dtype.itemsize // 2
+            if entry.offset + words > count:
+                continue
+            try:
+                formula = compile_formula(entry.mapping.get("formula"))
+            except FormulaError as e:
+                log_level.error(f"❌ Skipping {entry.name}: {e}")
+                continue
+            if formula is not None:
+                by_formula.setdefault(formula.source, (formula, []))[1].append(entry.name)
+            order = parse_byte_order(entry.mapping)
+            if words == 1:
+                # ค่า 16-bit มีแค่การสลับ byte ในตัว register
+                order = "BADC" if order in ("BADC", "DCBA") else "ABCD"
+            grouped.setdefault((dtype, order), []).append(entry)
+
+        # ผลลัพธ์ของทุกกลุ่มถูกวางต่อกันใน array เดียวตามลำดับ self.names
+        self.groups = []
+        self.names = []
+        for (dtype, order), group in grouped.items():
+            perm = np.array(byte_permutation(dtype.itemsize // 2, order), dtype=np.intp)
+            offsets = np.array([e.offset * 2 for e in group], dtype=np.intp)
+            index = offsets[:, None] + perm[None, :]
+            self.groups.append((dtype, index, slice(len(self.names), len(self.names) + len(group))))
+            self.names.extend(e.name for e in group)
+
+        position = {name: i for i, name in enumerate(self.names)}
+        self.formulas = [
+            (formula, np.array([position[n] for n in names], dtype=np.intp))
+            for formula, names in by_formula.values()
+        ]
+
+    def decode(self, registers):
+        """decode registers ทั้ง block เป็น {name: value} (หลังคำนวณ formula)"""
+        raw = np.asarray(registers, dtype=">u2")
+        if raw.size < self.count:
+            return {}
+        data = raw.view(np.uint8)
+        out = np.empty(len(self.names), dtype=np.float64)
+        for dtype, index, target in self.groups:
+            out[target] = np.ascontiguousarray(data[index]).view(dtype).ravel()
+        if self.formulas:
+            with np.errstate(all="ignore"):
+                for formula, idx in self.formulas:
+                    out[idx] = formula.vector(out[idx])
+        finite = np.isfinite(out)
+        if finite.all():
+            return dict(zip(self.names, out.tolist()))
+        return {name: value for name, value, ok in zip(self.names, out.tolist(), finite) if ok}
+
+
+def compile_layout(block):
+    """สร้าง (และ cache ไว้ใน block) layout สำหรับ decode"""
+    layout = block.layout
+    if layout is None:
+        layout = BlockLayout(block.entries, block.count)
+        block.layout = layout
+    return layout
+
+
+def decode_block(block, registers):
+    """decode registers ของ block ด้วย layout ที่ compile แล้ว"""
+    return compile_layout(block).decode(registers)
+
+
+def decode_registers(registers, data_type="int16", byte_order="ABCD"):
+    """decode ค่าเดียว (ใช้ตอนทดสอบอุปกรณ์/scan)"""
+    dtype = DATA_TYPES.get(data_type, DATA_TYPES["int16"])
+    words = dtype.itemsize // 2
+    raw = np.asarray(registers[:words], dtype=">u2").view(np.uint8)
+    perm = byte_permutation(words, byte_order)
+    return float(np.ascontiguousarray(raw[perm]).view(dtype)[0])
@@ -0,0 +1,213 @@
+import hashlib
+import json
+
+from config_store import MAPPING_FILE, mapping_store
+from formula_engine import formula_cache
+from modbus_decoder import DATA_TYPES, decode_block
+import log_level
+
+# ขีดจำกัดของ Modbus: อ่าน holding/input registers ได้สูงสุด 125 registers ต่อครั้ง
+MAX_READ_REGISTERS = 125
+
+# จำนวน register ของแต่ละ dataType มาจาก dtype ที่ decoder ใช้ (ชนิดที่ decode ได้เท่านั้น)
+REGISTER_COUNTS = {name: dtype.itemsize // 2 for name, dtype in DATA_TYPES.items()}
+
+
+class PlannedEntry:
+    """พารามิเตอร์หนึ่งตัวภายใน block (offset นับจากต้น block)"""
+
+    __slots__ = ("name", "offset", "count", "data_type", "mapping")
+
+    def __init__(self, name, offset, count, data_type, mapping):
+        self.name = name
+        self.offset = offset
+        self.count = count
+        self.data_type = data_type
+        self.mapping = mapping
+
+
+class ReadBlock:
+    """การอ่าน register ต่อเนื่องหนึ่งครั้ง"""
+
+    __slots__ = ("device", "slave_id", "register_type", "start", "count", "entries", "layout")
+
+    def __init__(self, device, slave_id, register_type, start):
+        self.device = device
+        self.slave_id = slave_id
+        self.register_type = register_type
+        self.start = start
+        self.count = 0
+        self.entries = []
+        # layout ที่ compile แล้วสำหรับ decode (สร้างครั้งแรกที่ใช้)
+        self.layout = None
+
+    def to_dict(self):
+        return {
+            "device": self.device,
+            "slaveId": self.slave_id,
+            "registerType": self.register_type,
+            "start": self.start,
+            "count": self.count,
+            "parameters": [entry.name for entry in self.entries],
+        }
+
+
+def load_mapping():
+    """mapping ปัจจุบัน (snapshot ในหน่วยความจำ โหลดใหม่เมื่อไฟล์เปลี่ยน)"""
+    return mapping_store.get() or []
+
+
+def register_count(mapping):
+    """จำนวน register ของ mapping entry (ใช้ registerCount ถ้ามี)
+
+    ValueError เมื่อ dataType ไม่รู้จัก หรือ registerCount น้อยกว่าที่ dataType ต้องใช้
+    """
+    data_type = mapping.get("dataType", "int16")
+    words = REGISTER_COUNTS.get(data_type)
+    if words is None:
+        raise ValueError(f"unknown dataType {data_type!r} (expected one of {', '.join(REGISTER_COUNTS)})")
+    count = mapping.get("registerCount")
+    if not count:
+        return words
+    if int(count) < words:
+        raise ValueError(f"registerCount {count} is too small for {data_type} ({words} registers)")
+    return int(count)
+
+
+def register_address(mapping):
+    """address จริงที่ใช้อ่าน (หัก addressBase)"""
+    return int(mapping.get("address", 0)) - int(mapping.get("addressBase", 0) or 0)
+
+
+def plan_reads(mapping, devices, max_gap=4, max_registers=MAX_READ_REGISTERS):
+    """รวม mapping entries เป็น block read ที่น้อยที่สุดต่ออุปกรณ์
+
+    entries ที่อยู่ device/slave/registerType เดียวกันและห่างกันไม่เกิน max_gap
+    registers จะถูกอ่านใน block เดียว โดยแต่ละ block ไม่เกิน max_registers
+    คืนค่า {device_name: [ReadBlock, ...]}
+    """
+    device_info = {d.get("name"): d for d in devices or []}
+    groups = {}
+    for m in mapping or []:
+        name = m.get("name")
+        device = m.get("device")
+        if not name or device not in device_info:
+            continue
+        info = device_info[device]
+        slave_id = int(m.get("slaveId", info.get("slaveId", 1)))
+        register_type = m.get("registerType", info.get("registerType", "holding"))
+        try:
+            count = register_count(m)
+        except ValueError as e:
+            log_level.error(f"❌ Skipping {name}: {e}")
+            continue
+        if count > max_registers:
+            continue
+        groups.setdefault((device, slave_id, register_type), []).append(
+            (register_address(m), count, m)
+        )
+
+    plan = {}
+    for (device, slave_id, register_type), entries in groups.items():
+        entries.sort(key=lambda e: (e[0], -e[1]))
+        blocks = plan.setdefault(device, [])
+        block = None
+        for address, count, m in entries:
+            end = address + count
+            if block is not None:
+                block_end = block.start + block.count
+                fits_gap = address - block_end <= max_gap
+                fits_size = max(block_end, end) - block.start <= max_registers
+            if block is None or not (fits_gap and fits_size):
+                block = ReadBlock(device, slave_id, register_type, address)
+                blocks.append(block)
+            block.count = max(block.count, end - block.start)
+            block.entries.append(PlannedEntry(
+                m["name"], address - block.start, count, m.get("dataType", "int16"), m
+            ))
+    return plan
+
+
+async def read_block(client, block):
+    """อ่าน block ด้วย pymodbus client คืน list ของ registers หรือ None เมื่อผิดพลาด"""
+    if block.register_type == "input":
+        res = await client.read_input_registers(address=block.start, count=block.count, slave=block.slave_id)
+    else:
+        res = await client.read_holding_registers(address=block.start, count=block.count, slave=block.slave_id)
+    if res is None or res.isError():
+        return None
+    return res.registers
+
+
+async def read_device(client, blocks):
+    """อ่านทุก block ของอุปกรณ์แล้วคืนค่าดิบของทุกพารามิเตอร์"""
+    values = {}
+    for block in blocks:
+        registers = await read_block(client, block)
+        if registers is not None:
+            values.update(decode_block(block, registers))
+    return values
+
+
+class ReadPlanner:
+    """เก็บ read plan ไว้ใช้ซ้ำ สร้างใหม่เฉพาะเมื่อ mapping/devices เปลี่ยน"""
+
+    def __init__(self, max_gap=4, max_registers=MAX_READ_REGISTERS):
+        self.max_gap = max_gap
+        self.max_registers = min(max_registers, MAX_READ_REGISTERS)
+        self._signature = None
+        self._inputs = (None, None)
+        self._plan = {}
+        self.rebuilds = 0
+
+    def _make_signature(self, mapping, devices):
+        payload = json.dumps([mapping, devices, self.max_gap, self.max_registers],
+                             sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get_plan(self, mapping, devices):
+        # snapshot เดิม (object เดียวกัน) แปลว่า config ยังไม่เปลี่ยน ไม่ต้องคำนวณ signature
+        if self._signature is not None and self._inputs[0] is mapping and self._inputs[1] is devices:
+            return self._plan
+        signature = self._make_signature(mapping, devices)
+        if signature != self._signature:
+            formula_cache.clear()
+            self._plan = plan_reads(mapping, devices, self.max_gap, self.max_registers)
+            self._signature = signature
+            self.rebuilds += 1
+        self._inputs = (mapping, devices)
+        return self._plan
+
+    def configure(self, max_gap=None, max_registers=None):
+        """ปรับ gap tolerance / ขนาด block (มีผลในรอบ get_plan ถัดไป)"""
+        if max_gap is not None:
+            self.max_gap = int(max_gap)
+        if max_registers is not None:
+            self.max_registers = min(int(max_registers), MAX_READ_REGISTERS)
+        self._inputs = (None, None)
+
+    def invalidate(self):
+        """บังคับสร้าง plan และ compile formula ใหม่ (เช่นหลังบันทึก /config/mapping)"""
+        self._signature = None
+        self._inputs = (None, None)
+        formula_cache.clear()
+
+    def stats(self):
+        entries = sum(len(b.entries) for blocks in self._plan.values() for b in blocks)
+        reads = sum(len(blocks) for blocks in self._plan.values())
+        return {
+            "max_gap": self.max_gap,
+            "max_registers": self.max_registers,
+            "entries": entries,
+            "reads_per_cycle": reads,
+            "reads_saved": entries - reads,
+            "rebuilds": self.rebuilds,
+            "devices": {
+                device: [block.to_dict() for block in blocks]
+                for device, blocks in self._plan.items()
+            },
+        }
+
+
+# Global instance
+read_planner = ReadPlanner()
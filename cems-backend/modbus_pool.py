@@ -0,0 +1,220 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+DEFAULT_TIMEOUT = 3.0
+
+
+class PooledClient:
+    """client หนึ่งตัวใน pool พร้อมเวลาใช้งาน/ตรวจสอบล่าสุด"""
+
+    __slots__ = ("key", "client", "created", "last_used", "last_checked", "in_use", "transactions")
+
+    def __init__(self, key, client):
+        now = time.monotonic()
+        self.key = key
+        self.client = client
+        self.created = now
+        self.last_used = now
+        self.last_checked = now
+        self.in_use = 0
+        self.transactions = 0
+
+
+def _default_factory(ip, port, timeout):
+    from pymodbus.client import AsyncModbusTcpClient
+
+    return AsyncModbusTcpClient(ip, port=port, timeout=timeout)
+
+
+class ModbusConnectionPool:
+    """pool ของ Modbus TCP client ใช้ร่วมกันระหว่าง poller, websocket และ endpoint เขียนค่า
+
+    client ถูกเก็บตาม key (ip, port, slaveId) และใช้ซ้ำตราบที่ยังเชื่อมต่ออยู่
+    client ที่ว่างนานกว่า idle_timeout จะถูกปิด ก่อนใช้ client ที่ไม่ได้ใช้นานกว่า
+    probe_interval จะอ่าน register หนึ่งตัวเพื่อตรวจว่ายังใช้ได้ และแต่ละ
+    endpoint (ip, port) ทำ transaction พร้อมกันได้ไม่เกิน max_concurrent
+    """
+
+    def __init__(self, idle_timeout=60.0, probe_interval=30.0, probe_address=0,
+                 max_concurrent=1, timeout=DEFAULT_TIMEOUT, client_factory=_default_factory):
+        self.idle_timeout = float(idle_timeout)
+        self.probe_interval = float(probe_interval)
+        self.probe_address = int(probe_address)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.timeout = float(timeout)
+        self.client_factory = client_factory
+
+        self._clients = {}
+        self._locks = {}
+        self._semaphores = {}
+        self._reaper = None
+
+        self.connects = 0
+        self.reuses = 0
+        self.probes = 0
+        self.probe_failures = 0
+        self.evictions = 0
+        self.failures = 0
+        self.waits = 0
+
+    def configure(self, idle_timeout=None, probe_interval=None, max_concurrent=None, timeout=None):
+        """ปรับค่า pool จาก config (max_concurrent มีผลกับ endpoint ใหม่)"""
+        if idle_timeout is not None:
+            self.idle_timeout = float(idle_timeout)
+        if probe_interval is not None:
+            self.probe_interval = float(probe_interval)
+        if max_concurrent is not None and max(1, int(max_concurrent)) != self.max_concurrent:
+            self.max_concurrent = max(1, int(max_concurrent))
+            self._semaphores.clear()
+        if timeout is not None:
+            self.timeout = float(timeout)
+
+    def _semaphore(self, endpoint):
+        sem = self._semaphores.get(endpoint)
+        if sem is None:
+            sem = asyncio.Semaphore(self.max_concurrent)
+            self._semaphores[endpoint] = sem
+        return sem
+
+    async def _probe(self, entry):
+        """อ่าน register หนึ่งตัว: exception response ถือว่า link ยังใช้ได้"""
+        self.probes += 1
+        try:
+            res = await asyncio.wait_for(
+                entry.client.read_holding_registers(address=self.probe_address, count=1, slave=entry.key[2]),
+                self.timeout,
+            )
+            return res is not None
+        except Exception:
+            return False
+
+    async def _get(self, key, timeout):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                healthy = entry.client.connected
+                if healthy and time.monotonic() - entry.last_checked >= self.probe_interval:
+                    healthy = await self._probe(entry)
+                    if not healthy:
+                        self.probe_failures += 1
+                if healthy:
+                    entry.last_checked = time.monotonic()
+                    self.reuses += 1
+                    return entry
+                self._close(key)
+
+            ip, port, _ = key
+            client = self.client_factory(ip, port, timeout)
+            try:
+                await asyncio.wait_for(client.connect(), timeout)
+            except Exception:
+                client.close()
+                raise
+            if not client.connected:
+                client.close()
+                raise ConnectionError(f"cannot connect to {ip}:{port}")
+            self.connects += 1
+            entry = PooledClient(key, client)
+            self._clients[key] = entry
+            return entry
+
+    def _close(self, key):
+        entry = self._clients.pop(key, None)
+        if entry is not None:
+            try:
+                entry.client.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def acquire(self, ip, port=502, slave_id=1, timeout=None):
+        """ยืม client ของ (ip, port, slaveId) ภายใต้ขีดจำกัด transaction ต่อ endpoint
+
+        ถ้าเกิด error ระหว่างใช้งาน client จะถูกปิดทิ้ง ครั้งถัดไปจะเชื่อมต่อใหม่
+        """
+        timeout = self.timeout if timeout is None else float(timeout)
+        key = (ip, int(port), int(slave_id))
+        sem = self._semaphore(key[:2])
+        if sem.locked():
+            self.waits += 1
+        async with sem:
+            entry = await self._get(key, timeout)
+            entry.in_use += 1
+            try:
+                yield entry.client
+                entry.transactions += 1
+            except Exception:
+                self.failures += 1
+                if self._clients.get(key) is entry:
+                    self._close(key)
+                raise
+            finally:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                entry.last_checked = entry.last_used
+
+    def evict_idle(self):
+        """ปิด client ที่ว่างนานเกิน idle_timeout หรือหลุดการเชื่อมต่อ"""
+        now = time.monotonic()
+        for key, entry in list(self._clients.items()):
+            if entry.in_use:
+                continue
+            if now - entry.last_used >= self.idle_timeout or not entry.client.connected:
+                self._close(key)
+                self.evictions += 1
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(self.idle_timeout, self.probe_interval) / 2))
+            self.evict_idle()
+
+    def start(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop(), name="modbus-pool-reaper")
+
+    async def close_all(self):
+        if self._reaper:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for key in list(self._clients):
+            self._close(key)
+        self._locks.clear()
+        self._semaphores.clear()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "idle_timeout": self.idle_timeout,
+            "probe_interval": self.probe_interval,
+            "max_concurrent": self.max_concurrent,
+            "open": len(self._clients),
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "waits": self.waits,
+            "clients": [
+                {
+                    "ip": ip,
+                    "port": port,
+                    "slaveId": slave_id,
+                    "connected": bool(entry.client.connected),
+                    "in_use": entry.in_use,
+                    "transactions": entry.transactions,
+                    "idle_seconds": round(now - entry.last_used, 1),
+                }
+                for (ip, port, slave_id), entry in self._clients.items()
+            ],
+        }
+
+
+# Global instance
+modbus_pool = ModbusConnectionPool()
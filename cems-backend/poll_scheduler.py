@@ -0,0 +1,286 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from modbus_planner import read_block, decode_block, read_planner
+from modbus_pool import modbus_pool
+from metrics import modbus_read_seconds, modbus_errors_total, modbus_decode_seconds
+import log_level
+
+DEFAULT_TIMEOUT = 3.0
+MAX_BACKOFF = 300
+
+
+def device_key(device):
+    """key ของอุปกรณ์สำหรับเทียบว่า config เปลี่ยนหรือไม่"""
+    return (device.get("mode", "tcp"), device.get("ip"), device.get("port"),
+            device.get("comPort"), device.get("baudrate"))
+
+
+def create_client(device, timeout=DEFAULT_TIMEOUT):
+    """สร้าง pymodbus client ตาม mode ของอุปกรณ์ (tcp/rtu)"""
+    from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+
+    if device.get("mode", "tcp") == "rtu":
+        return AsyncModbusSerialClient(
+            port=device.get("comPort"),
+            baudrate=int(device.get("baudrate", 9600)),
+            timeout=timeout,
+        )
+    return AsyncModbusTcpClient(device.get("ip", "127.0.0.1"), port=int(device.get("port", 502)), timeout=timeout)
+
+
+class DevicePoller:
+    """poll อุปกรณ์หนึ่งตัวใน asyncio task ของตัวเอง
+
+    รอบการอ่านเป็นแบบ fixed-rate: ถ้ารอบไหนใช้เวลาเกิน interval จะนับเป็น overrun
+    และข้ามไปช่วงเวลาถัดไปแทนที่จะอ่านซ้อน เมื่ออ่านไม่สำเร็จจะรอ reconnect
+    แบบ backoff (reconnect_interval x 2^n) เฉพาะอุปกรณ์นี้
+    อุปกรณ์ TCP ยืม client จาก pool (ถ้ามี) แทนการเปิด connection ของตัวเอง
+    """
+
+    def __init__(self, device, blocks, on_sample, interval, timeout=DEFAULT_TIMEOUT,
+                 jitter=0.1, reconnect_interval=5, client_factory=create_client, pool=None):
+        self.device = device
+        self.name = device.get("name")
+        self.blocks = blocks
+        self.on_sample = on_sample
+        self.interval = max(0.1, float(interval))
+        self.timeout = float(timeout)
+        self.jitter = float(jitter)
+        self.reconnect_interval = float(reconnect_interval)
+        self.client_factory = client_factory
+        self.pool = pool if device.get("mode", "tcp") != "rtu" else None
+        self.options = {"interval": interval, "timeout": timeout, "jitter": jitter,
+                        "reconnect_interval": reconnect_interval}
+
+        self.client = None
+        self._task = None
+
+        self.cycles = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.overruns = 0
+        self.last_latency_ms = 0.0
+        self.avg_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        # latency ของรอบล่าสุด ๆ สำหรับคำนวณ percentile
+        self.latencies = deque(maxlen=1024)
+        self._read_metric = modbus_read_seconds.labels(self.name)
+        self._error_metric = modbus_errors_total.labels(self.name)
+        self.last_error = None
+        self.last_sample_time = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"poll-{self.name}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_client()
+
+    async def _close_client(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+    async def _ensure_client(self):
+        if self.client is None:
+            self.client = self.client_factory(self.device, self.timeout)
+        if not self.client.connected:
+            await asyncio.wait_for(self.client.connect(), self.timeout)
+            if not self.client.connected:
+                raise ConnectionError(f"cannot connect to {self.name}")
+        return self.client
+
+    async def poll_once(self):
+        """อ่านทุก block ของอุปกรณ์หนึ่งรอบ คืนค่า {parameter: value}"""
+        if self.pool is not None:
+            return await self._poll_pooled()
+        client = await self._ensure_client()
+        values = {}
+        for block in self.blocks:
+            registers = await asyncio.wait_for(read_block(client, block), self.timeout)
+            if registers is None:
+                raise IOError(f"read error at {block.register_type} {block.start}+{block.count}")
+            started = time.perf_counter()
+            values.update(decode_block(block, registers))
+            modbus_decode_seconds.observe(time.perf_counter() - started)
+        return values
+
+    async def _poll_pooled(self):
+        ip = self.device.get("ip", "127.0.0.1")
+        port = int(self.device.get("port", 502))
+        values = {}
+        for block in self.blocks:
+            async with self.pool.acquire(ip, port, block.slave_id, self.timeout) as client:
+                registers = await asyncio.wait_for(read_block(client, block), self.timeout)
+            if registers is None:
+                raise IOError(f"read error at {block.register_type} {block.start}+{block.count}")
+            started = time.perf_counter()
+            values.update(decode_block(block, registers))
+            modbus_decode_seconds.observe(time.perf_counter() - started)
+        return values
+
+    def _record_latency(self, latency):
+        self.latencies.append(latency)
+        self._read_metric.observe(latency / 1000)
+        self.last_latency_ms = latency
+        self.max_latency_ms = max(self.max_latency_ms, latency)
+        if self.cycles <= 1:
+            self.avg_latency_ms = latency
+        else:
+            self.avg_latency_ms += (latency - self.avg_latency_ms) * 0.1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # กระจายเวลาเริ่มของแต่ละอุปกรณ์ไม่ให้อ่านพร้อมกันทุกตัว
+        await asyncio.sleep(random.uniform(0, self.interval * self.jitter))
+        next_run = loop.time()
+        while True:
+            started = time.perf_counter()
+            try:
+                values = await self.poll_once()
+                self.cycles += 1
+                self.consecutive_errors = 0
+                self._record_latency((time.perf_counter() - started) * 1000)
+                self.last_sample_time = time.time()
+                if values:
+                    await self.on_sample(self.name, values)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self._error_metric.inc()
+                self.consecutive_errors += 1
+                self.last_error = str(e) or type(e).__name__
+                await self._close_client()
+                backoff = min(self.reconnect_interval * 2 ** (self.consecutive_errors - 1), MAX_BACKOFF)
+                log_level.warning(f"⚠️ [{self.name}] poll failed ({self.last_error}), retry in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                next_run = loop.time()
+                continue
+
+            next_run += self.interval
+            now = loop.time()
+            if now > next_run:
+                # รอบนี้ใช้เวลาเกิน interval ข้ามไปยังช่วงถัดไป
+                missed = int((now - next_run) // self.interval) + 1
+                self.overruns += missed
+                next_run += missed * self.interval
+            await asyncio.sleep(max(0.0, next_run - now))
+
+    def percentile(self, q):
+        """latency (ms) ที่ percentile q จากรอบล่าสุด"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 2)
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "running": self._task is not None and not self._task.done(),
+            "connected": (bool(self.client and self.client.connected) if self.pool is None
+                          else self.cycles > 0 and self.consecutive_errors == 0),
+            "blocks": len(self.blocks),
+            "cycles": self.cycles,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "overruns": self.overruns,
+            "last_latency_ms": round(self.last_latency_ms, 2),
+            "avg_latency_ms": round(self.avg_latency_ms, 2),
+            "max_latency_ms": round(self.max_latency_ms, 2),
+            "p50_latency_ms": self.percentile(50),
+            "p95_latency_ms": self.percentile(95),
+            "p99_latency_ms": self.percentile(99),
+            "last_error": self.last_error,
+            "last_sample_time": self.last_sample_time,
+        }
+
+
+class PollScheduler:
+    """จัดการ DevicePoller ของทุกอุปกรณ์ใน connection.devices
+
+    แต่ละอุปกรณ์ใช้ interval/timeout/jitter ของตัวเอง (ค่าใน device มีผลก่อน
+    แล้วจึงใช้ค่าใน connection) อุปกรณ์ที่ช้าหรือหลุดจึงไม่หน่วงตัวอื่น
+    """
+
+    def __init__(self, planner, client_factory=create_client, pool=None):
+        self.planner = planner
+        self.client_factory = client_factory
+        self.pool = pool
+        self.pollers = {}
+        self.sinks = []
+
+    def add_sink(self, sink):
+        """เพิ่ม async callback(device_name, values) ที่จะถูกเรียกทุกครั้งที่อ่านได้"""
+        self.sinks.append(sink)
+
+    async def _dispatch(self, device_name, values):
+        for sink in self.sinks:
+            try:
+                await sink(device_name, values)
+            except Exception as e:
+                log_level.error(f"❌ Sample sink error ({device_name}): {e}")
+
+    def _poller_options(self, device, connection):
+        return {
+            "interval": device.get("interval", connection.get("poll_interval", connection.get("log_interval", 60))),
+            "timeout": device.get("timeout", connection.get("timeout", DEFAULT_TIMEOUT)),
+            "jitter": device.get("jitter", connection.get("jitter", 0.1)),
+            "reconnect_interval": device.get("reconnect_interval", connection.get("reconnect_interval", 5)),
+        }
+
+    async def apply(self, config, mapping):
+        """เริ่ม/หยุด/สร้าง poller ใหม่ให้ตรงกับ config และ mapping ปัจจุบัน"""
+        connection = (config or {}).get("connection", {})
+        devices = connection.get("devices", [])
+        # ตั้ง planner ก่อนสร้าง plan ทุกครั้ง (ไม่ใช่เมื่อมีคนเปิด /modbus/read-plan)
+        self.planner.configure(**connection.get("read_plan", {}))
+        plan = self.planner.get_plan(mapping, devices)
+
+        wanted = {}
+        for device in devices:
+            name = device.get("name")
+            if name and plan.get(name):
+                wanted[name] = (device, plan[name], self._poller_options(device, connection))
+
+        for name in list(self.pollers):
+            poller = self.pollers[name]
+            target = wanted.get(name)
+            if (target is None or device_key(target[0]) != device_key(poller.device)
+                    or target[1] is not poller.blocks
+                    or target[2] != poller.options):
+                await poller.stop()
+                del self.pollers[name]
+
+        for name, (device, blocks, options) in wanted.items():
+            if name not in self.pollers:
+                poller = DevicePoller(device, blocks, self._dispatch,
+                                      client_factory=self.client_factory, pool=self.pool, **options)
+                self.pollers[name] = poller
+                poller.start()
+
+    async def stop(self):
+        for poller in self.pollers.values():
+            await poller.stop()
+        self.pollers.clear()
+
+    def stats(self):
+        return {name: poller.stats() for name, poller in self.pollers.items()}
+
+
+# Global instance
+poll_scheduler = PollScheduler(read_planner, pool=modbus_pool)
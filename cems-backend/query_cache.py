@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from metrics import query_cache_requests, query_cache_bytes
+
+# ค่าที่ไม่มีใน cache (แยกจาก None ที่เป็นผลลัพธ์ได้)
+MISS = object()
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires", "end")
+
+    def __init__(self, value, size, expires, end):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.end = end
+
+
+class QueryCache:
+    """cache ผลลัพธ์ query ของทุก client ร่วมกัน
+
+    - LRU จำกัดด้วยขนาดรวม (ประมาณเป็น bytes) ไม่ใช่จำนวน entry
+    - ช่วงเวลาที่ปิดแล้วเก็บได้ไม่หมดอายุ (ttl=None) ส่วนท้ายที่ยังมีข้อมูลเข้า
+      หมดอายุตาม tail_ttl ช่วงจะถือว่าปิดเมื่อเก่ากว่าทั้ง closed_after และ
+      settle_delay (เวลาที่ข้อมูลอาจมาถึงช้าสุด เช่น retry ของ writer หรือ rollup lateness)
+    - single-flight: request เดียวกันที่มาพร้อมกันรอผลจาก query เดียว
+    - invalidate_from(ts) ลบ entry ที่ครอบคลุมเวลาหลัง ts (ข้อมูลย้อนหลังเข้ามาใหม่
+      จากการ replay spool, import CSV หรือ rollup ถูกคำนวณใหม่)
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, tail_ttl=5.0, closed_after=10.0, enabled=True):
+        self.max_bytes = max_bytes
+        self.tail_ttl = tail_ttl
+        self.closed_after = closed_after
+        self.settle_delay = 0.0
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_bytes=None, tail_ttl=None, closed_after=None, enabled=None):
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            if tail_ttl is not None:
+                self.tail_ttl = float(tail_ttl)
+            if closed_after is not None:
+                self.closed_after = float(closed_after)
+            if enabled is not None:
+                self.enabled = bool(enabled)
+            if not self.enabled:
+                self._entries.clear()
+                self.bytes = 0
+            self._evict()
+
+    def settle_after(self, seconds):
+        """ข้อมูลอาจเข้ามาช้าได้ถึง seconds วินาที (ใช้ค่าที่มากที่สุดที่เคยแจ้ง)"""
+        with self._lock:
+            self.settle_delay = max(self.settle_delay, float(seconds))
+
+    def closed_before(self):
+        """เวลา (epoch วินาที) ที่ช่วงซึ่งจบก่อนหน้านั้นเก็บได้ไม่หมดอายุ"""
+        return time.time() - max(self.closed_after, self.settle_delay)
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+        query_cache_bytes.set(self.bytes)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def peek(self, key):
+        """ค่าใน cache หรือ MISS (ไม่ query)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            if entry.expires is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                return MISS
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def put(self, key, value, size, ttl=None, end=None):
+        """เก็บผลลัพธ์ (ttl=None = ไม่หมดอายุ, end = เวลาสิ้นสุดของข้อมูลใน entry สำหรับ invalidate_from)"""
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            expires = None if ttl is None else time.monotonic() + ttl
+            self._entries[key] = _Entry(value, size, expires, end)
+            self.bytes += size
+            self._evict()
+
+    def single_flight(self, key, load):
+        """เรียก load() ครั้งเดียวต่อ key แม้มีหลาย thread ขอพร้อมกัน"""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self.shared += 1
+            query_cache_requests.labels("shared").inc()
+            return future.result()
+        try:
+            result = load()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def get(self, key, load, size, ttl=None, end=None):
+        """ค่าจาก cache หรือ load() (single-flight) แล้วเก็บไว้ size รับค่าที่ได้คืน bytes โดยประมาณ"""
+        value = self.peek(key)
+        if value is not MISS:
+            self.record(hit=True)
+            return value
+
+        def load_and_store():
+            # thread ก่อนหน้าอาจเพิ่งเก็บผลไว้ระหว่าง peek กับ single_flight
+            value = self.peek(key)
+            if value is not MISS:
+                return value
+            value = load()
+            self.put(key, value, size(value), ttl, end)
+            return value
+
+        self.record(hit=False)
+        return self.single_flight(key, load_and_store)
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+            query_cache_requests.labels("hit").inc()
+        else:
+            self.misses += 1
+            query_cache_requests.labels("miss").inc()
+
+    def invalidate_from(self, ts):
+        """ลบ entry ที่มีข้อมูลหลังเวลา ts (epoch วินาที) และ entry ที่ไม่ระบุช่วงเวลา"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.end is None or entry.end > ts]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+            query_cache_bytes.set(self.bytes)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            query_cache_bytes.set(0)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "tail_ttl": self.tail_ttl,
+            "closed_after": self.closed_after,
+            "settle_delay": self.settle_delay,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global instance
+query_cache = QueryCache()
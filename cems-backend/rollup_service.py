@@ -0,0 +1,433 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import downsampling
+from query_cache import query_cache
+import log_level
+
+# marker ใน agg_bucket บันทึกจุดเริ่มของช่วงที่แต่ละ tier ครอบคลุม
+COVERAGE_MEASUREMENT = "rollup_coverage"
+# process ที่ไม่ได้คำนวณ rollup (API process, csv_import CLI) ขอให้ owner คำนวณใหม่ผ่าน marker นี้
+INVALIDATION_MEASUREMENT = "rollup_invalidation"
+# owner บันทึกช่วงที่มีข้อมูลย้อนหลังเข้ามาใหม่ ให้ process อื่น (follower) ล้าง query cache ของตัวเอง
+INVALIDATED_MEASUREMENT = "rollup_invalidated"
+
+
+class RollupTier:
+    """rollup หนึ่งระดับ (เช่น 1 นาที หรือ 1 ชั่วโมง)"""
+
+    def __init__(self, name, seconds, source=None):
+        self.name = name
+        self.seconds = seconds
+        self.measurement = f"rollup_{name}"
+        # None = คำนวณจากข้อมูลดิบ, มิฉะนั้นคือ tier ที่ใช้เป็นต้นทาง
+        self.source = source
+        self.watermark = None
+        # เวลาเริ่มของช่วงที่ rollup ครอบคลุม ([coverage, watermark)) ก่อนหน้านั้นต้องอ่านข้อมูลดิบ
+        self.coverage = None
+        self.coverage_dirty = False
+        # เพิ่มทุกครั้งที่ watermark ถูกถอย รอบที่คำนวณค้างอยู่จะไม่เลื่อน watermark ทับ
+        self.generation = 0
+        self.inflight_end = None
+        self.windows_written = 0
+        self.last_run_seconds = 0.0
+
+    def stats(self):
+        return {
+            "measurement": self.measurement,
+            "coverage": self.coverage.isoformat() if self.coverage else None,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "windows_written": self.windows_written,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+        }
+
+
+def _floor(dt, seconds):
+    epoch = int(dt.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+
+def _ceil(dt, seconds):
+    floored = _floor(dt, seconds)
+    return floored if floored == dt else floored + timedelta(seconds=seconds)
+
+
+class RollupScheduler:
+    """คำนวณ rollup 1 นาที / 1 ชั่วโมง ลง agg_bucket แบบ incremental
+
+    แต่ละ tier มี watermark (เวลาสิ้นสุดของ window ล่าสุดที่ปิดและเขียนแล้ว)
+    รอบถัดไปจะคำนวณเฉพาะ window ที่ปิดหลัง watermark เท่านั้น
+    watermark อ่านกลับจาก agg_bucket ตอนเริ่ม ถ้ายังไม่มีจะ backfill จากข้อมูลดิบ
+    (ย้อนหลังไม่เกิน backfill_days) จุดเริ่มของช่วงที่ rollup ครอบคลุมบันทึกไว้ใน
+    measurement rollup_coverage เพื่อให้ query ช่วงที่เก่ากว่านั้นอ่านจากข้อมูลดิบ
+
+    มี process เดียวที่คำนวณ rollup (start) process อื่นใช้ follow() อ่าน watermark
+    เป็นระยะเพื่อเลือก rollup ตอน query และส่ง invalidate_from ให้ owner ผ่าน marker
+    invalidate_from ของ owner บันทึก marker กลับมาให้ follower ล้าง query cache ด้วย
+    """
+
+    def __init__(self, manager, thresholds_fn, enabled=True, interval=30,
+                 lateness=30, backfill_days=365, chunk_windows=360):
+        self.manager = manager
+        self.thresholds_fn = thresholds_fn
+        self.enabled = enabled
+        self.interval = interval
+        self.lateness = lateness
+        self.backfill_days = backfill_days
+        self.chunk_windows = chunk_windows
+
+        minute = RollupTier("1m", 60)
+        hour = RollupTier("1h", 3600, source=minute)
+        self.tiers = [minute, hour]
+
+        self._thread = None
+        self._stop = threading.Event()
+        # ป้องกัน watermark/coverage ที่ invalidate_from (thread อื่น) แก้พร้อมกับ thread rollup
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.owner = False
+        self.following = False
+        self._invalidations_checked = None
+        self._invalidated_checked = None
+        self.last_error = None
+
+    @property
+    def raw_bucket(self):
+        return self.manager.config['bucket']
+
+    @property
+    def agg_bucket(self):
+        return self.manager.config['agg_bucket']
+
+    def start(self):
+        """เริ่ม thread สำหรับคำนวณ rollup"""
+        if not self.enabled or self.agg_bucket == self.raw_bucket:
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self.owner = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="influx-rollup", daemon=True)
+        self._thread.start()
+
+    def follow(self):
+        """อ่าน watermark/coverage จาก agg_bucket เป็นระยะโดยไม่คำนวณหรือเขียน rollup"""
+        if not self.enabled or self.agg_bucket == self.raw_bucket:
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self.following = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="influx-rollup-follow", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.manager.connected:
+                try:
+                    if self.owner:
+                        self.run_once()
+                    else:
+                        self._load_watermarks()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    log_level.error(f"❌ Rollup error: {e}")
+            self._stop.wait(self.interval)
+
+    def _query_single_record(self, query):
+        for table in self.manager.query_api.query(query):
+            for record in table.records:
+                return record
+        return None
+
+    def _query_single_time(self, query):
+        record = self._query_single_record(query)
+        return record.get_time() if record else None
+
+    def _load_coverage(self, tier):
+        """จุดเริ่มของช่วงที่ rollup ครอบคลุม จาก rollup_coverage หรือ rollup จุดแรก (ข้อมูลเก่าที่ยังไม่มี marker)"""
+        record = self._query_single_record(f'''
+        from(bucket: {downsampling.flux_string(self.agg_bucket)})
+            |> range(start: 0)
+            |> filter(fn: (r) => r["_measurement"] == "{COVERAGE_MEASUREMENT}" and r["tier"] == "{tier.name}" and r["_field"] == "start")
+            |> last()
+        ''')
+        if record is not None:
+            return datetime.fromtimestamp(int(record.get_value()), tz=timezone.utc)
+        first = self._query_single_time(f'''
+        from(bucket: {downsampling.flux_string(self.agg_bucket)})
+            |> range(start: 0)
+            |> filter(fn: (r) => r["_measurement"] == "{tier.measurement}" and r["_field"] == "count")
+            |> group()
+            |> first()
+        ''')
+        if first is not None:
+            tier.coverage_dirty = True
+        return first
+
+    def _save_coverage(self, tier):
+        from influxdb_client import Point
+
+        with self._lock:
+            if not tier.coverage_dirty:
+                return
+            coverage = tier.coverage
+            tier.coverage_dirty = False
+        try:
+            self.manager.write_api.write(
+                bucket=self.agg_bucket,
+                org=self.manager.config['org'],
+                record=Point(COVERAGE_MEASUREMENT).tag("tier", tier.name)
+                .field("start", int(coverage.timestamp()))
+                .time(datetime.now(timezone.utc))
+            )
+        except Exception:
+            with self._lock:
+                tier.coverage_dirty = True
+            raise
+
+    def _load_watermarks(self):
+        """อ่าน watermark/coverage จาก rollup ที่มีอยู่ หรือจุดเริ่ม backfill จากข้อมูลดิบ"""
+        now = datetime.now(timezone.utc)
+        backfill_start = now - timedelta(days=self.backfill_days)
+        first_raw = None
+        rewound = None
+        for tier in self.tiers:
+            last = self._query_single_time(f'''
+            from(bucket: {downsampling.flux_string(self.agg_bucket)})
+                |> range(start: {downsampling.flux_time(backfill_start)})
+                |> filter(fn: (r) => r["_measurement"] == "{tier.measurement}" and r["_field"] == "count")
+                |> group()
+                |> last()
+            ''')
+            coverage = self._load_coverage(tier) if last is not None else None
+            if last is not None and coverage is not None:
+                watermark = _floor(last, tier.seconds) + timedelta(seconds=tier.seconds)
+            elif tier.source is not None:
+                # tier ที่สร้างจาก rollup อื่นเริ่มที่ window แรกที่ต้นทางครอบคลุมเต็ม window
+                coverage = watermark = _ceil(tier.source.coverage, tier.seconds)
+                tier.coverage_dirty = True
+            else:
+                if first_raw is None:
+                    first_raw = self._query_single_time(f'''
+                    from(bucket: {downsampling.flux_string(self.raw_bucket)})
+                        |> range(start: {downsampling.flux_time(backfill_start)})
+                        |> filter(fn: (r) => r["_measurement"] == "{self.manager.raw_measurement}")
+                        |> group()
+                        |> first()
+                    ''') or now
+                coverage = watermark = _floor(first_raw, tier.seconds)
+                tier.coverage_dirty = True
+            with self._lock:
+                if tier.watermark is not None and watermark < tier.watermark:
+                    rewound = watermark if rewound is None else min(rewound, watermark)
+                # invalidate_from ที่มาก่อนโหลดเสร็จไม่มีผล (ยังไม่มี watermark) จึงใช้ค่าที่โหลดได้ตรง ๆ
+                tier.coverage = coverage
+                tier.watermark = watermark
+            if tier.coverage_dirty and self.owner:
+                log_level.info(f"🧮 Rollup {tier.name}: covering from {coverage.isoformat()}, next window {watermark.isoformat()}")
+        self._initialized = True
+        if not self.owner:
+            invalidated = self._load_invalidated()
+            if invalidated is not None:
+                rewound = invalidated if rewound is None else min(rewound, invalidated)
+            if rewound is not None:
+                # owner ถอย watermark หรือมีข้อมูลย้อนหลังเข้ามา ผล query ที่ cache ไว้ใน process นี้ไม่ตรงแล้ว
+                query_cache.invalidate_from(rewound.timestamp())
+
+    def _load_invalidated(self):
+        """เวลาที่เก่าสุดใน marker ที่ owner บันทึกตั้งแต่รอบก่อน หรือ None"""
+        if self._invalidated_checked is None:
+            # cache ของ process นี้ยังว่างอยู่ marker ก่อนหน้านี้ไม่มีผล
+            self._invalidated_checked = datetime.now(timezone.utc)
+            return None
+        earliest, latest = self._read_markers(INVALIDATED_MEASUREMENT, self._invalidated_checked)
+        if latest is not None:
+            self._invalidated_checked = _floor(latest, 1) + timedelta(seconds=1)
+        return earliest
+
+    def _read_markers(self, measurement, since):
+        """(ค่า "from" ที่เก่าสุด, เวลาของ marker ล่าสุด) ของ marker ที่เขียนตั้งแต่ since"""
+        earliest, latest = None, None
+        for table in self.manager.query_api.query(f'''
+        from(bucket: {downsampling.flux_string(self.agg_bucket)})
+            |> range(start: {downsampling.flux_time(since)})
+            |> filter(fn: (r) => r["_measurement"] == "{measurement}" and r["_field"] == "from")
+        '''):
+            for record in table.records:
+                value = datetime.fromtimestamp(float(record.get_value()), tz=timezone.utc)
+                earliest = value if earliest is None else min(earliest, value)
+                latest = record.get_time() if latest is None else max(latest, record.get_time())
+        return earliest, latest
+
+    def run_once(self):
+        """คำนวณทุก window ที่ปิดแล้วตั้งแต่ watermark ถึงปัจจุบัน"""
+        if not self._initialized:
+            self._load_watermarks()
+        self._apply_requested_invalidations()
+        now = datetime.now(timezone.utc) - timedelta(seconds=self.lateness)
+        for tier in self.tiers:
+            self._save_coverage(tier)
+            if tier.source is None:
+                closed = _floor(now, tier.seconds)
+            else:
+                # tier ที่สร้างจาก rollup อื่น ต้องรอให้ต้นทางครอบคลุมก่อน
+                closed = _floor(tier.source.watermark, tier.seconds)
+            self._advance(tier, closed)
+
+    def _advance(self, tier, closed):
+        # จำกัดจำนวน window ต่อ query เพื่อไม่ให้ backfill ใช้หน่วยความจำมาก
+        chunk = timedelta(seconds=tier.seconds * self.chunk_windows)
+        while not self._stop.is_set():
+            with self._lock:
+                start, generation = tier.watermark, tier.generation
+                if start >= closed:
+                    return
+                end = min(start + chunk, closed)
+                tier.inflight_end = end
+            started = datetime.now(timezone.utc)
+            try:
+                rows = self._aggregate(tier, start, end)
+                written = self._write(tier, rows)
+            finally:
+                with self._lock:
+                    tier.inflight_end = None
+            with self._lock:
+                # ถ้ามี invalidate_from ระหว่างคำนวณ watermark ถูกถอยไปแล้ว ห้ามเลื่อนทับ
+                if tier.generation == generation:
+                    tier.watermark = end
+            tier.windows_written += written
+            tier.last_run_seconds = (datetime.now(timezone.utc) - started).total_seconds()
+
+    def _aggregate(self, tier, start, stop):
+        start, stop = downsampling.flux_time(start), downsampling.flux_time(stop)
+        if tier.source is None:
+            query = downsampling.build_bucket_query(
+                self.raw_bucket, None, start, stop, tier.seconds, self.thresholds_fn(),
+                self.manager.read_schema
+            )
+        else:
+            query = downsampling.build_rollup_query(
+                self.agg_bucket, tier.source.measurement, None, start, stop, tier.seconds
+            )
+        return downsampling.merge_bucket_rows(self.manager.query_api.query(query))
+
+    def _write(self, tier, rows):
+        from influxdb_client import Point
+
+        thresholds = self.thresholds_fn() if tier.source is None else {}
+        points = []
+        for param, by_time in rows.items():
+            limit = thresholds.get(param)
+            for ts, row in by_time.items():
+                count = int(row.get("count") or 0)
+                if not count:
+                    continue
+                total = float(row.get("sum", 0.0))
+                if tier.source is None:
+                    # นาทีที่ค่าเฉลี่ยเกิน threshold นับเป็น 1 นาทีเกินค่า
+                    alarm_minutes = int(limit is not None and total / count > limit)
+                else:
+                    alarm_minutes = int(row.get("alarm_minutes", 0))
+                points.append(
+                    Point(tier.measurement)
+                    .tag("parameter", param)
+                    .field("mean", total / count)
+                    .field("min", float(row.get("min")))
+                    .field("max", float(row.get("max")))
+                    .field("sum", total)
+                    .field("count", count)
+                    .field("alarm_count", int(row.get("alarms", 0)))
+                    .field("alarm_minutes", alarm_minutes)
+                    .time(datetime.fromtimestamp(ts / 1000, tz=timezone.utc))
+                )
+        if points:
+            self.manager.write_api.write(
+                bucket=self.agg_bucket,
+                org=self.manager.config['org'],
+                record=points
+            )
+        return len(points)
+
+    def _apply_requested_invalidations(self):
+        """ถอย watermark ตาม marker ที่ process อื่นเขียนไว้ตั้งแต่รอบก่อน"""
+        if self._invalidations_checked is None:
+            # marker ที่เขียนระหว่างที่ owner ไม่ได้รันมีเวลาหลัง rollup ล่าสุด
+            self._invalidations_checked = self.tiers[0].watermark
+        requested, latest = self._read_markers(INVALIDATION_MEASUREMENT, self._invalidations_checked)
+        if latest is not None:
+            # flux_time ปัดเป็นวินาที จึงเริ่มรอบหน้าที่วินาทีถัดไป (marker วินาทีเดียวกันถูกอ่านซ้ำได้ ไม่เป็นไร)
+            self._invalidations_checked = _floor(latest, 1) + timedelta(seconds=1)
+            log_level.info(f"🧮 Rollup: re-rolling from {requested.isoformat()} (requested by another process)")
+            self.invalidate_from(requested)
+
+    def _write_marker(self, measurement, dt):
+        from influxdb_client import Point
+
+        try:
+            self.manager.write_api.write(
+                bucket=self.agg_bucket,
+                org=self.manager.config['org'],
+                record=Point(measurement).field("from", dt.timestamp())
+                .time(datetime.now(timezone.utc))
+            )
+        except Exception as e:
+            log_level.error(f"❌ Error writing rollup marker {measurement}: {e}")
+
+    def invalidate_from(self, dt):
+        """ถอย watermark เมื่อมีข้อมูลย้อนหลังเข้ามาใหม่ (เช่นจากการ replay spool หรือ import CSV)
+
+        เรียกจาก thread อื่นได้ รวมถึงช่วงที่กำลังคำนวณ window ที่ครอบคลุม dt อยู่
+        ข้อมูลที่เก่ากว่า coverage ทำให้ rollup ครอบคลุมย้อนไปถึง dt ด้วย
+        """
+        with self._lock:
+            for tier in self.tiers:
+                if tier.watermark is None:
+                    continue
+                if dt < max(tier.watermark, tier.inflight_end or tier.watermark):
+                    tier.watermark = min(tier.watermark, _floor(dt, tier.seconds))
+                    tier.generation += 1
+                    # tier ที่สร้างจาก rollup อื่นครอบคลุมเฉพาะ window ที่ต้นทางครอบคลุมเต็ม window
+                    floor = tier.watermark if tier.source is None else _ceil(tier.source.coverage, tier.seconds)
+                    if floor < tier.coverage:
+                        tier.coverage = floor
+                        tier.coverage_dirty = True
+        if self.enabled and self.agg_bucket != self.raw_bucket and self.manager.connected:
+            if self.owner:
+                # follower (API process) ล้าง query cache ของตัวเองเมื่ออ่าน marker นี้
+                self._write_marker(INVALIDATED_MEASUREMENT, dt)
+            else:
+                # rollup คำนวณใน process อื่น (acquisition) ให้ owner ถอย watermark ของตัวเอง
+                self._write_marker(INVALIDATION_MEASUREMENT, dt)
+        # ผลลัพธ์ history ที่ cache ไว้ของช่วงนี้ไม่ตรงกับข้อมูลแล้ว
+        query_cache.invalidate_from(dt.timestamp())
+
+    def span(self, tier):
+        """(coverage, watermark) ของ tier อ่านพร้อมกันภายใต้ lock"""
+        with self._lock:
+            return tier.coverage, tier.watermark
+
+    def route(self, every_seconds):
+        """เลือก rollup ที่หยาบที่สุดที่ยังให้ความละเอียดตามที่ขอได้"""
+        if not self.enabled or not self._initialized:
+            return None
+        for tier in reversed(self.tiers):
+            if tier.watermark and every_seconds >= tier.seconds and every_seconds % tier.seconds == 0:
+                return tier
+        return None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled and self.agg_bucket != self.raw_bucket,
+            "agg_bucket": self.agg_bucket,
+            "role": "owner" if self.owner else "follower" if self.following else None,
+            "last_error": self.last_error,
+            "tiers": {tier.name: tier.stats() for tier in self.tiers},
+        }
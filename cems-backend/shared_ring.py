@@ -0,0 +1,152 @@
+import json
+import struct
+from multiprocessing import shared_memory
+
+DEFAULT_NAME = "cems_samples"
+MAGIC = b"CEMS"
+VERSION = 1
+
+# header: magic, version, capacity, slot_size, head (จำนวนข้อความที่เขียนทั้งหมด)
+HEADER = struct.Struct("<4sIIIQ")
+HEAD_OFFSET = 16
+# slot: seq (คี่ = กำลังเขียน, คู่ = เขียนเสร็จ), ความยาว payload
+SLOT_HEADER = struct.Struct("<QI")
+U64 = struct.Struct("<Q")
+
+
+class RingOverflow(Exception):
+    """ข้อความใหญ่เกิน slot_size"""
+
+
+def _attach(name):
+    """เปิด shared memory ที่มีอยู่แล้วโดยไม่ให้ resource_tracker ของ process นี้ลบทิ้งตอนปิด"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 ไม่มี track= ต้องถอดออกจาก resource_tracker เอง (POSIX)
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class SampleRing:
+    """ring buffer ใน shared memory: writer เดียว (acquisition process) reader หลายตัว
+
+    แต่ละ slot ใช้ seqlock: writer ตั้ง seq เป็นเลขคี่ก่อนเขียนและเป็นเลขคู่
+    เมื่อเขียนเสร็จ reader อ่าน seq ก่อนและหลัง copy ถ้าไม่ตรงกันหรือถูก
+    เขียนทับไปแล้ว (reader ช้ากว่า writer เกิน capacity) จะข้ามไปยังข้อความ
+    ที่เก่าที่สุดที่ยังอยู่ writer จึงไม่ต้องรอ reader เลย
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        magic, version, self.capacity, self.slot_size, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"shared memory {shm.name} is not a CEMS sample ring")
+        self.payload_size = self.slot_size - SLOT_HEADER.size
+        self.written = 0
+        self.oversized = 0
+        self.read = 0
+        self.overruns = 0
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, capacity=1024, slot_size=16384):
+        """สร้าง ring ใหม่ (ถ้ามีชื่อนี้ค้างอยู่จาก process ก่อนหน้าจะสร้างทับ)"""
+        size = HEADER.size + capacity * slot_size
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        # shared memory ใหม่เป็นศูนย์ทั้งหมดอยู่แล้ว (seq 0 = ยังไม่มีข้อมูล)
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, capacity, slot_size, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """เปิด ring ที่ acquisition process สร้างไว้ (FileNotFoundError ถ้ายังไม่มี)"""
+        return cls(_attach(name))
+
+    @property
+    def head(self):
+        return U64.unpack_from(self.shm.buf, HEAD_OFFSET)[0]
+
+    def _slot_offset(self, position):
+        return HEADER.size + (position % self.capacity) * self.slot_size
+
+    def write(self, message):
+        """เขียนข้อความ (dict) ต่อท้าย ring"""
+        payload = json.dumps(message, separators=(",", ":"), default=str).encode("utf-8")
+        if len(payload) > self.payload_size:
+            self.oversized += 1
+            raise RingOverflow(f"message of {len(payload)} bytes exceeds slot payload {self.payload_size}")
+        buf = self.shm.buf
+        position = self.head
+        offset = self._slot_offset(position)
+        U64.pack_into(buf, offset, 2 * position + 1)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(payload)] = payload
+        SLOT_HEADER.pack_into(buf, offset, 2 * position + 2, len(payload))
+        U64.pack_into(buf, HEAD_OFFSET, position + 1)
+        self.written += 1
+
+    def read_from(self, cursor, limit=None):
+        """อ่านข้อความตั้งแต่ตำแหน่ง cursor คืน (ข้อความ, cursor ถัดไป)"""
+        head = self.head
+        if cursor > head:
+            # writer เริ่มใหม่ (ring ถูกสร้างใหม่) อ่านจากต้น
+            cursor = 0
+        if head - cursor > self.capacity:
+            self.overruns += head - cursor - self.capacity
+            cursor = head - self.capacity
+        if limit is not None:
+            head = min(head, cursor + limit)
+        buf = self.shm.buf
+        messages = []
+        while cursor < head:
+            offset = self._slot_offset(cursor)
+            expected = 2 * cursor + 2
+            seq, length = SLOT_HEADER.unpack_from(buf, offset)
+            if seq == expected:
+                start = offset + SLOT_HEADER.size
+                payload = bytes(buf[start:start + length])
+                if U64.unpack_from(buf, offset)[0] == expected:
+                    messages.append(json.loads(payload))
+                    cursor += 1
+                    continue
+            # slot ถูกเขียนทับระหว่างอ่าน ข้ามไปยังข้อความที่เก่าที่สุดที่ยังอยู่
+            self.overruns += 1
+            cursor = max(cursor + 1, self.head - self.capacity + 1)
+        self.read += len(messages)
+        return messages, cursor
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "name": self.shm.name,
+            "owner": self.owner,
+            "capacity": self.capacity,
+            "slot_size": self.slot_size,
+            "head": self.head,
+            "written": self.written,
+            "read": self.read,
+            "overruns": self.overruns,
+            "oversized": self.oversized,
+        }
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+
+# เวลาที่ process เริ่ม import (main.py import โมดูลนี้เป็นตัวแรก)
+PROCESS_START = time.perf_counter()
+
+
+class StartupTracker:
+    """บันทึกเวลาของแต่ละขั้นตอนตอนเริ่ม backend และสถานะของแต่ละระบบย่อย
+
+    /ready ตอบ 200 เมื่อขั้นตอนใน required เสร็จแล้ว ระบบที่ช้า (InfluxDB)
+    เริ่มอยู่เบื้องหลังและรายงานสถานะแยก ไม่หน่วงการแสดงหน้าแรก
+    """
+
+    def __init__(self, required=("config", "pollers")):
+        self.required = tuple(required)
+        self.phases = {}
+
+    def begin(self, name):
+        self.phases[name] = {"status": "starting", "started_ms": round(self._elapsed_ms(), 1), "duration_ms": None}
+
+    def done(self, name, status="ready", error=None):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {"status": status, "started_ms": 0.0}
+        phase["status"] = status
+        phase["duration_ms"] = round(self._elapsed_ms() - phase["started_ms"], 1)
+        if error is not None:
+            phase["error"] = str(error)
+
+    def mark(self, name, started_ms=0.0):
+        """บันทึกขั้นตอนที่เสร็จแล้ว (เช่นเวลา import ตั้งแต่ process เริ่ม)"""
+        self.phases[name] = {"status": "ready", "started_ms": started_ms, "duration_ms": None}
+        self.done(name)
+
+    @contextmanager
+    def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        except Exception as e:
+            self.done(name, "failed", e)
+            raise
+        self.done(name)
+
+    async def run(self, name, awaitable, ok=lambda result: result is not False):
+        """รัน coroutine เป็นขั้นตอนหนึ่ง (ใช้กับงานเบื้องหลัง เช่นเชื่อมต่อ InfluxDB)"""
+        self.begin(name)
+        try:
+            result = await awaitable
+        except Exception as e:
+            self.done(name, "failed", e)
+            return None
+        self.done(name, "ready" if ok(result) else "degraded")
+        return result
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - PROCESS_START) * 1000
+
+    @property
+    def ready(self):
+        return all(self.phases.get(name, {}).get("status") == "ready" for name in self.required)
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "uptime_ms": round(self._elapsed_ms(), 1),
+            "required": list(self.required),
+            "phases": self.phases,
+        }
+
+
+# Global instance
+startup = StartupTracker()
@@ -0,0 +1,150 @@
+import time
+
+import downsampling
+from live_store import live_store
+from query_cache import MISS, query_cache
+import log_level
+
+# จำนวน bucket ต่อ page ของ cache (page เรียงชิดกันตั้งแต่ epoch ขอบตรงกับขอบ bucket)
+PAGE_BUCKETS = 240
+# ขนาดโดยประมาณของ bucket หนึ่งแถวใน cache (dict 5 ค่า + key)
+BUCKET_ROW_BYTES = 360
+
+
+class SensorStorage:
+    """interface ร่วมของที่เก็บข้อมูลเซ็นเซอร์ (InfluxDB และ local column store)
+
+    endpoint ประวัติ, export และ log preview เรียกผ่าน method เหล่านี้
+    จึงไม่ต้องรู้ว่าข้อมูลอยู่ใน InfluxDB หรือไฟล์บนเครื่อง
+    """
+
+    name = None
+    connected = False
+
+    def thresholds(self):
+        """alarm threshold จาก config {parameter: limit}"""
+        return {}
+
+    def save_sensor_data(self, data, device=None, ts=None):
+        raise NotImplementedError
+
+    def get_latest_data(self, parameter=None, limit=1):
+        """{parameter: ค่าล่าสุด} หรือ None"""
+        raise NotImplementedError
+
+    def query_history_buckets(self, parameters, hours=24, max_points=500,
+                              method="aggregate", thresholds=None):
+        """ดึงข้อมูลย้อนหลังแบบแบ่ง bucket (mean/min/max/count/alarms) หรือ None
+
+        ช่วงที่ยังอยู่ใน live_store ทั้งหมดตอบจากหน่วยความจำ ที่เหลืออ่านเป็น page
+        ผ่าน query_cache: page ที่ปิดแล้วใช้ซ้ำได้ทุก client ไม่หมดอายุ query
+        จริงเฉพาะ page ที่ยังไม่มีและ page ท้ายสุดเมื่อหมดอายุ
+        """
+        range_seconds, every = self.bucket_plan(hours, max_points, method)
+        configured = thresholds is None
+        if configured:
+            thresholds = self.thresholds()
+        stop = time.time()
+        start = stop - range_seconds
+        if live_store.covers(parameters, start):
+            rows = live_store.bucket_rows(parameters, start, every, thresholds)
+            source = 'memory'
+        else:
+            if not self.connected:
+                return None
+            try:
+                rows, source = self.cached_bucket_rows(parameters, start, stop, every, thresholds, configured)
+            except Exception as e:
+                log_level.error(f"❌ Error querying history buckets: {e}")
+                return None
+        return self._history_result(parameters, hours, every, method, max_points,
+                                    source, thresholds, rows)
+
+    def fetch_bucket_rows(self, parameters, start, stop, every, thresholds, configured=True):
+        """(rows แบบ downsampling.merge_bucket_rows, source) ของช่วง [start, stop) epoch วินาที
+
+        configured = thresholds มาจาก config (ใช้ข้อมูลที่คำนวณ alarm ไว้ล่วงหน้าได้)
+        """
+        raise NotImplementedError
+
+    def cached_bucket_rows(self, parameters, start, stop, every, thresholds, configured=True):
+        """rows ของช่วง [start, stop) ประกอบจาก page ใน query_cache
+
+        page ที่ขาดทั้งหมดถูก query รวมเป็นช่วงเดียว request เดียวกันที่มาพร้อมกัน
+        (ทุก client) รอผลจาก query เดียว
+        """
+        page = every * PAGE_BUCKETS
+        first_bucket = int(start // every * every)
+        pages = list(range(first_bucket // page * page, int(stop // page * page) + page, page))
+        limits = tuple(sorted((k, v) for k, v in thresholds.items() if k in parameters))
+        key = (self.name, tuple(sorted(parameters)), every, limits, configured)
+
+        def load():
+            cached = {p: query_cache.peek(key + (p,)) for p in pages}
+            missing = [p for p in pages if cached[p] is MISS]
+            query_cache.record(hit=not missing)
+            source = 'cache'
+            if missing:
+                fetched, source = self.fetch_bucket_rows(
+                    parameters, missing[0], missing[-1] + page, every, thresholds, configured)
+                closed_before = query_cache.closed_before()
+                for p in missing:
+                    lo, hi = p * 1000, (p + page) * 1000
+                    part = {name: {ts: row for ts, row in by_time.items() if lo <= ts < hi}
+                            for name, by_time in fetched.items()}
+                    size = BUCKET_ROW_BYTES * sum(len(by_time) for by_time in part.values()) + 200
+                    # page ที่ยังมีข้อมูลเข้าได้หมดอายุตาม tail_ttl ที่เหลือเก็บถาวรจนกว่าจะ invalidate
+                    ttl = None if p + page <= closed_before else query_cache.tail_ttl
+                    query_cache.put(key + (p,), part, size, ttl, end=p + page)
+                    cached[p] = part
+                if len(missing) < len(pages):
+                    source = f"cache+{source}"
+            rows = {}
+            lower = first_bucket * 1000
+            for p in pages:
+                for name, by_time in cached[p].items():
+                    merged = rows.setdefault(name, {})
+                    for ts, row in by_time.items():
+                        if ts >= lower:
+                            merged[ts] = row
+            return rows, source
+
+        return query_cache.single_flight(key + (first_bucket, pages[-1]), load)
+
+    def get_first_timestamp(self):
+        """เวลา (datetime UTC) ของข้อมูลจุดแรก หรือ None"""
+        raise NotImplementedError
+
+    def get_parameter_names(self):
+        raise NotImplementedError
+
+    def iter_sensor_rows(self, fields, start, stop, chunk_hours=24):
+        """แถว (time, {parameter: value}) เรียงจากเก่าไปใหม่ ในช่วง [start, stop)"""
+        raise NotImplementedError
+
+    def latest_rows(self, fields, limit=100, hours=24):
+        """แถว (time, {parameter: value}) ล่าสุดไม่เกิน limit แถว ใหม่สุดก่อน"""
+        raise NotImplementedError
+
+    @staticmethod
+    def bucket_plan(hours, max_points, method):
+        """(ช่วงเวลาเป็นวินาที, ความกว้าง bucket) ของ query_history_buckets"""
+        range_seconds = max(1, int(float(hours) * 3600))
+        if method == "lttb":
+            # bucket ละเอียดกว่าที่ต้องการ แล้วให้ LTTB เลือกจุดตัวแทน
+            return range_seconds, downsampling.bucket_seconds(range_seconds, max_points * 4)
+        return range_seconds, downsampling.bucket_seconds(range_seconds, max_points)
+
+    def _history_result(self, parameters, hours, every, method, max_points, source, thresholds, rows):
+        series = downsampling.rows_to_series(rows)
+        if method == "lttb":
+            series = downsampling.lttb_series(series, max_points)
+        return {
+            'parameters': list(parameters),
+            'hours': hours,
+            'bucket_seconds': every,
+            'method': method,
+            'source': source,
+            'thresholds': {k: v for k, v in thresholds.items() if k in parameters},
+            'series': series
+        }
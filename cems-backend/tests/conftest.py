@@ -0,0 +1,5 @@
+import os
+import sys
+
+# ให้ import module ของ backend ได้เมื่อรัน pytest จาก directory ใดก็ได้
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+from alarm_engine import AlarmEngine, compile_rules
+
+CONFIG = {
+    "connection": {"alarm_threshold": {"SO2": 100}},
+    "alarm": {"deadband": 10, "min_duration": 30, "bits": ["SO2", "Fault"]},
+}
+
+
+def make_engine(config=CONFIG):
+    engine = AlarmEngine()
+    engine.configure(config)
+    return engine
+
+
+def test_threshold_and_bit_for_same_parameter_both_kept():
+    rules = compile_rules(CONFIG)
+    assert sorted((r.kind, r.parameter) for r in rules) == [
+        ("alarm_bit", "Fault"), ("alarm_bit", "SO2"), ("threshold", "SO2")]
+    engine = make_engine()
+    assert len(engine.rules) == 3
+    assert engine.stats()["rules"] == 3
+
+
+def test_raise_needs_min_duration():
+    engine = make_engine({"connection": {"alarm_threshold": {"SO2": 100}}, "alarm": {"deadband": 10}})
+    assert engine.evaluate({"SO2": 120}, ts=0) == []
+    assert engine.evaluate({"SO2": 120}, ts=29) == []
+    events = engine.evaluate({"SO2": 120}, ts=30)
+    assert [(e["parameter"], e["state"]) for e in events] == [("SO2", "raised")]
+    assert engine.active()[0]["parameter"] == "SO2"
+
+
+def test_short_excursion_resets_timer():
+    engine = make_engine({"connection": {"alarm_threshold": {"SO2": 100}}, "alarm": {"deadband": 10}})
+    engine.evaluate({"SO2": 120}, ts=0)
+    engine.evaluate({"SO2": 90}, ts=20)
+    assert engine.evaluate({"SO2": 120}, ts=40) == []
+    assert engine.evaluate({"SO2": 120}, ts=70)[0]["state"] == "raised"
+
+
+def test_hysteresis_clears_only_below_deadband():
+    engine = make_engine({"connection": {"alarm_threshold": {"SO2": 100}},
+                          "alarm": {"deadband": 10, "min_duration": 0}})
+    assert engine.evaluate({"SO2": 101}, ts=0)[0]["state"] == "raised"
+    # แกว่งรอบ limit ไม่ทำให้ clear
+    assert engine.evaluate({"SO2": 95}, ts=1) == []
+    assert engine.evaluate({"SO2": 101}, ts=2) == []
+    assert engine.evaluate({"SO2": 89}, ts=3)[0]["state"] == "cleared"
+
+
+def test_bit_alarm_on_same_parameter_as_threshold():
+    engine = make_engine()
+    engine.evaluate({"SO2": 1}, ts=0)
+    events = engine.evaluate({"SO2": 1}, ts=30)
+    assert [(e["type"], e["state"]) for e in events] == [("alarm_bit", "raised")]
+    engine.evaluate({"SO2": 150}, ts=40)
+    events = engine.evaluate({"SO2": 150}, ts=70)
+    assert [(e["type"], e["state"]) for e in events] == [("threshold", "raised")]
+
+
+def test_reconfigure_keeps_state_per_kind():
+    engine = make_engine()
+    engine.evaluate({"SO2": 150}, ts=0)
+    engine.evaluate({"SO2": 150}, ts=30)
+    active = {(a["type"], a["parameter"]) for a in engine.active()}
+    assert active == {("threshold", "SO2"), ("alarm_bit", "SO2")}
+    engine.configure(dict(CONFIG))
+    assert {(a["type"], a["parameter"]) for a in engine.active()} == active
+
+
+def test_non_numeric_values_ignored():
+    engine = make_engine()
+    assert engine.evaluate({"SO2": "bad", "Other": 1}, ts=0) == []
@@ -0,0 +1,34 @@
+import time
+
+from alert_index import AlertIndex
+
+
+def alert(ts, kind="threshold", message="m"):
+    return {"time": ts, "type": kind, "message": message}
+
+
+def test_query_pages_newest_first_by_type():
+    now = time.time()
+    index = AlertIndex()
+    for i in range(5):
+        index.add(alert(now - 100 + i, "threshold" if i % 2 else "alarm_bit", f"m{i}"))
+    index.add(alert(now - 200, "threshold", "late"))
+
+    page = index.query(limit=2)
+    assert [a["message"] for a in page["alerts"]] == ["m4", "m3"]
+    page = index.query(limit=2, before=page["next_before"])
+    assert [a["message"] for a in page["alerts"]] == ["m2", "m1"]
+
+    page = index.query(alert_type="threshold", limit=10)
+    assert [a["message"] for a in page["alerts"]] == ["m3", "m1", "late"]
+    assert page["next_before"] is None
+
+
+def test_load_merges_without_duplicates_and_trims():
+    now = time.time()
+    index = AlertIndex(retention_days=1, max_entries=3)
+    index.add(alert(now - 10))
+    index.load([alert(now - 10), alert(now - 20), alert(now - 5, "alarm_bit"), alert(now - 2 * 86400)])
+    assert index.stats() == {"entries": 3, "types": {"threshold": 2, "alarm_bit": 1}, "loaded": True}
+    index.add(alert(now - 1, "alarm_bit"))
+    assert index.stats()["types"] == {"threshold": 1, "alarm_bit": 2}
@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+from compliance_engine import BlockAverage, ComplianceEngine, RollingAverage, stack_area
+
+
+def make_engine(**config):
+    engine = ComplianceEngine()
+    engine.offset = 0  # ขอบ block ตาม UTC เพื่อให้ผลไม่ขึ้นกับ timezone ของเครื่อง
+    engine.configure({
+        "compliance": {"reference_o2": 7.0, "gases": ["SO2"], "sample_interval": 10},
+        "stack_info": {"diameter": 2.0},
+        "gas_config": {"default_gases": [{"name": "SO2", "unit": "ppm"}]},
+        **config,
+    })
+    return engine
+
+
+def test_stack_area():
+    assert stack_area({"area": 3}) == 3.0
+    assert stack_area({"diameter": 2}) == pytest.approx(math.pi)
+    assert stack_area(None) is None
+
+
+def test_block_average_closes_on_boundary():
+    block = BlockAverage("1m", 60, 0)
+    assert block.add(0, 1.0) is None
+    assert block.add(30, 3.0) is None
+    assert block.add(60, 10.0) == (0, 2.0, 2)
+    assert block.current() == 10.0
+    assert not block.expired(119) and block.expired(120)
+
+
+def test_rolling_average_evicts_old_minutes():
+    rolling = RollingAverage("15m", 900)
+    rolling.add(0, 10.0)
+    rolling.add(300, 20.0)
+    assert rolling.value(300) == 15.0
+    assert rolling.value(960) == 20.0
+    assert rolling.value(1260) is None
+
+
+def test_derive_o2_correction_and_rate():
+    engine = make_engine()
+    derived = engine.derive({"SO2": 100.0, "O2": 13.9, "Velocity": 10.0})
+    assert derived["SO2Corr"] == pytest.approx(100.0 * (20.9 - 7.0) / (20.9 - 13.9))
+    mg_m3 = 100.0 * 64.066 / 22.414
+    assert derived["SO2Rate"] == pytest.approx(mg_m3 * 10.0 * math.pi * 3600 / 1e6)
+    # O2 ใกล้ค่าอากาศปกติ ไม่คำนวณ Corr
+    assert "SO2Corr" not in engine.derive({"SO2": 100.0, "O2": 20.85})
+
+
+def test_process_closes_minute_blocks_with_availability():
+    engine = make_engine()
+    for ts in range(0, 60, 10):
+        assert engine.process({"SO2": ts, "O2": 7.0, "bad": "x"}, ts=ts) == []
+    closed = engine.process({"SO2": 0.0, "O2": 7.0}, ts=60)
+    records = {(r["parameter"], r["window"]): r for r in closed}
+    assert set(records) == {("SO2", "1m"), ("O2", "1m"), ("SO2Corr", "1m")}
+    so2 = records[("SO2", "1m")]
+    assert (so2["start"], so2["mean"], so2["count"], so2["availability"]) == (0, 25.0, 6, 100.0)
+
+
+def test_tick_closes_expired_blocks_without_new_data():
+    engine = make_engine()
+    engine.process({"SO2": 5.0}, ts=0)
+    engine.process({"SO2": 7.0}, ts=10)
+    assert engine.tick(now=59) == []
+    (record,) = engine.tick(now=60)
+    assert (record["window"], record["mean"], record["availability"]) == ("1m", 6.0, 33.3)
+    assert engine.tick(now=61) == []
+
+
+def test_snapshot_reports_block_and_rolling():
+    engine = make_engine()
+    engine.process({"SO2": 4.0}, ts=0)
+    engine.process({"SO2": 8.0}, ts=30)
+    channel = engine.snapshot(now=30)["channels"]["SO2"]
+    assert channel["last"] == 8.0
+    assert channel["block"]["1m"] == 6.0
+    assert channel["rolling"]["1h"] == 6.0
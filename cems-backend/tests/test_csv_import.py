@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from csv_import import checkpoint_file, import_settings, parse_mapping, parse_timestamps, resolve_import_path
+
+
+@pytest.fixture
+def import_dir(tmp_path):
+    root = tmp_path / "imports"
+    (root / "site").mkdir(parents=True)
+    (root / "site" / "log.csv").write_text("Timestamp,SO2\n")
+    (tmp_path / "secret.csv").write_text("x\n")
+    return root
+
+
+def test_resolve_import_path_inside_directory(import_dir):
+    expected = os.path.realpath(import_dir / "site" / "log.csv")
+    assert resolve_import_path("site/log.csv", str(import_dir)) == expected
+    assert resolve_import_path(expected, str(import_dir)) == expected
+
+
+@pytest.mark.parametrize("path", ["../secret.csv", "site/../../secret.csv", "", None, "site", "missing.csv"])
+def test_resolve_import_path_rejects_outside_or_missing(import_dir, path):
+    with pytest.raises(ValueError):
+        resolve_import_path(path, str(import_dir))
+
+
+def test_resolve_import_path_rejects_absolute_outside(import_dir):
+    with pytest.raises(ValueError):
+        resolve_import_path(str(import_dir.parent / "secret.csv"), str(import_dir))
+
+
+def test_resolve_import_path_rejects_symlink_out(import_dir):
+    link = import_dir / "link.csv"
+    link.symlink_to(import_dir.parent / "secret.csv")
+    with pytest.raises(ValueError):
+        resolve_import_path("link.csv", str(import_dir))
+
+
+def test_checkpoint_file_is_in_checkpoint_directory(tmp_path):
+    first = checkpoint_file(str(tmp_path / "a" / "log.csv"), "import_checkpoints")
+    second = checkpoint_file(str(tmp_path / "b" / "log.csv"), "import_checkpoints")
+    assert os.path.dirname(first) == "import_checkpoints"
+    assert first != second and first.endswith(".import.json")
+
+
+def test_import_settings_defaults():
+    assert import_settings({}) == {"directory": "imports", "checkpoint_directory": "import_checkpoints"}
+    assert import_settings({"csv_import": {"directory": "/data"}})["directory"] == "/data"
+
+
+def test_parse_mapping():
+    assert parse_mapping(["SO2 ppm=SO2", " NOx = NOx "]) == {"SO2 ppm": "SO2", "NOx": "NOx"}
+    with pytest.raises(ValueError):
+        parse_mapping(["SO2"])
+
+
+def test_parse_timestamps_utc():
+    millis = parse_timestamps(np.array(["2026-01-01 00:00:00", "2026-01-01T00:01:00Z"]), utc=True)
+    assert list(millis) == [1767225600000, 1767225660000]
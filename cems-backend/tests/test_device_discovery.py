@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from device_discovery import DeviceDiscovery, NegativeCache, parse_id_range, parse_ip_range
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, [1]),
+    (5, [5]),
+    ("1-4", [1, 2, 3, 4]),
+    ("1,3,5-6", [1, 3, 5, 6]),
+    ({"from": 3, "to": 5}, [3, 4, 5]),
+    ([3, 10], [3, 10]),
+    ([10, 3, 10], [10, 3]),
+    ([1, 1], [1]),
+    (["1-3", 2, 7], [1, 2, 3, 7]),
+])
+def test_parse_id_range(value, expected):
+    assert parse_id_range(value) == expected
+
+
+@pytest.mark.parametrize("value", ["5-3", "1-1000", {"from": 1}, [256], -1])
+def test_parse_id_range_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_id_range(value)
+
+
+def test_parse_ip_range():
+    assert parse_ip_range("192.168.1.10-12") == ["192.168.1.10", "192.168.1.11", "192.168.1.12"]
+    assert parse_ip_range("10.0.0.0/30") == ["10.0.0.1", "10.0.0.2"]
+    assert parse_ip_range(["10.0.0.1", "10.0.0.5"]) == ["10.0.0.1", "10.0.0.5"]
+    with pytest.raises(ValueError):
+        parse_ip_range("10.0.0.0/8")
+
+
+def test_negative_cache_expires():
+    cache = NegativeCache(ttl=-1)
+    cache.add("k")
+    assert "k" not in cache
+    cache = NegativeCache(ttl=60)
+    cache.add("k")
+    assert "k" in cache and cache.hits == 1
+
+
+class Response:
+    registers = [7]
+
+    def isError(self):
+        return False
+
+
+class FakeClient:
+    """Modbus client ที่มีอุปกรณ์ตอบเฉพาะ slave ใน RESPONDING"""
+
+    RESPONDING = {1}
+    reads = []
+
+    def __init__(self, ip, port=502, timeout=None):
+        self.connected = False
+
+    async def connect(self):
+        self.connected = True
+
+    async def read_holding_registers(self, address, count, slave):
+        self.reads.append(slave)
+        if slave not in self.RESPONDING:
+            raise asyncio.TimeoutError()
+        return Response()
+
+    def close(self):
+        self.connected = False
+
+
+def run_scan(request):
+    discovery = DeviceDiscovery(tcp_client=FakeClient)
+
+    async def port_open(ip, port, timeout):
+        return True
+
+    discovery._port_open = port_open
+
+    async def collect():
+        return [event async for event in discovery.scan(request)]
+
+    return asyncio.run(collect())
+
+
+def test_default_scan_probes_slave_once():
+    FakeClient.reads = []
+    events = run_scan({"ip": "127.0.0.1"})
+    hits = [e for e in events if e["type"] == "hit"]
+    assert len(hits) == 1 and hits[0]["slaveId"] == 1
+    assert events[-1]["type"] == "done" and events[-1]["found"] == 1
+    assert FakeClient.reads == [1]
+
+
+def test_scan_list_of_ids_probes_only_those():
+    FakeClient.reads = []
+    run_scan({"ip": "127.0.0.1", "slave_ids": [3, 10]})
+    assert FakeClient.reads == [3, 10]
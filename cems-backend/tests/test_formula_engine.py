@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+import pytest
+
+from formula_engine import FUNCTIONS, FormulaError, compile_formula, validate_formula
+
+# formula ที่ใช้ฟังก์ชันที่อนุญาตทุกตัว ด้วยจำนวน argument ต่ำสุดและสูงสุด
+CALLS = [
+    "abs(x)",
+    "min(x, 3)",
+    "min(x, 3, 1)",
+    "max(x, 0)",
+    "max(x, 0, 1)",
+    "round(x)",
+    "round(x, 1)",
+    "sqrt(x)",
+    "log(x)",
+    "log(x, 10)",
+    "log10(x)",
+    "exp(x)",
+    "pow(x, 2)",
+]
+
+SAMPLES = [0.5, 2.25, 4.0, 123.456]
+
+
+def test_calls_cover_every_function():
+    assert {call.split("(")[0] for call in CALLS} == set(FUNCTIONS)
+
+
+@pytest.mark.parametrize("formula", CALLS)
+def test_scalar_and_vector_agree(formula):
+    compiled = compile_formula(formula)
+    vector = compiled.vector(np.array(SAMPLES))
+    assert vector.shape == (len(SAMPLES),)
+    for x, value in zip(SAMPLES, vector.tolist()):
+        assert math.isclose(compiled.scalar(x), value, rel_tol=1e-9, abs_tol=1e-12)
+
+
+@pytest.mark.parametrize("formula", [
+    "abs(x,2)", "sqrt(x,1)", "round(x,1,2)", "min(x)", "pow(x)", "pow(x,2,3)", "exp()",
+])
+def test_wrong_arity_rejected(formula):
+    assert "argument" in validate_formula(formula)
+
+
+def test_nary_max_vector_does_not_use_out():
+    compiled = compile_formula("max(x, 0, 1)")
+    assert compiled.vector(np.array([-1.0, 0.5, 5.0])).tolist() == [1.0, 1.0, 5.0]
+    assert compiled.scalar(5.0) == 5.0
+
+
+@pytest.mark.parametrize("formula", [
+    "x**9**9**9", "pow(x, 9**9)", "10**400", "x**1001", "(-8)**(1/3) + x", "2**(10**4) * x",
+])
+def test_unbounded_constant_powers_rejected(formula):
+    with pytest.raises(FormulaError):
+        compile_formula(formula)
+
+
+@pytest.mark.parametrize("formula", ["x**2", "x**0.5", "x**-1", "x**x", "2**x", "pow(x, 3)", "(x + 1)**2 / 10"])
+def test_bounded_powers_allowed(formula):
+    assert validate_formula(formula) is None
+
+
+@pytest.mark.parametrize("formula", ["__import__('os')", "x.real", "x if x else 1", "f(x)", "abs(x, n=1)", "'a'"])
+def test_unsafe_syntax_rejected(formula):
+    assert validate_formula(formula) is not None
+
+
+def test_identity_is_not_compiled():
+    assert compile_formula("x") is None
+    assert compile_formula(" (x) ") is None
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from influx_spool import WriteAheadSpool
+
+
+def line(ts, value=1):
+    return f"sensor,device=d value={value} {ts}"
+
+
+def test_replay_sorts_by_time_and_removes_segments(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path), segment_bytes=40, replay_batch_size=2)
+    spool.append([line(30), line(10)])
+    spool.append([line(20)])
+    assert spool.backlog_points == 3
+    assert len(spool._segments) == 2
+
+    batches = []
+    assert spool.replay(batches.append) == 3
+    assert batches == [[line(10), line(20)], [line(30)]]
+    assert not spool.has_backlog()
+    assert os.listdir(tmp_path) == []
+    assert spool.last_replay_oldest_ns == 10
+
+
+def test_failed_replay_keeps_segments(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path))
+    spool.append([line(1), line(2)])
+
+    def fail(batch):
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        spool.replay(fail)
+    assert spool.backlog_points == 2
+
+    batches = []
+    assert spool.replay(batches.append) == 2
+    assert batches == [[line(1), line(2)]]
+
+
+def test_backlog_survives_restart(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path))
+    spool.append([line(1), b"", line(2)])
+    spool.close()
+
+    reopened = WriteAheadSpool(str(tmp_path))
+    assert reopened.backlog_points == 2
+    reopened.append([line(3)])
+    batches = []
+    reopened.replay(batches.append)
+    assert batches == [[line(1), line(2), line(3)]]
+
+
+def test_limit_drops_oldest_segment(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path), segment_bytes=1, max_bytes=60)
+    for ts in range(4):
+        spool.append([line(ts)])
+    assert spool.dropped > 0
+    batches = []
+    spool.replay(batches.extend)
+    assert batches[-1] == line(3)
+    assert len(batches) == 4 - spool.dropped
@@ -0,0 +1,38 @@
+import pytest
+
+from line_protocol import LineProtocolEncoder, escape_key
+
+
+def test_narrow_encodes_numeric_strings():
+    encoder = LineProtocolEncoder("narrow", digits=1)
+    data, fields = encoder.encode({"SO2": "12.3", "NOx": 4}, ts_ns=1)
+    assert fields == 2
+    assert data == b"sensor_data,parameter=SO2 value=12.3 1\nsensor_data,parameter=NOx value=4.0 1"
+
+
+@pytest.mark.parametrize("value", [None, "n/a", float("nan"), float("inf"), "inf", [1]])
+def test_invalid_values_are_skipped(value):
+    encoder = LineProtocolEncoder("narrow")
+    assert encoder.encode({"SO2": value}, ts_ns=1) == (b"", 0)
+
+
+def test_wide_row_per_device():
+    encoder = LineProtocolEncoder("wide", digits=None)
+    data, fields = encoder.encode({"SO2": 1.5, "bad": None, "O2": "7"}, device="stack 1", ts_ns=5)
+    assert data == b"sensor_row,device=stack\\ 1 SO2=1.5,O2=7.0 5"
+    assert fields == 2
+
+
+def test_dual_writes_both_schemas():
+    data, fields = LineProtocolEncoder("dual").encode({"SO2": 1}, device="d", ts_ns=1)
+    assert data.split(b"\n") == [b"sensor_data,parameter=SO2 value=1.0 1", b"sensor_row,device=d SO2=1.0 1"]
+    assert fields == 1
+
+
+def test_escape_key():
+    assert escape_key("a b,c=d") == "a\\ b\\,c\\=d"
+
+
+def test_unknown_schema_rejected():
+    with pytest.raises(ValueError):
+        LineProtocolEncoder("tall")
@@ -0,0 +1,54 @@
+from live_store import LatestValueStore, RingBuffer
+
+
+def test_ring_buffer_wraps_and_since():
+    buffer = RingBuffer(3)
+    for ts in range(5):
+        buffer.append(float(ts), ts * 10.0)
+    assert buffer.full
+    assert buffer.oldest_time() == 2.0
+    times, values = buffer.since(3.0)
+    assert list(times) == [3.0, 4.0]
+    assert list(values) == [30.0, 40.0]
+    assert buffer.created == 0.0
+
+
+def test_update_skips_non_numeric_and_non_finite():
+    store = LatestValueStore(capacity=10)
+    store.update({"SO2": "1.5", "NOx": float("nan"), "status": "ok"}, ts=100.0)
+    assert store.get_latest() == {"SO2": 1.5}
+    assert store.get_latest("NOx") is None
+
+
+def test_missing_buffer_is_not_covered():
+    store = LatestValueStore(capacity=10)
+    store.update({"SO2": 1.0}, ts=100.0)
+    assert store.coverage_start(["SO2"]) == 100.0
+    assert store.coverage_start(["SO2", "imported_only"]) is None
+    assert not store.covers(["imported_only"], 100.0)
+
+
+def test_parameter_added_later_is_covered_from_its_first_value():
+    store = LatestValueStore(capacity=10)
+    store.update({"SO2": 1.0}, ts=100.0)
+    store.update({"SO2": 1.0, "CO": 2.0}, ts=200.0)
+    assert store.coverage_start(["SO2"]) == 100.0
+    assert store.coverage_start(["SO2", "CO"]) == 200.0
+    assert not store.covers(["CO"], 150.0)
+    assert store.covers(["CO"], 200.0)
+
+
+def test_full_buffer_is_covered_from_oldest_value():
+    store = LatestValueStore(capacity=3)
+    for ts in (100.0, 101.0, 102.0, 103.0):
+        store.update({"SO2": ts}, ts=ts)
+    assert store.coverage_start(["SO2"]) == 101.0
+
+
+def test_bucket_rows():
+    store = LatestValueStore(capacity=10)
+    for ts, value in ((0.0, 1.0), (30.0, 3.0), (60.0, 10.0)):
+        store.update({"SO2": value}, ts=ts)
+    rows = store.bucket_rows(["SO2"], 0.0, 60, thresholds={"SO2": 2.0})
+    assert rows["SO2"][0] == {"sum": 4.0, "min": 1.0, "max": 3.0, "count": 2, "alarms": 1}
+    assert rows["SO2"][60000]["count"] == 1
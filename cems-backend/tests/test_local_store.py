@@ -0,0 +1,124 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from local_store import INDEX_SUFFIX, SUMMARY, ColumnWriter, LocalColumnStore, day_start
+
+DAY = day_start("2024-05-01")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalColumnStore(directory=str(tmp_path), retention_days=0, block_size=4, flush_interval=60)
+    yield store
+    store.close()
+
+
+def fill(store, count, start=DAY, step=10.0):
+    for i in range(count):
+        store.save_sensor_data({"SO2": float(i), "NOx": "n/a"}, ts=start + i * step)
+
+
+def test_save_and_read_columns(store):
+    fill(store, 10)
+    assert not store.save_sensor_data({"SO2": 99.0}, ts=DAY)
+    assert store.out_of_order == 1
+    times, values = store.columns(["SO2"], DAY + 20, DAY + 60)["SO2"]
+    assert times.tolist() == [DAY + 20, DAY + 30, DAY + 40, DAY + 50]
+    assert values.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert store.get_parameter_names() == ["SO2"]
+
+
+def brute_force(times, values, every, limit):
+    rows = {}
+    for ts, value in zip(times, values):
+        key = int(ts // every * every) * 1000
+        row = rows.setdefault(key, {"sum": 0.0, "min": value, "max": value, "count": 0, "alarms": 0})
+        row["sum"] += value
+        row["min"] = min(row["min"], value)
+        row["max"] = max(row["max"], value)
+        row["count"] += 1
+        row["alarms"] += int(limit is not None and value > limit)
+    return rows
+
+
+@pytest.mark.parametrize("every,limit", [(60, None), (60, 20.0), (25, 5.0), (3600, None)])
+def test_bucket_rows_match_raw_aggregation(store, every, limit):
+    rng = np.random.default_rng(1)
+    times = DAY + np.arange(50) * 7.0
+    values = rng.uniform(0, 40, size=50).round(3)
+    for ts, value in zip(times, values):
+        store.save_sensor_data({"SO2": value}, ts=ts)
+    start, stop = DAY + 15, DAY + 300
+    thresholds = {"SO2": limit} if limit is not None else {}
+    rows = store.bucket_rows(["SO2"], start, stop, every, thresholds)["SO2"]
+    mask = (times >= start) & (times < stop)
+    expected = brute_force(times[mask], values[mask], every, limit)
+    assert rows.keys() == expected.keys()
+    for key, row in expected.items():
+        assert rows[key]["count"] == row["count"]
+        assert rows[key]["alarms"] == row["alarms"]
+        assert rows[key]["sum"] == pytest.approx(row["sum"])
+        assert (rows[key]["min"], rows[key]["max"]) == (row["min"], row["max"])
+
+
+def test_writer_recovers_torn_files(tmp_path):
+    base = str(tmp_path / "SO2")
+    writer = ColumnWriter(base, 4)
+    writer.extend(np.arange(10.0), np.arange(10.0) * 2)
+    writer.flush()
+    writer.close()
+    # จำลอง process หยุดกลางคัน: ค่าขาดไป 1 จุด และ summary หาย
+    os.truncate(base + ".val", 9 * 8)
+    os.truncate(base + INDEX_SUFFIX, 0)
+
+    writer = ColumnWriter(base, 4)
+    assert writer.size == 9 and writer.last_ts == 8.0
+    index = np.fromfile(base + INDEX_SUFFIX, dtype=SUMMARY)
+    assert index["first"].tolist() == [0.0, 4.0]
+    assert index["sum"].tolist() == [12.0, 44.0]
+    assert writer.append(9.0, 1.0)
+    writer.close()
+
+
+def test_submit_writes_from_background_thread(store):
+    for i in range(5):
+        store.submit({"SO2": i}, ts=DAY + i)
+    store.flush()
+    times, values = store.columns(["SO2"], DAY, DAY + 10)["SO2"]
+    assert values.tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert store.stats()["queue_depth"] == 0
+
+
+def test_submit_drops_oldest_when_queue_full(tmp_path):
+    store = LocalColumnStore(directory=str(tmp_path), retention_days=0, max_queue=2)
+    store._running = True  # ไม่เริ่ม thread เพื่อให้คิวค้าง
+    for i in range(3):
+        store.submit({"SO2": i}, ts=DAY + i)
+    assert store.dropped == 1
+    store._running = False
+    store.flush()
+    assert store.columns(["SO2"], DAY, DAY + 10)["SO2"][1].tolist() == [1.0, 2.0]
+
+
+def test_import_skips_today_and_expired_days(tmp_path):
+    store = LocalColumnStore(directory=str(tmp_path), retention_days=0, block_size=4)
+    past = [DAY + 1, DAY + 2, DAY + 86400 + 1]
+    written = store.import_columns({"SO2": (past, [1.0, float("nan"), 3.0])})
+    assert written == 2
+    assert store.days() == ["2024-05-01", "2024-05-02"]
+    assert store.import_columns({"SO2": ([time.time()], [1.0])}) == 0
+    assert store.import_skipped == 1
+    store.close()
+
+
+def test_rollover_removes_days_past_retention(tmp_path):
+    store = LocalColumnStore(directory=str(tmp_path), retention_days=2, block_size=4)
+    for day in range(4):
+        store.save_sensor_data({"SO2": 1.0}, ts=DAY + day * 86400)
+    store.flush()
+    assert store.days() == ["2024-05-02", "2024-05-03", "2024-05-04"]
+    assert store.expired_days == 1
+    store.close()
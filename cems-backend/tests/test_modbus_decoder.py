@@ -0,0 +1,71 @@
+import struct
+
+import pytest
+
+from modbus_decoder import decode_block, decode_registers, parse_byte_order
+from modbus_planner import plan_reads
+
+
+def words(data):
+    return [int.from_bytes(data[i:i + 2], "big") for i in range(0, len(data), 2)]
+
+
+def encode(value, fmt, order):
+    """registers ของค่า value ตาม byte order ของอุปกรณ์"""
+    data = struct.pack(">" + fmt, value)
+    regs = [data[i:i + 2] for i in range(0, len(data), 2)]
+    if order in ("CDAB", "DCBA"):
+        regs.reverse()
+    if order in ("BADC", "DCBA"):
+        regs = [r[::-1] for r in regs]
+    return words(b"".join(regs))
+
+
+@pytest.mark.parametrize("value,expected", [
+    ({"dataFormat": "Float AB CD"}, "ABCD"),
+    ({"dataFormat": "Float CD AB"}, "CDAB"),
+    ({"dataFormat": "Float BA DC"}, "BADC"),
+    ({"dataFormat": "Float DC BA"}, "DCBA"),
+    ({"dataFormat": "Double GH EF CD AB"}, "CDAB"),
+    ({"dataFormat": "Double HG FE DC BA"}, "DCBA"),
+    ({"byteOrder": "CDAB", "dataFormat": "Float AB CD"}, "CDAB"),
+    ({}, "ABCD"),
+])
+def test_parse_byte_order(value, expected):
+    assert parse_byte_order(value) == expected
+
+
+@pytest.mark.parametrize("order", ["ABCD", "CDAB", "BADC", "DCBA"])
+@pytest.mark.parametrize("data_type,fmt,value", [
+    ("float32", "f", 12.5),
+    ("int32", "i", -123456),
+    ("uint32", "I", 3000000000),
+    ("float64", "d", -1234.0625),
+])
+def test_decode_registers_all_orders(order, data_type, fmt, value):
+    assert decode_registers(encode(value, fmt, order), data_type, order) == value
+
+
+def test_decode_block_mixed_orders_and_formula():
+    mapping = [
+        {"name": "SO2", "device": "d", "address": 0, "dataType": "float32", "dataFormat": "Float CD AB"},
+        {"name": "NOx", "device": "d", "address": 2, "dataType": "float32", "byteOrder": "DCBA",
+         "formula": "x * 2"},
+        {"name": "O2", "device": "d", "address": 4, "dataType": "int16"},
+        {"name": "Flow", "device": "d", "address": 5, "dataType": "int16", "byteOrder": "BADC"},
+    ]
+    (block,) = plan_reads(mapping, [{"name": "d"}])["d"]
+    registers = (encode(1.5, "f", "CDAB") + encode(4.25, "f", "DCBA")
+                 + [65535] + encode(258, "H", "BADC"))
+    assert decode_block(block, registers) == {"SO2": 1.5, "NOx": 8.5, "O2": 65535.0, "Flow": 258.0}
+
+
+def test_decode_block_short_read_and_non_finite():
+    mapping = [
+        {"name": "A", "device": "d", "address": 0, "dataType": "float32"},
+        {"name": "B", "device": "d", "address": 2, "dataType": "float32"},
+    ]
+    (block,) = plan_reads(mapping, [{"name": "d"}])["d"]
+    assert decode_block(block, [0, 0, 0]) == {}
+    registers = encode(float("nan"), "f", "ABCD") + encode(2.0, "f", "ABCD")
+    assert decode_block(block, registers) == {"B": 2.0}
@@ -0,0 +1,69 @@
+import pytest
+
+from modbus_planner import MAX_READ_REGISTERS, ReadPlanner, plan_reads, register_address, register_count
+
+DEVICES = [{"name": "gas", "slaveId": 1, "registerType": "holding"}]
+
+
+def entry(name, address, data_type="int16", **extra):
+    return {"name": name, "device": "gas", "address": address, "dataType": data_type, **extra}
+
+
+def test_register_count_from_data_type():
+    assert register_count({"dataType": "int16"}) == 1
+    assert register_count({"dataType": "float32"}) == 2
+    assert register_count({"dataType": "float64"}) == 4
+    assert register_count({"dataType": "float32", "registerCount": 3}) == 3
+
+
+@pytest.mark.parametrize("mapping", [{"dataType": "string"}, {"dataType": "float32", "registerCount": 1}])
+def test_register_count_rejects_bad_mapping(mapping):
+    with pytest.raises(ValueError):
+        register_count(mapping)
+
+
+def test_register_address_subtracts_base():
+    assert register_address({"address": 40001, "addressBase": 40001}) == 0
+    assert register_address({"address": 10}) == 10
+
+
+def test_close_entries_share_one_block():
+    plan = plan_reads([entry("SO2", 0, "float32"), entry("NOx", 2, "float32"), entry("O2", 8)], DEVICES)
+    (block,) = plan["gas"]
+    assert (block.start, block.count) == (0, 9)
+    assert [(e.name, e.offset) for e in block.entries] == [("SO2", 0), ("NOx", 2), ("O2", 8)]
+
+
+def test_gap_and_size_split_blocks():
+    plan = plan_reads([entry("A", 0), entry("B", 10)], DEVICES, max_gap=4)
+    assert [(b.start, b.count) for b in plan["gas"]] == [(0, 1), (10, 1)]
+    plan = plan_reads([entry("A", 0), entry("B", 3, "float32")], DEVICES, max_gap=4, max_registers=4)
+    assert [(b.start, b.count) for b in plan["gas"]] == [(0, 1), (3, 2)]
+
+
+def test_slave_and_register_type_are_separate_blocks():
+    mapping = [entry("A", 0), entry("B", 1, slaveId=2), entry("C", 2, registerType="input")]
+    blocks = plan_reads(mapping, DEVICES)["gas"]
+    assert sorted((b.slave_id, b.register_type) for b in blocks) == [(1, "holding"), (1, "input"), (2, "holding")]
+
+
+def test_unknown_device_and_data_type_skipped():
+    mapping = [entry("A", 0), {"name": "B", "device": "other", "address": 1}, entry("C", 1, "string")]
+    (block,) = plan_reads(mapping, DEVICES)["gas"]
+    assert [e.name for e in block.entries] == ["A"]
+
+
+def test_planner_reuses_plan_until_mapping_changes():
+    planner = ReadPlanner()
+    mapping = [entry("A", 0)]
+    first = planner.get_plan(mapping, DEVICES)
+    assert planner.get_plan(list(mapping), list(DEVICES)) is first
+    assert planner.rebuilds == 1
+    planner.get_plan([entry("A", 1)], DEVICES)
+    assert planner.rebuilds == 2
+
+
+def test_planner_caps_max_registers():
+    planner = ReadPlanner()
+    planner.configure(max_gap=0, max_registers=500)
+    assert (planner.max_gap, planner.max_registers) == (0, MAX_READ_REGISTERS)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from query_cache import MISS, QueryCache
+
+
+def test_put_peek_and_lru_by_bytes():
+    cache = QueryCache(max_bytes=100)
+    cache.put("a", 1, 40)
+    cache.put("b", 2, 40)
+    assert cache.peek("a") == 1  # a ใช้ล่าสุด b ถูกทิ้งก่อน
+    cache.put("c", 3, 40)
+    assert cache.peek("b") is MISS
+    assert cache.peek("a") == 1 and cache.peek("c") == 3
+    assert cache.bytes == 80 and cache.evictions == 1
+
+
+def test_ttl_expires():
+    cache = QueryCache()
+    cache.put("k", "v", 10, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.peek("k") is MISS
+    assert cache.bytes == 0
+
+
+def test_invalidate_from_drops_entries_ending_after_ts():
+    cache = QueryCache()
+    cache.put("old", 1, 10, end=100)
+    cache.put("new", 2, 10, end=200)
+    cache.put("unbounded", 3, 10)
+    assert cache.invalidate_from(150) == 2
+    assert cache.peek("old") == 1
+    assert cache.peek("new") is MISS and cache.peek("unbounded") is MISS
+
+
+def test_closed_before_waits_for_settle_delay():
+    cache = QueryCache(closed_after=10)
+    assert time.time() - cache.closed_before() < 11
+    cache.settle_after(80)
+    cache.settle_after(30)  # ค่าที่น้อยกว่าไม่ลด settle_delay
+    assert 79 < time.time() - cache.closed_before() < 81
+
+
+def test_single_flight_shares_one_load():
+    cache = QueryCache()
+    calls = []
+    release = threading.Event()
+
+    def load():
+        calls.append(1)
+        release.wait(1)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", load, lambda v: 8)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == [42] * 4
+    assert len(calls) == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = QueryCache(enabled=False)
+    cache.put("k", 1, 1)
+    assert cache.peek("k") is MISS
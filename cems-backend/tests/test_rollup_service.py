@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+
+import rollup_service
+from rollup_service import INVALIDATED_MEASUREMENT, RollupScheduler, RollupTier, _ceil, _floor
+
+
+class Record:
+    def __init__(self, time, value=None):
+        self.time = time
+        self.value = value
+
+    def get_time(self):
+        return self.time
+
+    def get_value(self):
+        return self.value
+
+
+class Table:
+    def __init__(self, records):
+        self.records = records
+
+
+class FakeQueryApi:
+    """ตอบ query ตาม measurement ที่อยู่ในข้อความ Flux"""
+
+    def __init__(self):
+        self.answers = {}
+
+    def query(self, flux):
+        for measurement, records in self.answers.items():
+            if f'"{measurement}"' in flux:
+                return [Table(records)]
+        return []
+
+
+class FakeManager:
+    connected = True
+    raw_measurement = "sensor_data"
+
+    def __init__(self):
+        self.config = {"bucket": "raw", "agg_bucket": "agg", "org": "CEMS"}
+        self.query_api = FakeQueryApi()
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def make_follower(minute_last, coverage_start):
+    manager = FakeManager()
+    manager.query_api.answers = {
+        "rollup_1m": [Record(minute_last)],
+        "rollup_1h": [Record(minute_last.replace(minute=0) - timedelta(hours=1))],
+        "rollup_coverage": [Record(utc(2026, 1, 1), coverage_start.timestamp())],
+    }
+    return manager, RollupScheduler(manager, dict)
+
+
+def test_floor_and_ceil():
+    dt = utc(2026, 1, 1, 10, 30, 15)
+    assert _floor(dt, 60) == utc(2026, 1, 1, 10, 30)
+    assert _ceil(dt, 3600) == utc(2026, 1, 1, 11)
+    assert _ceil(utc(2026, 1, 1, 11), 3600) == utc(2026, 1, 1, 11)
+
+
+def test_invalidate_from_rewinds_and_extends_coverage():
+    scheduler = RollupScheduler(FakeManager(), dict)
+    minute, hour = scheduler.tiers
+    minute.coverage, minute.watermark = utc(2026, 1, 1, 10), utc(2026, 1, 1, 12)
+    hour.coverage, hour.watermark = utc(2026, 1, 1, 10), utc(2026, 1, 1, 12)
+    scheduler.manager.connected = False
+    scheduler.invalidate_from(utc(2026, 1, 1, 9, 30, 20))
+    assert minute.watermark == utc(2026, 1, 1, 9, 30)
+    assert minute.coverage == utc(2026, 1, 1, 9, 30)
+    assert hour.watermark == utc(2026, 1, 1, 9)
+    # ชั่วโมง 9:00 ยังไม่ครอบคลุมเต็มชั่วโมงใน 1m จึงเริ่มที่ 10:00
+    assert hour.coverage == utc(2026, 1, 1, 10)
+    assert minute.generation == 1 and hour.generation == 1
+
+
+def test_invalidate_after_watermark_keeps_watermark():
+    scheduler = RollupScheduler(FakeManager(), dict)
+    tier = scheduler.tiers[0]
+    tier.coverage, tier.watermark = utc(2026, 1, 1, 10), utc(2026, 1, 1, 12)
+    scheduler.manager.connected = False
+    scheduler.invalidate_from(utc(2026, 1, 1, 12, 5))
+    assert tier.watermark == utc(2026, 1, 1, 12)
+    assert tier.generation == 0
+
+
+def test_invalidate_during_inflight_window_rewinds():
+    scheduler = RollupScheduler(FakeManager(), dict)
+    tier = scheduler.tiers[0]
+    tier.coverage, tier.watermark = utc(2026, 1, 1, 10), utc(2026, 1, 1, 12)
+    tier.inflight_end = utc(2026, 1, 1, 13)
+    scheduler.manager.connected = False
+    scheduler.invalidate_from(utc(2026, 1, 1, 12, 30))
+    assert tier.generation == 1
+
+
+def test_follower_clears_query_cache_on_rewind(monkeypatch):
+    cleared = []
+    monkeypatch.setattr(rollup_service.query_cache, "invalidate_from", cleared.append)
+    manager, follower = make_follower(utc(2026, 1, 1, 12, 0), utc(2026, 1, 1))
+    follower._load_watermarks()
+    assert follower.tiers[0].watermark == utc(2026, 1, 1, 12, 1)
+    assert cleared == []
+
+    manager.query_api.answers["rollup_1m"] = [Record(utc(2026, 1, 1, 11, 0))]
+    follower._load_watermarks()
+    assert cleared == [utc(2026, 1, 1, 11, 1).timestamp()]
+
+
+def test_follower_clears_query_cache_from_owner_marker(monkeypatch):
+    cleared = []
+    monkeypatch.setattr(rollup_service.query_cache, "invalidate_from", cleared.append)
+    manager, follower = make_follower(utc(2026, 1, 1, 12, 0), utc(2026, 1, 1))
+    follower._load_watermarks()
+    replayed = utc(2026, 1, 1, 12, 30)
+    manager.query_api.answers = {
+        INVALIDATED_MEASUREMENT: [Record(datetime.now(timezone.utc), replayed.timestamp())],
+        **manager.query_api.answers,
+    }
+    follower._load_watermarks()
+    assert cleared == [replayed.timestamp()]
+    # marker เดิมไม่ถูกนำมาใช้ซ้ำเมื่อ query ตอบกลับว่างในรอบถัดไป
+    manager.query_api.answers[INVALIDATED_MEASUREMENT] = []
+    follower._load_watermarks()
+    assert cleared == [replayed.timestamp()]
+
+
+def test_tier_stats():
+    tier = RollupTier("1m", 60)
+    assert tier.stats()["watermark"] is None
@@ -0,0 +1,72 @@
+import asyncio
+import uuid
+
+import pytest
+
+import acquisition
+from acquisition import AcquisitionMirror, RingPublisher
+from shared_ring import RingOverflow, SampleRing
+
+
+@pytest.fixture
+def ring():
+    ring = SampleRing.create(f"cems_test_{uuid.uuid4().hex[:8]}", capacity=4, slot_size=256)
+    yield ring
+    ring.close()
+
+
+def test_write_and_read_in_order(ring):
+    for i in range(3):
+        ring.write({"i": i})
+    messages, cursor = ring.read_from(0)
+    assert [m["i"] for m in messages] == [0, 1, 2]
+    assert cursor == 3
+    assert ring.read_from(cursor) == ([], 3)
+
+
+def test_slow_reader_skips_overwritten_messages(ring):
+    for i in range(10):
+        ring.write({"i": i})
+    messages, cursor = ring.read_from(0)
+    assert [m["i"] for m in messages] == [6, 7, 8, 9]
+    assert cursor == 10 and ring.overruns == 6
+
+
+def test_read_limit(ring):
+    for i in range(3):
+        ring.write({"i": i})
+    messages, cursor = ring.read_from(0, limit=2)
+    assert [m["i"] for m in messages] == [0, 1] and cursor == 2
+
+
+def test_oversized_message_rejected(ring):
+    with pytest.raises(RingOverflow):
+        ring.write({"data": "x" * 1000})
+    assert ring.oversized == 1 and ring.head == 0
+
+
+def test_publisher_sends_derived_values_and_state(monkeypatch):
+    ring = SampleRing.create(f"cems_test_{uuid.uuid4().hex[:8]}", capacity=16, slot_size=16384)
+    try:
+        async def ingest(values, ts=None, device=None):
+            acquisition.compliance_engine.latest["SO2Corr"] = 12.5
+            return [{"type": "threshold", "message": "SO2 high"}]
+
+        monkeypatch.setattr(acquisition, "ingest", ingest)
+        publisher = RingPublisher(ring)
+        asyncio.run(publisher("stack", {"SO2": 10.0}))
+        messages, _ = ring.read_from(0)
+        assert [m["kind"] for m in messages] == ["sample", "alert", "state"]
+
+        mirror = AcquisitionMirror()
+        for message in messages:
+            mirror.apply(message)
+        assert mirror.derived["SO2Corr"] == 12.5
+        assert mirror.compliance["channels"] is not None
+        assert "evaluations" in mirror.alarm_stats
+    finally:
+        ring.close()
+
+
+def test_mirror_before_state_has_empty_snapshot():
+    assert AcquisitionMirror().compliance_snapshot()["channels"] == {}
@@ -0,0 +1,53 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from ws_frames import (DELTA, HEADER, KEYFRAME, changed_indices, decode_binary, encode_binary,
+                       encode_json, flatten_numeric, to_float32)
+
+
+def test_flatten_numeric_nests_and_skips():
+    payload = {"time": "x", "SO2": 1, "ok": True, "stack": {"Velocity": 2.5, "label": "a"}, "NOx": None}
+    assert flatten_numeric(payload, skip=("time",)) == {"SO2": 1, "stack.Velocity": 2.5, "NOx": None}
+
+
+def test_changed_indices_treats_nan_as_unchanged():
+    last = to_float32([1.0, None, 3.0, None])
+    values = to_float32([1.0, None, 4.0, 5.0])
+    assert changed_indices(values, last).tolist() == [2, 3]
+
+
+def test_keyframe_roundtrip():
+    values = to_float32([1.5, None, -2.0])
+    frame = encode_binary(KEYFRAME, 7, 3, 42, 1700000000.25, values)
+    assert len(frame) == HEADER.size + 3 * 4
+    header, decoded = decode_binary(frame)
+    assert header == {"kind": KEYFRAME, "topic": 7, "schema": 3, "seq": 42, "time": 1700000000.25}
+    assert decoded[0] == 1.5 and math.isnan(decoded[1]) and decoded[2] == -2.0
+
+
+@pytest.mark.parametrize("indices", [[1], [0, 2], [0, 1, 3]])
+def test_delta_roundtrip_with_padding(indices):
+    values = to_float32([10.0, 20.0, 30.0, 40.0])
+    frame = encode_binary(DELTA, 1, 1, 2**32 + 5, 0.0, values, np.array(indices))
+    # index u16 ถูกเติมให้ float32 เริ่มที่ตำแหน่งหาร 4 ลงตัว
+    assert (len(frame) - HEADER.size) % 4 == 0
+    header, decoded = decode_binary(frame)
+    assert header["kind"] == DELTA and header["seq"] == 5
+    assert decoded == {i: values[i].item() for i in indices}
+
+
+def test_decode_rejects_unknown_version():
+    frame = bytearray(encode_binary(KEYFRAME, 1, 1, 1, 0.0, to_float32([1.0])))
+    frame[0] = 99
+    with pytest.raises(ValueError):
+        decode_binary(bytes(frame))
+
+
+def test_encode_json_delta():
+    values = to_float32([1.0, None, 2.5])
+    message = json.loads(encode_json(DELTA, "gas", 3, 1.0, ["SO2", "NOx", "O2"], values, [1, 2]))
+    assert message == {"topic": "gas", "kind": "delta", "seq": 3, "time": 1.0,
+                       "values": {"NOx": None, "O2": 2.5}}
@@ -0,0 +1,93 @@
+"""
+รูปแบบข้อมูลแบบ binary ของ WebSocket (opt-in ด้วย ?format=binary หรือ {"op": "format", "format": "binary"})
+
+ทุก frame ขึ้นต้นด้วย header 20 bytes (little-endian):
+
+    u8  version    FRAME_VERSION
+    u8  kind       0 = keyframe, 1 = delta
+    u16 topic      topic_id จากข้อความ schema
+    u16 schema     เลข schema ของหัวข้อ (เปลี่ยนเมื่อมีพารามิเตอร์ใหม่)
+    u16 count      จำนวนค่าใน frame
+    u32 seq        ลำดับ frame ของหัวข้อนี้ใน connection นี้
+    f64 time       เวลา publish (epoch วินาที)
+
+keyframe: ต่อด้วย float32 x count ตามลำดับ "parameters" ในข้อความ schema ล่าสุด
+delta:    ต่อด้วย u16 x count (index ใน "parameters") เติม 2 bytes ถ้า count เป็นเลขคี่
+          แล้วตามด้วย float32 x count ส่งเฉพาะค่าที่เปลี่ยน ค่าที่ไม่มีข้อมูลเป็น NaN
+
+ข้อความ schema/error/control ยังเป็น JSON text frame เสมอ
+"""
+import json
+import struct
+
+import numpy as np
+
+FRAME_VERSION = 1
+KEYFRAME = 0
+DELTA = 1
+HEADER = struct.Struct("<BBHHHId")
+FORMATS = ("json", "binary")
+
+
+def flatten_numeric(payload, skip=(), prefix=""):
+    """{ชื่อ: ตัวเลข} จาก payload แบบ dict ซ้อนกัน (ชื่อต่อกันด้วย '.') ข้ามค่าที่ไม่ใช่ตัวเลข"""
+    values = {}
+    for key, value in payload.items():
+        if key in skip:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten_numeric(value, prefix=f"{name}."))
+        elif value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+            values[name] = value
+    return values
+
+
+def to_float32(values):
+    """list ของตัวเลข/None เป็น float32 (None = NaN)"""
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+
+
+def changed_indices(values, last):
+    """index ของค่าที่ต่างจากที่ส่งไปแล้ว (NaN เทียบกับ NaN ถือว่าไม่เปลี่ยน)"""
+    same = (values == last) | (np.isnan(values) & np.isnan(last))
+    return np.flatnonzero(~same)
+
+
+def encode_binary(kind, topic_id, schema, seq, stamp, values, indices=None):
+    count = len(values) if indices is None else len(indices)
+    header = HEADER.pack(FRAME_VERSION, kind, topic_id, schema & 0xFFFF, count, seq & 0xFFFFFFFF, stamp)
+    if indices is None:
+        return header + values.astype("<f4").tobytes()
+    index_bytes = indices.astype("<u2").tobytes()
+    if count % 2:
+        index_bytes += b"\0\0"
+    return header + index_bytes + values[indices].astype("<f4").tobytes()
+
+
+def encode_json(kind, topic, seq, stamp, names, values, indices=None):
+    if indices is None:
+        indices = range(len(names))
+    return json.dumps({
+        "topic": topic,
+        "kind": "key" if kind == KEYFRAME else "delta",
+        "seq": seq,
+        "time": stamp,
+        "values": {names[i]: (None if np.isnan(values[i]) else float(values[i])) for i in indices},
+    })
+
+
+def decode_binary(frame):
+    """(header dict, {index: ค่า}) ใช้ตรวจสอบ/ทดสอบฝั่ง Python"""
+    version, kind, topic_id, schema, count, seq, stamp = HEADER.unpack_from(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    offset = HEADER.size
+    if kind == KEYFRAME:
+        indices = np.arange(count)
+    else:
+        indices = np.frombuffer(frame, dtype="<u2", count=count, offset=offset)
+        offset += count * 2 + (count % 2) * 2
+    values = np.frombuffer(frame, dtype="<f4", count=count, offset=offset)
+    header = {"kind": kind, "topic": topic_id, "schema": schema, "seq": seq, "time": stamp}
+    return header, dict(zip(indices.tolist(), values.tolist()))
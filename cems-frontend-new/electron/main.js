@@ -235,10 +235,8 @@ function startBackend() {
     backendProcess = null;
   });
 
-  // Wait a bit for backend to start
-  setTimeout(() => {
-    checkBackendStatus();
-  }, 2000);
+  // Report status as soon as the backend says it is ready
+  waitForReady(() => checkBackendStatus(), () => checkBackendStatus());
 }
 
 function stopBackend() {
@@ -266,34 +264,45 @@ function restartBackend() {
   }, 1000);
 }
 
-async function waitForBackend() {
-  console.log('Waiting for backend to start...');
-  let attempts = 0;
-  const maxAttempts = 30; // 30 seconds
-  
-  const checkBackend = async () => {
+// Poll /ready (200 once config and pollers are up) instead of sleeping for a fixed time
+function waitForReady(onReady, onTimeout, timeoutMs = 30000, intervalMs = 100) {
+  const started = Date.now();
+
+  const check = async () => {
     try {
-      const response = await fetch(`${BACKEND_URL}/health`);
+      const response = await fetch(`${BACKEND_URL}/ready`);
       if (response.ok) {
-        console.log('Backend is ready! Loading page...');
-        mainWindow.loadURL('http://localhost:8000');
-        mainWindow.webContents.send('backend-status', { running: true });
+        const report = await response.json();
+        console.log(`Backend ready after ${Date.now() - started} ms`, report.phases);
+        onReady(report);
         return;
       }
     } catch (error) {
-      console.log(`Backend not ready yet (attempt ${attempts + 1}/${maxAttempts}):`, error.message);
+      // backend not listening yet
     }
-    
-    attempts++;
-    if (attempts < maxAttempts) {
-      setTimeout(checkBackend, 1000);
+
+    if (Date.now() - started < timeoutMs) {
+      setTimeout(check, intervalMs);
     } else {
+      onTimeout();
+    }
+  };
+
+  check();
+}
+
+async function waitForBackend() {
+  console.log('Waiting for backend to start...');
+  waitForReady(
+    () => {
+      mainWindow.loadURL('http://localhost:8000');
+      mainWindow.webContents.send('backend-status', { running: true });
+    },
+    () => {
       console.error('Backend failed to start after 30 seconds');
       dialog.showErrorBox('Backend Error', 'Backend failed to start. Please restart the application.');
     }
-  };
-  
-  checkBackend();
+  );
 }
 
 async function checkBackendStatus() {
@@ -316,10 +325,8 @@ async function checkBackendStatus() {
 app.whenReady().then(() => {
   createWindow();
 
-  // Start backend automatically
-  setTimeout(() => {
-    startBackend();
-  }, 1000);
+  // Start backend automatically (readiness is polled, no startup delay needed)
+  startBackend();
 
   app.on('activate', () => {
     if (BrowserWindow.getAllWindows().length === 0) {
@@ -3,12 +3,19 @@ class WebSocketManager {
   constructor() {
     this.connections = new Map();
     this.reconnectTimers = new Map();
+    this.options = new Map();
+    this.decoders = new Map();
     this.backendUrl = import.meta.env.VITE_BACKEND_URL || "http://127.0.0.1:8000";
   }
 
   // เชื่อมต่อ WebSocket
-  connect(endpoint, onMessage, onError, onClose) {
-    const wsUrl = `${this.backendUrl.replace(/^http/, "ws")}${endpoint}`;
+  // options.format = "binary" และ/หรือ options.parameters = [...] จะได้ข้อความ
+  // { topic, values: {ชื่อ: ค่า}, time, keyframe } เฉพาะพารามิเตอร์ที่เลือก (ส่งเฉพาะค่าที่เปลี่ยน)
+  connect(endpoint, onMessage, onError, onClose, options = {}) {
+    const query = new URLSearchParams();
+    if (options.format) query.set("format", options.format);
+    if (options.parameters?.length) query.set("parameters", options.parameters.join(","));
+    const wsUrl = `${this.backendUrl.replace(/^http/, "ws")}${endpoint}${query.toString() ? `?${query}` : ""}`;
     
     // ปิด connection เดิมถ้ามี
     if (this.connections.has(endpoint)) {
@@ -20,6 +27,10 @@ class WebSocketManager {
     }
 
     const ws = new WebSocket(wsUrl);
+    ws.binaryType = "arraybuffer";
+    this.options.set(endpoint, { ...options, parameters: options.parameters ? [...options.parameters] : undefined });
+    const decoder = new FrameDecoder();
+    this.decoders.set(endpoint, decoder);
     
     // เพิ่ม connection timeout
     const connectionTimeout = setTimeout(() => {
@@ -43,8 +54,8 @@ class WebSocketManager {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
-        onMessage && onMessage(data);
+        const data = decoder.decode(event.data);
+        data && onMessage && onMessage(data);
       } catch (error) {
         console.error(`WebSocket message parse error: ${error}`);
       }
@@ -63,7 +74,7 @@ class WebSocketManager {
       if (!this.manualDisconnect) {
         const reconnectTimer = setTimeout(() => {
           console.debug(`🔄 Reconnecting to ${endpoint}...`);
-          this.connect(endpoint, onMessage, onError, onClose);
+          this.connect(endpoint, onMessage, onError, onClose, this.options.get(endpoint) || options);
         }, 10000); // เพิ่ม delay เป็น 10 วินาที
         
         this.reconnectTimers.set(endpoint, reconnectTimer);
@@ -87,6 +98,8 @@ class WebSocketManager {
       clearTimeout(this.reconnectTimers.get(endpoint));
       this.reconnectTimers.delete(endpoint);
     }
+    this.options.delete(endpoint);
+    this.decoders.delete(endpoint);
     
     // รีเซ็ต flag หลังจากปิด
     setTimeout(() => {
@@ -122,6 +135,80 @@ class WebSocketManager {
     }
     return false;
   }
+
+  // เปลี่ยนพารามิเตอร์ที่รับ (ส่งเฉพาะส่วนที่เพิ่ม/ลดไปให้ server)
+  setParameters(endpoint, parameters, topic) {
+    const options = this.options.get(endpoint);
+    if (!options) return false;
+    const current = options.parameters || [];
+    const added = parameters.filter((p) => !current.includes(p));
+    const removed = current.filter((p) => !parameters.includes(p));
+    options.parameters = [...parameters];
+    if (added.length) this.send(endpoint, { op: "subscribe", topic, parameters: added });
+    if (removed.length) this.send(endpoint, { op: "unsubscribe", topic, parameters: removed });
+    this.decoders.get(endpoint)?.forget(removed);
+    return true;
+  }
+}
+
+// ถอดข้อความจาก server: JSON เดิมส่งต่อตามเดิม ส่วน schema/keyframe/delta
+// (binary หรือ JSON) รวมเป็นค่าล่าสุดของแต่ละหัวข้อ รูปแบบ frame ดู cems-backend/ws_frames.py
+const FRAME_VERSION = 1;
+const HEADER_BYTES = 20;
+
+class FrameDecoder {
+  constructor() {
+    this.schemas = new Map(); // topic_id -> { topic, schema, parameters }
+    this.values = new Map(); // topic -> { ชื่อ: ค่า }
+  }
+
+  decode(raw) {
+    if (raw instanceof ArrayBuffer) return this.decodeBinary(raw);
+    const msg = JSON.parse(raw);
+    if (msg?.type === "schema") {
+      this.schemas.set(msg.topic_id, msg);
+      this.values.set(msg.topic, {});
+      return null;
+    }
+    if (msg?.kind === "key" || msg?.kind === "delta") {
+      return this.apply(msg.topic, msg.kind === "key", msg.values, msg.time);
+    }
+    return msg;
+  }
+
+  decodeBinary(buffer) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== FRAME_VERSION) return null;
+    const keyframe = view.getUint8(1) === 0;
+    const schema = this.schemas.get(view.getUint16(2, true));
+    const count = view.getUint16(6, true);
+    const time = view.getFloat64(12, true);
+    if (!schema || schema.schema !== view.getUint16(4, true)) return null;
+    let offset = HEADER_BYTES;
+    let indices = null;
+    if (!keyframe) {
+      indices = new Uint16Array(buffer.slice(offset, offset + count * 2));
+      offset += count * 2 + (count % 2) * 2;
+    }
+    const values = new Float32Array(buffer, offset, count);
+    const changed = {};
+    for (let i = 0; i < count; i++) {
+      const name = schema.parameters[keyframe ? i : indices[i]];
+      // float32 มีความละเอียดราว 7 หลัก ตัดเศษที่เกิดจากการแปลงออก
+      changed[name] = Number.isNaN(values[i]) ? null : parseFloat(values[i].toPrecision(7));
+    }
+    return this.apply(schema.topic, keyframe, changed, time);
+  }
+
+  apply(topic, keyframe, changed, time) {
+    const values = keyframe ? { ...changed } : { ...(this.values.get(topic) || {}), ...changed };
+    this.values.set(topic, values);
+    return { topic, values, time, keyframe };
+  }
+
+  forget(names) {
+    this.values.forEach((values) => names.forEach((name) => delete values[name]));
+  }
 }
 
 // สร้าง instance เดียว
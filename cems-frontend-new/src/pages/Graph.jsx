@@ -319,6 +319,7 @@ export default function Graph() {
   const [vals, setVals] = useState({ SO2: 0, NOx: 0, O2: 0, CO: 0, Dust: 0, Temperature: 0, Velocity: 0, Flowrate: 0, Pressure: 0 });
   const { visibleParams, syncWithConfig, setSyncWithConfig } = useConnection();
   const [selectedKeys, setSelectedKeys] = useLocalStorage("graph.selectedKeys", DEFAULT_KEYS);
+  const selectedKeysRef = useRef(selectedKeys);
   const [paused, setPaused] = useLocalStorage("graph.paused", false);
   const [resetToken, setResetToken] = useState(0);
   const [mode, setMode] = useLocalStorage("graph.mode", "live"); // 'live' | 'history' | 'summary'
@@ -373,18 +374,9 @@ export default function Graph() {
     wsManager.connect(
       "/ws/gas",
       (data) => {
-        const gas = Array.isArray(data?.gas) ? data.gas : [];
-        const nextVals = {
-          SO2: gas[0] ?? 0,
-          NOx: gas[1] ?? 0,
-          O2: gas[2] ?? 0,
-          CO: gas[3] ?? 0,
-          Dust: gas[4] ?? 0,
-          Temperature: gas[5] ?? 0,
-          Velocity: gas[6] ?? 0,
-          Flowrate: gas[7] ?? 0,
-          Pressure: gas[8] ?? 0,
-        };
+        // binary frame: ได้เฉพาะพารามิเตอร์ที่เลือก (data.values) ไม่ใช่ data.gas ทั้งชุด
+        if (!data?.values) return;
+        const nextVals = Object.fromEntries(SERIES.map((s) => [s.key, data.values[s.key] ?? 0]));
         setVals(nextVals);
         setConnected(true);
         // ระหว่างเปิด modal ให้หยุดอัปเดตเฉพาะซีรีส์ที่กำลังขยายอยู่ ส่วนอื่นยังอัปเดตต่อเนื่อง
@@ -404,11 +396,18 @@ export default function Graph() {
         });
       },
       () => setConnected(false),
-      () => setConnected(false)
+      () => setConnected(false),
+      { format: "binary", parameters: selectedKeysRef.current.length ? selectedKeysRef.current : SERIES.map((s) => s.key) }
     );
     return () => wsManager.disconnect("/ws/gas");
   }, []);
 
+  // รับเฉพาะพารามิเตอร์ที่แสดงอยู่
+  useEffect(() => {
+    selectedKeysRef.current = selectedKeys;
+    wsManager.setParameters("/ws/gas", selectedKeys.length ? selectedKeys : SERIES.map((s) => s.key));
+  }, [selectedKeys]);
+
   // const selectOptions = useMemo(() => SERIES.map((s) => ({ label: s.label, value: s.key })), []);
 
   // History fetch (with abort)
@@ -425,85 +424,70 @@ export default function Graph() {
     abortRef.current = controller;
 
     const maxPoints = HISTORY_MAX_POINTS;
+    const qs = new URLSearchParams({
+      parameters: keysToLoad.join(","),
+      hours: String(hours),
+      max_points: String(maxPoints),
+    });
 
-    Promise.all(
-      keysToLoad.map(async (k) => {
-        try {
-          const url = `${baseUrl}/logs/influxdb?parameter=${encodeURIComponent(k)}&hours=${hours}&max_points=${maxPoints}`;
-          const res = await fetch(url, { signal: controller.signal });
-          if (!res.ok) throw new Error(`${res.status}`);
-          const data = await res.json();
-          const series = Array.isArray(data)
-            ? data
-                .map((row) => {
-                  const ts = new Date(row.Timestamp).getTime();
-                  const val = Number(row[k] ?? row[`${k}_corrected`] ?? 0) || 0;
-                  return { t: ts, v: val };
-                })
-                .filter((p) => isFinite(p.v))
-                .reverse()
-            : [];
-          return [k, series];
-        } catch (err) {
-          if (controller.signal.aborted) return [k, []];
-          console.warn("history fetch error", k, err);
-          return [k, []];
-        }
+    // backend คืนค่าแบบแบ่ง bucket แล้ว (mean/min/max/count/alarms) ใน request เดียว
+    // alarms นับตาม alarm_threshold ใน config เพื่อให้ใช้ rollup ที่คำนวณไว้แล้วได้
+    fetch(`${baseUrl}/logs/influxdb/buckets?${qs}`, { signal: controller.signal })
+      .then(async (res) => {
+        if (!res.ok) throw new Error(`${res.status}`);
+        return res.json();
+      })
+      .catch((err) => {
+        if (!controller.signal.aborted) console.warn("history fetch error", err);
+        return { series: {} };
       })
-    )
-      .then((entries) => {
+      .then((data) => {
+        const bucketed = data?.series || {};
         const map = {};
-        for (const [k, s] of entries) map[k] = s;
+        keysToLoad.forEach((k) => {
+          const cols = bucketed[k];
+          map[k] = cols ? cols.t.map((t, i) => ({ t, v: Number(cols.mean[i]) || 0 })) : [];
+        });
         startTransition(() => setHistory(map));
         const total = Object.values(map).reduce((acc, arr) => acc + (Array.isArray(arr) ? arr.length : 0), 0);
         if (total === 0) {
+          if (controller.signal.aborted) return;
           setStatusMsg("ไม่มีข้อมูลย้อนหลัง / InfluxDB ไม่พร้อม - กลับสู่โหมดสด");
           setMode("live");
           setPaused(false);
         }
-        // compute summary immediately if required
+        // รวม bucket จาก backend ให้เหลือ SUMMARY_BUCKETS สำหรับ summary
         if (total > 0) {
           try {
-            const metaByKey = {};
-            SERIES.forEach((m) => (metaByKey[m.key] = m));
             const result = {};
-            const buckets = SUMMARY_BUCKETS;
-            Object.keys(map).forEach((k) => {
-              const arr = map[k] || [];
-              if (!arr.length) return;
-              const startT = arr[0].t;
-              const endT = arr[arr.length - 1].t;
-              const step = Math.max(1, Math.floor((endT - startT) / buckets));
-              const bins = new Array(buckets).fill(0).map((_, i) => ({
-                t: startT + i * step,
-                min: Infinity,
-                max: -Infinity,
-                sum: 0,
-                n: 0,
-                alarm: 0,
-              }));
-              const limit = metaByKey[k]?.limit;
-              arr.forEach(({ t, v }) => {
-                const idx = Math.min(buckets - 1, Math.max(0, Math.floor((t - startT) / step)));
-                const b = bins[idx];
-                if (!Number.isFinite(v)) return;
-                b.min = Math.min(b.min, v);
-                b.max = Math.max(b.max, v);
-                b.sum += v;
-                b.n += 1;
-                if (typeof limit === "number" && v > limit) b.alarm += 1;
-              });
+            Object.keys(bucketed).forEach((k) => {
+              const cols = bucketed[k];
+              const n = cols.t.length;
+              if (!n) return;
+              const group = Math.max(1, Math.ceil(n / SUMMARY_BUCKETS));
               const range = [];
               const avg = [];
               const alarms = [];
-              bins.forEach((b) => {
-                if (b.n === 0) return; // skip empty
-                const x = b.t;
-                const a = b.sum / b.n;
-                range.push({ x, y: [b.min === Infinity ? 0 : b.min, b.max === -Infinity ? 0 : b.max] });
-                avg.push([x, a]);
-                alarms.push([x, b.alarm]);
-              });
+              for (let i = 0; i < n; i += group) {
+                let min = Infinity;
+                let max = -Infinity;
+                let sum = 0;
+                let count = 0;
+                let alarm = 0;
+                for (let j = i; j < Math.min(n, i + group); j++) {
+                  const c = cols.count[j] || 0;
+                  min = Math.min(min, cols.min[j]);
+                  max = Math.max(max, cols.max[j]);
+                  sum += (cols.mean[j] || 0) * c;
+                  count += c;
+                  alarm += cols.alarms[j] || 0;
+                }
+                if (count === 0) continue;
+                const x = cols.t[i];
+                range.push({ x, y: [min, max] });
+                avg.push([x, sum / count]);
+                alarms.push([x, alarm]);
+              }
               result[k] = { range, avg, alarms };
             });
             setSummary(result);
@@ -142,6 +142,11 @@ export default function Home() {
     
     wsManager.connect('/ws/gas', 
       (msg) => {
+        // backend แจ้งว่า config เปลี่ยน ให้โหลด gas config ใหม่ (แทนการ poll ทุก 10 วินาที)
+        if (msg && msg.config_version !== undefined) {
+          loadGasConfig();
+          return;
+        }
         if (!msg || !msg.gas || !Array.isArray(msg.gas)) return;
 
         const safe = (val) => (val === null || val === undefined || isNaN(val) ? null : Number(val));
@@ -230,12 +235,6 @@ export default function Home() {
     };
   }, []);
 
-  // โหลด gas config ใหม่ทุก 10 วินาที
-  useEffect(() => {
-    const gasConfigInterval = setInterval(loadGasConfig, 10000);
-    return () => clearInterval(gasConfigInterval);
-  }, []);
-
   const renderCard = (item, isCorrected = false) => {
     const id = item.label.replace("₂", "2").replace(/[^a-zA-Z0-9]/g, "") + (isCorrected ? "Corr" : "");
     let rawValue = data[id];